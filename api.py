@@ -1,11 +1,43 @@
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Dict, List, Optional
 import json
 import os
+import queue
+import re
+import threading
+import time
+import uuid
 
+from core.checkpoints import get_run, run_progress
+from core.chunk_store import query_chunks
+from core.concurrency import snapshot as concurrency_snapshot
+from core.search_index import search
 from core.drift_analyzer import run_drift_analyzer
-from config import OUTPUT_DIR, OUTPUT_FILE
+from core.git_handler import is_local_repo
+from core.sinks import SINKS
+from core.work_queue import SQLiteQueue
+from core.webhook_guard import (
+    is_commit_analyzed,
+    is_pending,
+    is_tracked_ref,
+    last_analyzed_commit,
+    record_delivery,
+    record_run,
+    schedule_analysis,
+)
+from config import (
+    ALLOW_LOCAL_REPOS,
+    OUTPUT_DIR,
+    OUTPUT_FILE,
+    REPO_CONCURRENCY,
+    SEARCH_MAX_LIMIT,
+    STREAM_HEARTBEAT_SECONDS,
+    WEBHOOK_DEBOUNCE_SECONDS,
+    WORK_QUEUE_TOKEN,
+)
 
 app = FastAPI(
     title="IaC Drift Analyzer API",
@@ -16,6 +48,25 @@ app = FastAPI(
 
 class AnalyzeRequest(BaseModel):
     repos: List[str]
+    # True = bỏ qua result cache, luôn clone + phân tích lại
+    force: bool = False
+    # s3 | local | memory | null (mặc định config.OUTPUT_SINK)
+    sink: Optional[str] = None
+    # {"dev": "envs/dev.tfvars", "prod": "envs/prod.tfvars"} (tương đối repo):
+    # parse 1 lần, chunk gắn "environment" cho từng bộ biến
+    environments: Optional[Dict[str, str]] = None
+    # worktree | blobs (mặc định config.GIT_FETCH_MODE)
+    fetch_mode: Optional[str] = None
+    # Chỉ phân tích lại các file này (tương đối repo) + module liên quan;
+    # chỉ dùng với đúng 1 repo
+    changed_files: Optional[List[str]] = None
+    # Chạy tiếp 1 run bị gián đoạn (repo đã xong được bỏ qua); repos rỗng =
+    # dùng lại danh sách repo của run đó
+    run_id: Optional[str] = None
+
+
+RUN_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+FETCH_MODES = ["worktree", "blobs"]
 
 
 @app.get("/")
@@ -23,59 +74,523 @@ def root():
     return {"message": "IaC Drift Analyzer API is running 🚀"}
 
 
-@app.post("/analyze")
-def analyze_iac(request: AnalyzeRequest):
+def write_output_file(results):
+    """Ghi file tổng hợp (tuỳ chọn)"""
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+
+
+def build_analyze_response(repos, results, summary=None):
+    owners = sorted(set(r["owner"] for r in results if r.get("owner")))
+    return {
+        "status": "success",
+        "message": f"Processed {len(results)} IaC chunks",
+        "repos_analyzed": repos,
+        "owners_detected": owners,
+        "output_dir": OUTPUT_DIR,
+        "cached_repos": (summary or {}).get("cached", []),
+        "run_id": (summary or {}).get("run_id"),
+        "resumed_repos": (summary or {}).get("resumed", 0),
+    }
+
+
+def format_stream_event(event, fmt):
+    data = json.dumps(event, ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+def stream_analysis(
+    repos,
+    fmt,
+    use_cache=None,
+    sink=None,
+    environments=None,
+    run_id=None,
+    fetch_mode=None,
+    changed_files=None,
+):
+    """
+    Chạy run_drift_analyzer trong thread riêng, stream progress event ra client.
+    Khi không có event nào trong STREAM_HEARTBEAT_SECONDS thì gửi heartbeat
+    để kết nối không bị ALB cắt vì idle timeout.
+    """
+    events = queue.Queue()
+    finished = object()
+
+    def worker():
+        summary = {}
+
+        def on_event(event):
+            if event["event"] == "summary":
+                summary.update(event)
+            events.put(event)
+
+        try:
+            results = run_drift_analyzer(
+                repos,
+                fetch_mode=fetch_mode,
+                on_event=on_event,
+                changed_files=changed_files,
+                use_cache=use_cache,
+                sink=sink,
+                environments=environments,
+                run_id=run_id,
+            )
+            write_output_file(results)
+            events.put(
+                {"event": "result", **build_analyze_response(repos, results, summary)}
+            )
+        except Exception as e:
+            events.put(
+                {"event": "error", "detail": f"Server error: {e}", "run_id": run_id}
+            )
+        finally:
+            events.put(finished)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    while True:
+        try:
+            event = events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+        except queue.Empty:
+            event = {"event": "heartbeat"}
+        if event is finished:
+            break
+        yield format_stream_event(event, fmt)
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def validate_analyze_request(request, allow_resume=False):
+    if request.run_id is not None and not RUN_ID_RE.match(request.run_id):
+        raise HTTPException(
+            status_code=400,
+            detail="run_id chỉ gồm chữ, số, '.', '_', '-' (tối đa 64 ký tự)",
+        )
+    if not request.repos and allow_resume and request.run_id:
+        run = get_run(request.run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="Không tìm thấy run")
+        request.repos = run["repos"]
     if not request.repos:
         raise HTTPException(status_code=400, detail="Danh sách repo không được rỗng")
+    if request.sink is not None and request.sink not in SINKS:
+        raise HTTPException(
+            status_code=400, detail=f"sink phải là 1 trong {sorted(SINKS)}"
+        )
+    if not ALLOW_LOCAL_REPOS and any(is_local_repo(r) for r in request.repos):
+        raise HTTPException(
+            status_code=403,
+            detail="Repo local/file:// bị tắt (bật ALLOW_LOCAL_REPOS=true)",
+        )
+    if request.fetch_mode is not None and request.fetch_mode not in FETCH_MODES:
+        raise HTTPException(
+            status_code=400, detail=f"fetch_mode phải là 1 trong {FETCH_MODES}"
+        )
+    if request.changed_files is not None and len(request.repos) != 1:
+        raise HTTPException(
+            status_code=400, detail="changed_files chỉ dùng với đúng 1 repo"
+        )
+    for field, paths in (
+        ("environments", (request.environments or {}).values()),
+        ("changed_files", request.changed_files or []),
+    ):
+        for path in paths:
+            # Chỉ đọc file trong repo, không đọc file khác trên server
+            if os.path.isabs(path) or ".." in path.replace("\\", "/").split("/"):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{field}: '{path}' phải là đường dẫn tương đối trong repo",
+                )
 
-    print(f"🚀 Start analyzing {len(request.repos)} repo(s)...")
 
-    try:
-        results = run_drift_analyzer(request.repos)
+@app.post("/analyze")
+def analyze_iac(
+    request: AnalyzeRequest, response: Response, stream: Optional[str] = None
+):
+    """
+    stream=ndjson|sse: trả progress từng stage (clone/parse/write/upload/sync)
+    trong lúc chạy, event đầu là "run" (run_id), event cuối là "result"
+    (hoặc "error").
+    Repo có HEAD trùng lần phân tích thành công trước được trả từ result cache
+    (xem "cached_repos"); force=true để luôn phân tích lại.
+    run_id: gửi lại run_id của lần chạy bị gián đoạn để tiếp tục từ checkpoint
+    (xem GET /runs/{run_id}). run_id của mỗi lần chạy có trong header
+    X-Run-Id, kể cả khi lỗi (detail.run_id).
+    """
+    if stream is not None and stream not in STREAM_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400, detail="stream phải là 'ndjson' hoặc 'sse'"
+        )
+    validate_analyze_request(request, allow_resume=True)
 
-        # Ghi file tổng hợp (tuỳ chọn)
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
+    run_id = request.run_id or str(uuid.uuid4())
+    print(f"🚀 Start analyzing {len(request.repos)} repo(s), run {run_id}...")
+    use_cache = False if request.force else None
+    changed_files = (
+        None
+        if request.changed_files is None
+        else {request.repos[0]: request.changed_files}
+    )
 
-        print(f"✅ Done. {len(results)} IaC chunks processed.")
+    if stream:
+        return StreamingResponse(
+            stream_analysis(
+                request.repos,
+                stream,
+                use_cache,
+                request.sink,
+                request.environments,
+                run_id,
+                request.fetch_mode,
+                changed_files,
+            ),
+            media_type=STREAM_MEDIA_TYPES[stream],
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+                "X-Run-Id": run_id,
+            },
+        )
 
-        owners = sorted(set(r["owner"] for r in results if r.get("owner")))
+    try:
+        summary = {}
+        results = run_drift_analyzer(
+            request.repos,
+            fetch_mode=request.fetch_mode,
+            on_event=lambda e: e["event"] == "summary" and summary.update(e),
+            changed_files=changed_files,
+            use_cache=use_cache,
+            sink=request.sink,
+            environments=request.environments,
+            run_id=run_id,
+        )
+        write_output_file(results)
+
+        print(f"✅ Done. {len(results)} IaC chunks processed.")
 
-        return {
-            "status": "success",
-            "message": f"Processed {len(results)} IaC chunks",
-            "repos_analyzed": request.repos,
-            "owners_detected": owners,
-            "output_dir": OUTPUT_DIR,
-        }
+        response.headers["X-Run-Id"] = run_id
+        return build_analyze_response(request.repos, results, summary)
 
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Server error: {e}")
+        # run_id để client gửi lại và chạy tiếp từ checkpoint
+        raise HTTPException(
+            status_code=500,
+            detail={"message": f"Server error: {e}", "run_id": run_id},
+            headers={"X-Run-Id": run_id},
+        )
+
+
+@app.get("/runs/{run_id}")
+def get_run_progress(run_id: str):
+    """Trạng thái run + các stage đã có checkpoint của từng repo."""
+    progress = run_progress(run_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy run")
+    return progress
+
+
+work_queue = SQLiteQueue()
+
+
+class LeaseRequest(BaseModel):
+    worker: str
+    lease_seconds: Optional[int] = None
+
+
+class CompleteRequest(BaseModel):
+    worker: str
+    result: Dict[str, Any] = {}
+
+
+class FailRequest(BaseModel):
+    worker: str
+    error: str
+
+
+def require_queue_token(request: Request):
+    """Endpoint của worker (/queue/*) cần Bearer token nếu có WORK_QUEUE_TOKEN."""
+    if WORK_QUEUE_TOKEN and request.headers.get("Authorization") != (
+        f"Bearer {WORK_QUEUE_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Sai hoặc thiếu queue token")
+
+
+@app.post("/jobs", status_code=202)
+def enqueue_jobs(request: AnalyzeRequest):
+    """
+    Đưa repo vào work queue thay vì phân tích ngay: mỗi repo 1 job, worker.py
+    (trên máy này hoặc node khác) sẽ claim và chạy. Theo dõi qua GET /jobs/{id}.
+    Job trùng (cùng repo + options) đang chờ được gộp ("coalesced": true).
+    Mỗi job dùng id của nó làm run_id: job được claim lại sau khi worker chết
+    sẽ chạy tiếp từ checkpoint.
+    """
+    validate_analyze_request(request)
+    if request.run_id is not None:
+        raise HTTPException(
+            status_code=400, detail="run_id không dùng cho /jobs (run_id = id của job)"
+        )
+    options = {
+        "force": request.force,
+        "sink": request.sink,
+        "environments": request.environments,
+        "fetch_mode": request.fetch_mode,
+        "changed_files": request.changed_files,
+    }
+    jobs = [work_queue.enqueue(repo, options) for repo in request.repos]
+    return {"status": "queued", "jobs": jobs}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = work_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    return job
+
+
+@app.get("/queue/stats")
+def queue_stats():
+    return work_queue.stats()
+
+
+@app.post("/queue/claim")
+def claim_job(body: LeaseRequest, request: Request):
+    require_queue_token(request)
+    job = work_queue.claim(body.worker, body.lease_seconds)
+    if job is None:
+        return Response(status_code=204)
+    return job
+
+
+def lease_lost(job_id):
+    raise HTTPException(
+        status_code=409, detail=f"Job {job_id} không còn thuộc worker này"
+    )
+
+
+@app.post("/queue/{job_id}/heartbeat")
+def heartbeat_job(job_id: str, body: LeaseRequest, request: Request):
+    require_queue_token(request)
+    if not work_queue.heartbeat(job_id, body.worker, body.lease_seconds):
+        lease_lost(job_id)
+    return {"ok": True}
+
+
+@app.post("/queue/{job_id}/complete")
+def complete_job(job_id: str, body: CompleteRequest, request: Request):
+    require_queue_token(request)
+    if not work_queue.complete(job_id, body.worker, body.result):
+        lease_lost(job_id)
+    return {"ok": True}
+
+
+@app.post("/queue/{job_id}/fail")
+def fail_job(job_id: str, body: FailRequest, request: Request):
+    require_queue_token(request)
+    if not work_queue.fail(job_id, body.worker, body.error):
+        lease_lost(job_id)
+    return {"ok": True}
+
+
+@app.get("/chunks")
+def list_chunks(
+    repo: Optional[str] = None,
+    commit: Optional[str] = None,
+    resource_type: Optional[str] = None,
+    resource_address: Optional[str] = None,
+    region: Optional[str] = None,
+    owner: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+):
+    """
+    Truy vấn chunk từ chunk store cục bộ, trả về NDJSON (1 chunk / dòng).
+    Trang tiếp theo: gọi lại với `cursor` = header `X-Next-Cursor`.
+    """
+    filters = {
+        "repo": repo,
+        "commit": commit,
+        "resource_type": resource_type,
+        "resource_address": resource_address,
+        "region": region,
+        "owner": owner,
+    }
+    try:
+        docs, next_cursor = query_chunks(filters, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return StreamingResponse(
+        (doc + "\n" for doc in docs),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
+@app.get("/search")
+def search_resources(
+    q: Optional[str] = None,
+    address: Optional[str] = None,
+    type: Optional[str] = None,
+    region: Optional[str] = None,
+    module: Optional[str] = None,
+    repo: Optional[str] = None,
+    attr: Optional[str] = None,
+    env: Optional[str] = None,
+    limit: int = 20,
+):
+    """
+    Tìm resource trong index cục bộ (xem core/search_index.py).
+    - address=aws_s3_bucket.logs, type=aws_security_group, region=us-east-1,
+      module=modules/vpc, attr=acl hoặc attr=acl=private, env=prod: khớp chính xác.
+    - q: free-text, xếp hạng BM25 (kết hợp được với filter).
+    """
+    started = time.perf_counter()
+    filters = {
+        "address": address,
+        "type": type,
+        "region": region,
+        "module": module,
+        "repo": repo,
+        "attr": attr,
+        "env": env,
+    }
+    try:
+        found = search(q, filters, limit=max(1, min(limit, SEARCH_MAX_LIMIT)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**found, "took_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Limit concurrency hiện tại của từng stage (clone / parse / upload) trong
+    process này, cùng inflight, số tác vụ đang chờ, lỗi/throttle và latency.
+    Mỗi uvicorn worker có limiter riêng (xem "pid").
+    """
+    return {
+        "pid": os.getpid(),
+        "repo_concurrency": REPO_CONCURRENCY,
+        "stages": concurrency_snapshot(),
+    }
+
+
+def changed_files_from_push(payload, repo_url):
+    """
+    Danh sách file đổi trong push, dùng để chỉ phân tích lại các module bị ảnh
+    hưởng. None (phân tích toàn bộ) khi payload không đủ thông tin: GitHub chỉ
+    gửi tối đa 20 commit, hoặc `before` không phải commit đã phân tích gần nhất.
+    """
+    commits = payload.get("commits")
+    if not commits or len(commits) >= 20 or payload.get("forced"):
+        return None
+    if last_analyzed_commit(repo_url) != payload.get("before"):
+        return None
+    changed = set()
+    for commit in commits:
+        for key in ("added", "modified", "removed"):
+            changed.update(commit.get(key) or [])
+    return sorted(changed)
+
+
+def run_webhook_analysis(repo_url, commit_sha, changed_files=None, branch=None):
+    """
+    Phân tích đúng nhánh + commit của push (không phải HEAD của default branch
+    lúc clone). Returns: SHA đầy đủ đã phân tích xong, None nếu thất bại.
+    """
+    changed = None if changed_files is None else {repo_url: changed_files}
+    ref = {"branch": branch, "commit": commit_sha}
+    summary = {}
+    run_drift_analyzer(
+        [repo_url],
+        on_event=lambda e: e["event"] == "summary" and summary.update(e),
+        changed_files=changed,
+        refs={repo_url: {k: v for k, v in ref.items() if v}},
+        collect=False,
+    )
+    analyzed = summary.get("commits", {}).get(repo_url)
+    print(f"✅ Webhook xử lý xong cho repo: {repo_url} ({summary.get('chunks', 0)} chunks)")
+    return analyzed
 
 
 @app.post("/webhook/github")
 async def github_webhook(request: Request):
+    """
+    - Redelivery (X-GitHub-Delivery đã thấy) của commit đã phân tích / đang chờ,
+      hoặc commit đã phân tích -> trả ngay. Redelivery của commit chưa phân
+      tích xong (lần trước lỗi) được chạy lại.
+    - Push vào nhánh không theo dõi / xoá nhánh -> bỏ qua.
+    - Các push liên tiếp trong WEBHOOK_DEBOUNCE_SECONDS được gộp thành 1 lần
+      chạy tại commit mới nhất (202). Debounce = 0 -> chạy đồng bộ như cũ.
+    """
     try:
         payload = await request.json()  # async method
-        repo_url = payload.get("repository", {}).get("clone_url")
+        repository = payload.get("repository", {})
+        repo_url = repository.get("clone_url")
         if not repo_url:
             raise HTTPException(
                 status_code=400, detail="Không tìm thấy repository URL trong payload"
             )
 
-        print(f"📩 Nhận webhook từ GitHub: {repo_url}")
+        event = request.headers.get("X-GitHub-Event", "push")
+        delivery_id = request.headers.get("X-GitHub-Delivery")
+        ref = payload.get("ref")
+        commit_sha = payload.get("after") or (payload.get("head_commit") or {}).get(
+            "id"
+        )
+
+        print(f"📩 Nhận webhook từ GitHub: {repo_url} ({event} {ref} {commit_sha})")
 
-        results = run_drift_analyzer([repo_url])  # đồng bộ vẫn được
-        print(f"✅ Webhook xử lý xong cho repo: {repo_url}")
-        print("kimlong")
+        def reply(status, status_code=200, **extra):
+            body = {"status": status, "repo": repo_url, "commit": commit_sha, **extra}
+            return JSONResponse(body, status_code=status_code)
+
+        if event != "push" or payload.get("deleted"):
+            return reply("ignored", reason=f"event '{event}' không cần phân tích")
+        if not is_tracked_ref(ref, repository.get("default_branch")):
+            return reply("ignored", reason=f"ref {ref} không được theo dõi")
+        first_delivery = await run_in_threadpool(
+            record_delivery, delivery_id, repo_url, commit_sha
+        )
+        if commit_sha and await run_in_threadpool(
+            is_commit_analyzed, repo_url, commit_sha
+        ):
+            return reply("already_analyzed" if first_delivery else "duplicate")
+        if not first_delivery and (not commit_sha or is_pending(repo_url, commit_sha)):
+            return reply("duplicate", delivery_id=delivery_id)
+        branch = ref[len("refs/heads/") :]
+
+        changed_files = await run_in_threadpool(
+            changed_files_from_push, payload, repo_url
+        )
+
+        if WEBHOOK_DEBOUNCE_SECONDS <= 0:
+            analyzed = await run_in_threadpool(
+                run_webhook_analysis, repo_url, commit_sha, changed_files, branch
+            )
+            if not await run_in_threadpool(record_run, repo_url, commit_sha, analyzed):
+                raise HTTPException(
+                    status_code=500, detail=f"Phân tích {commit_sha} không thành công"
+                )
+            return reply("success", analyzed_commit=analyzed, output_dir=OUTPUT_DIR)
 
-        return {
-            "status": "success",
-            "repo": repo_url,
-            "chunks": len(results),
-            "output_dir": OUTPUT_DIR,
-        }
+        status = schedule_analysis(
+            repo_url,
+            commit_sha,
+            run_webhook_analysis,
+            changed_files=changed_files,
+            branch=branch,
+        )
+        return reply(status, status_code=202, debounce_seconds=WEBHOOK_DEBOUNCE_SECONDS)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,119 @@
+"""
+Fan-out nhiều môi trường: N lần process_directory (mỗi .tfvars 1 lần, parse lại
+toàn bộ repo) so với 1 lần process_directory(environments=...) - parse 1 lần,
+resolve copy-on-write cho từng môi trường. Kiểm tra output từng môi trường
+giống hệt nhau giữa 2 cách.
+
+    python benchmarks/bench_fanout.py [--modules 20] [--resources 50] [--envs 4]
+
+PARSE_ISOLATION=false để đo parse trong process (không qua worker pool).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.terraform_parser import process_directory  # noqa: E402
+
+
+def write_repo(root, n_modules, n_resources, n_envs):
+    """Repo giả: n_modules thư mục, ~1/3 attribute dùng biến; envs/<env>.tfvars."""
+    for m in range(n_modules):
+        module_dir = os.path.join(root, "stacks", f"stack_{m}")
+        os.makedirs(module_dir)
+        out = ['provider "aws" {\n  region = "ap-southeast-1"\n}\n']
+        out.append('variable "instance_type" {\n  default = "t3.micro"\n}\n')
+        for i in range(n_resources):
+            cidr = "var.vpc_cidr" if i % 3 == 0 else f'"10.{i % 256}.0.0/16"'
+            out.append(
+                f'resource "aws_security_group_rule" "ingress_{i}" {{\n'
+                '  type              = "ingress"\n'
+                f"  from_port         = {1000 + i}\n"
+                f"  to_port           = {1000 + i}\n"
+                '  protocol          = "tcp"\n'
+                f"  cidr_blocks       = [{cidr}]\n"
+                '  security_group_id = "sg-0123456789abcdef0"\n'
+                "}\n"
+            )
+        out.append(
+            'resource "aws_instance" "app" {\n'
+            '  ami           = "ami-0123456789abcdef0"\n'
+            "  instance_type = var.instance_type\n"
+            "}\n"
+        )
+        with open(os.path.join(module_dir, "main.tf"), "w", encoding="utf-8") as f:
+            f.write("\n".join(out))
+
+    environments = {}
+    os.makedirs(os.path.join(root, "envs"))
+    for e in range(n_envs):
+        name = f"env{e}"
+        path = os.path.join(root, "envs", f"{name}.tfvars")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f'vpc_cidr      = "10.{100 + e}.0.0/16"\n')
+            f.write(f'instance_type = "m5.{["large", "xlarge", "2xlarge"][e % 3]}"\n')
+        environments[name] = path
+    return environments
+
+
+def timed(fn):
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        started = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - started
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modules", type=int, default=20)
+    parser.add_argument("--resources", type=int, default=50)
+    parser.add_argument("--envs", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        environments = write_repo(root, args.modules, args.resources, args.envs)
+
+        separate, t_separate = timed(
+            lambda: {
+                env: process_directory(root, path)
+                for env, path in environments.items()
+            }
+        )
+        fanout, t_fanout = timed(
+            lambda: process_directory(root, environments=environments)
+        )
+
+    by_env = {env: [] for env in environments}
+    for chunk in fanout:
+        chunk = dict(chunk)
+        by_env[chunk.pop("environment")].append(chunk)
+    for env in environments:
+        key = lambda c: (c["file"], c["lines"], c["resource_address"], c.get("part", ""))  # noqa: E731
+        if sorted(by_env[env], key=key) != sorted(separate[env], key=key):
+            sys.exit(f"❌ Output môi trường {env} khác nhau giữa 2 cách")
+
+    n_chunks = sum(len(c) for c in separate.values())
+    print(
+        f"{args.modules} module(s) x {args.resources + 2} block(s), "
+        f"{args.envs} môi trường, {n_chunks} chunk (output giống nhau ✅)"
+    )
+    rows = [
+        (f"{args.envs} lần process_directory", f"{t_separate * 1000:.1f} ms"),
+        ("1 lần fan-out", f"{t_fanout * 1000:.1f} ms"),
+        ("speedup", f"{t_separate / t_fanout:.2f}x"),
+    ]
+    for name, value in rows:
+        print(f"  {name:<28} {value:>10}")
+
+
+if __name__ == "__main__":
+    main()
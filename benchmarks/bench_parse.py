@@ -0,0 +1,131 @@
+"""
+So sánh tốc độ parse HCL (.tf) và Terraform JSON (.tf.json) trên cùng 1 cấu hình
+sinh ngẫu nhiên.
+
+    python benchmarks/bench_parse.py [--resources 500] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import json_codec  # noqa: E402
+from core.terraform_parser import (  # noqa: E402
+    chunk_source,
+    load_source,
+    normalize_json_config,
+    parse_ast,
+)
+
+
+def synthetic_config(n_resources):
+    resources = {}
+    for i in range(n_resources):
+        resources.setdefault("aws_s3_bucket", {})[f"bucket_{i}"] = {
+            "bucket": f"bucket-{i}",
+            "acl": "private",
+            "tags": {"Env": "prod", "Index": str(i)},
+        }
+    return {
+        "provider": {"aws": {"region": "us-east-1"}},
+        "variable": {f"var_{i}": {"default": i} for i in range(n_resources // 5)},
+        "resource": resources,
+    }
+
+
+def to_hcl(config):
+    out = ['provider "aws" {\n  region = "us-east-1"\n}\n']
+    for name, body in config["variable"].items():
+        out.append(f'variable "{name}" {{\n  default = {body["default"]}\n}}\n')
+    for type_name, items in config["resource"].items():
+        for name, body in items.items():
+            out.append(
+                f'resource "{type_name}" "{name}" {{\n'
+                f'  bucket = "{body["bucket"]}"\n'
+                f'  acl    = "{body["acl"]}"\n'
+                "  tags = {\n"
+                f'    Env   = "{body["tags"]["Env"]}"\n'
+                f'    Index = "{body["tags"]["Index"]}"\n'
+                "  }\n}\n"
+            )
+    return "\n".join(out)
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--resources", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    config = synthetic_config(args.resources)
+    hcl_text = to_hcl(config)
+    json_text = json.dumps(config, indent=2)
+
+    devnull = open(os.devnull, "w")
+    real_stdout = sys.stdout
+
+    def quiet(fn):
+        def run():
+            sys.stdout = devnull
+            try:
+                fn()
+            finally:
+                sys.stdout = real_stdout
+
+        return run
+
+    groups = [
+        (
+            "parse only",
+            [
+                ("hcl2.loads (.tf)", quiet(lambda: parse_ast("bench.tf", hcl_text))),
+                (
+                    "json.loads (.tf.json, stdlib)",
+                    lambda: normalize_json_config(json.loads(json_text)),
+                ),
+                (
+                    f"json_codec.loads (.tf.json, "
+                    f"{'orjson' if json_codec.orjson else 'stdlib'})",
+                    lambda: normalize_json_config(json_codec.loads(json_text)),
+                ),
+            ],
+        ),
+        (
+            "load_source + chunk_source",
+            [
+                (".tf", quiet(lambda: chunk_source(load_source("bench.tf", hcl_text)))),
+                (
+                    ".tf.json",
+                    quiet(lambda: chunk_source(load_source("bench.tf.json", json_text))),
+                ),
+            ],
+        ),
+    ]
+
+    print(
+        f"{args.resources} resources, {len(hcl_text) / 1024:.0f} KB HCL / "
+        f"{len(json_text) / 1024:.0f} KB JSON, best of {args.repeat}"
+    )
+    for title, rows in groups:
+        print(f"\n{title}")
+        baseline = None
+        for name, fn in rows:
+            ms = best_of(args.repeat, fn)
+            baseline = baseline or ms
+            print(f"  {name:<40} {ms:>10.1f} ms  {baseline / ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+So sánh kích thước record và tốc độ serialize của chunk schema 1 (legacy) và
+schema 2 (compact), với stdlib json và json_codec (orjson nếu có).
+
+    python benchmarks/bench_serialize.py [--resources 2000] [--repeat 5]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from core import json_codec  # noqa: E402
+from core.drift_analyzer import normalize_chunk, repo_context  # noqa: E402
+from core.terraform_parser import chunk_source, load_source  # noqa: E402
+
+REPO_URL = "https://github.com/example-org/infra-live.git"
+
+
+def synthetic_hcl(n_resources):
+    out = ['provider "aws" {\n  region = "ap-southeast-1"\n}\n']
+    for i in range(n_resources):
+        out.append(
+            f'resource "aws_security_group_rule" "ingress_{i}" {{\n'
+            '  type              = "ingress"\n'
+            f"  from_port         = {1000 + i}\n"
+            f"  to_port           = {1000 + i}\n"
+            '  protocol          = "tcp"\n'
+            f'  cidr_blocks       = ["10.{i % 256}.0.0/16"]\n'
+            '  security_group_id = "sg-0123456789abcdef0"\n'
+            "}\n"
+        )
+    return "\n".join(out)
+
+
+def stdlib_line(chunk):
+    # Cách write_jsonl_safely serialize trước đây
+    return (json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def codec_line(chunk):
+    return json_codec.dumps_bytes(chunk) + b"\n"
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--resources", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        raw_chunks = chunk_source(load_source("bench.tf", synthetic_hcl(args.resources)))
+    finally:
+        sys.stdout = real_stdout
+
+    timestamp = "2026-01-01T00:00:00Z"
+    contexts = {}
+    for schema in (1, 2):
+        config.CHUNK_SCHEMA_VERSION = schema
+        contexts[schema] = repo_context(REPO_URL, "abc1234", timestamp)
+
+    rows = [
+        ("schema 1 + json.dumps (before)", 1, stdlib_line),
+        ("schema 1 + json_codec", 1, codec_line),
+        ("schema 2 + json.dumps", 2, stdlib_line),
+        (
+            f"schema 2 + json_codec ({'orjson' if json_codec.orjson else 'stdlib'})",
+            2,
+            codec_line,
+        ),
+    ]
+
+    print(
+        f"{len(raw_chunks)} chunks, best of {args.repeat}, "
+        f"shard size {config.MAX_BYTES_PER_FILE / 1024:.0f} KB"
+    )
+    print(
+        f"\n  {'':<36} {'B/chunk':>9} {'shards':>7} {'normalize':>10} "
+        f"{'serialize':>10} {'chunks/s':>10} {'MB/s':>7}"
+    )
+    for name, schema, serialize in rows:
+        context = contexts[schema]
+        normalized = [normalize_chunk(c, context) for c in raw_chunks]
+        lines = [serialize(c) for c in normalized]
+        total = sum(len(line) for line in lines)
+
+        t_norm = best_of(
+            args.repeat, lambda: [normalize_chunk(c, context) for c in raw_chunks]
+        )
+        t_ser = best_of(args.repeat, lambda: [serialize(c) for c in normalized])
+        print(
+            f"  {name:<36} {total / len(lines):>9.0f} "
+            f"{math.ceil(total / config.MAX_BYTES_PER_FILE):>7} "
+            f"{t_norm * 1000:>8.1f}ms {t_ser * 1000:>8.1f}ms "
+            f"{len(lines) / (t_norm + t_ser):>10.0f} "
+            f"{total / t_ser / 1024 / 1024:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Load test API trong process: FastAPI app chạy qua httpx.ASGITransport (không
+cần uvicorn/ALB), clone git / S3 / Bedrock được thay bằng stub có độ trễ giả
+lập trên các repo Terraform tổng hợp. Đo throughput + p50/p95/p99 theo endpoint
+và độ trễ event loop (endpoint async chạy code blocking -> lag tăng vọt).
+
+    python benchmarks/load_test.py [--concurrency 16] [--requests 200]
+        [--mix analyze=1,webhook=1,search=4] [--repos 8] [--files 10]
+        [--clone-ms 200] [--s3-ms 30] [--bedrock-ms 100] [--threads 40]
+        [--force] [--webhook-debounce 0]
+
+Chạy trong thư mục tạm (state/, repos/, output/ riêng), không đụng state
+thật và không gọi mạng. Cần httpx (pip install httpx).
+"""
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REPO_URL = "https://github.com/loadtest-org/infra-{:03d}.git"
+LAG_INTERVAL = 0.01
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=16, help="Số client song song")
+    parser.add_argument("--requests", type=int, default=200, help="Tổng số request")
+    parser.add_argument(
+        "--mix",
+        default="analyze=1,webhook=1,search=4",
+        help="Tỉ lệ request theo endpoint: analyze, webhook, search",
+    )
+    parser.add_argument("--repos", type=int, default=8, help="Số repo tổng hợp")
+    parser.add_argument("--files", type=int, default=10, help="Số file .tf mỗi repo")
+    parser.add_argument("--resources", type=int, default=20, help="Số resource mỗi file")
+    parser.add_argument("--clone-ms", type=float, default=200)
+    parser.add_argument("--s3-ms", type=float, default=30, help="Độ trễ mỗi lần gọi S3")
+    parser.add_argument("--bedrock-ms", type=float, default=100)
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=40,
+        help="Số thread của threadpool anyio (endpoint sync chạy trong đây)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="/analyze với force=true (bỏ result cache)"
+    )
+    parser.add_argument(
+        "--webhook-debounce",
+        type=float,
+        default=0,
+        help="WEBHOOK_DEBOUNCE_SECONDS; 0 = webhook chạy phân tích đồng bộ",
+    )
+    parser.add_argument("--workdir", help="Thư mục làm việc (mặc định thư mục tạm)")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+def write_template(path, n_files, n_resources, seed):
+    """Working tree Terraform giả cho 1 repo."""
+    rnd = random.Random(seed)
+    for f in range(n_files):
+        module_dir = os.path.join(path, "stacks" if f % 2 else "modules", f"m{f}")
+        os.makedirs(module_dir, exist_ok=True)
+        out = [f'provider "aws" {{\n  region = "{rnd.choice(["us-east-1", "ap-southeast-1"])}"\n}}\n']
+        for i in range(n_resources):
+            out.append(
+                f'resource "aws_s3_bucket" "b{f}_{i}" {{\n'
+                f'  bucket = "loadtest-{seed}-{f}-{i}"\n'
+                f'  acl    = "{rnd.choice(["private", "public-read"])}"\n'
+                "}\n"
+            )
+        with open(os.path.join(module_dir, "main.tf"), "w", encoding="utf-8") as fh:
+            fh.write("\n".join(out))
+
+
+def install_stubs(templates, args):
+    """Thay clone git / S3 / Bedrock bằng stub có độ trễ (sleep, không dùng CPU)."""
+    from core import bedrock_sync, drift_analyzer, s3_uploader
+
+    heads = {url: hashlib.sha1(url.encode()).hexdigest() for url in templates}
+    checkouts = {}
+
+    def latency(ms):
+        time.sleep(max(0.0, random.gauss(ms, ms * 0.2)) / 1000)
+
+    def fake_clone(repo_url, local_path=None, branch=None, commit=None):
+        latency(args.clone_ms)
+        local_path = local_path or os.path.join("repos", repo_url.rsplit("/", 1)[-1])
+        shutil.rmtree(local_path, ignore_errors=True)
+        shutil.copytree(templates[repo_url], local_path)
+        head = commit or heads[repo_url]
+        checkouts[os.path.abspath(local_path)] = head
+        return local_path, head[:7]
+
+    def fake_ls_remote(repo_url, branch=None):
+        latency(args.clone_ms / 4)
+        return heads.get(repo_url)
+
+    def fake_clear(bucket, repo_key):
+        latency(args.s3_ms)
+
+    def fake_upload(local_folder, bucket, prefix):
+        uploaded = []
+        for root, _, files in os.walk(local_folder):
+            for name in files:
+                latency(args.s3_ms)
+                uploaded.append(f"{prefix}/{os.path.relpath(os.path.join(root, name), local_folder)}")
+        return {"status": "success", "uploaded": uploaded, "error": None}
+
+    def fake_sync(s3_repo_path):
+        latency(args.bedrock_ms)
+        return {"status": "STARTED", "ingestion_job_id": uuid.uuid4().hex[:10]}
+
+    drift_analyzer.clone_or_pull = fake_clone
+    drift_analyzer.clone_blobless = fake_clone
+    drift_analyzer.resolve_remote_head = fake_ls_remote
+    drift_analyzer.local_head = lambda path: checkouts.get(os.path.abspath(path))
+    s3_uploader.clear_repo_output_in_s3 = fake_clear
+    s3_uploader.upload_folder_to_s3 = fake_upload
+    bedrock_sync.sync_data_source_by_repo = fake_sync
+
+
+def make_request(kind, repo_urls, args, rnd):
+    """(endpoint, method, url, kwargs) cho 1 request ngẫu nhiên."""
+    repo_url = rnd.choice(repo_urls)
+    if kind == "analyze":
+        body = {"repos": [repo_url], "force": args.force}
+        return "POST /analyze", "POST", "/analyze", {"json": body}
+    if kind == "webhook":
+        payload = {
+            "ref": "refs/heads/main",
+            "before": "0" * 40,
+            "after": uuid.uuid4().hex + "00000000",
+            "repository": {"clone_url": repo_url, "default_branch": "main"},
+            "commits": [{"modified": ["stacks/m1/main.tf"]}],
+        }
+        headers = {"X-GitHub-Event": "push", "X-GitHub-Delivery": str(uuid.uuid4())}
+        return "POST /webhook/github", "POST", "/webhook/github", {
+            "json": payload,
+            "headers": headers,
+        }
+    query = rnd.choice(["public-read", "aws_s3_bucket", "loadtest acl private"])
+    return "GET /search", "GET", "/search", {"params": {"q": query, "limit": 20}}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def monitor_loop_lag(samples, stop):
+    """Độ trễ của asyncio.sleep so với hẹn: > vài ms = event loop bị chặn."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(time.perf_counter() - started - LAG_INTERVAL)
+
+
+async def run_load(app, plan, args):
+    import anyio
+    import httpx
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = args.threads
+    results = {}  # endpoint -> [(latency_s, status_code)]
+    lag_samples, stop = [], asyncio.Event()
+    queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://loadtest", timeout=None
+    ) as client:
+
+        async def client_worker():
+            while True:
+                try:
+                    endpoint, method, url, kwargs = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, url, **kwargs)
+                    status = response.status_code
+                except Exception:
+                    status = 599
+                results.setdefault(endpoint, []).append(
+                    (time.perf_counter() - started, status)
+                )
+
+        monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(client_worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await monitor
+        stages = (await client.get("/metrics")).json()["stages"]
+    return results, lag_samples, elapsed, stages
+
+
+def report(results, lag_samples, elapsed, stages, args):
+    total = sum(len(v) for v in results.values())
+    print(
+        f"\n{total} request(s) trong {elapsed:.2f}s, concurrency {args.concurrency}, "
+        f"threadpool {args.threads} → {total / elapsed:.1f} req/s"
+    )
+    print(
+        f"\n  {'endpoint':<22} {'n':>5} {'err':>5} {'req/s':>7} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    )
+    for endpoint in sorted(results):
+        rows = results[endpoint]
+        latencies = sorted(latency * 1000 for latency, _ in rows)
+        errors = sum(1 for _, status in rows if status >= 400)
+        print(
+            f"  {endpoint:<22} {len(rows):>5} {errors:>5} {len(rows) / elapsed:>7.1f} "
+            f"{percentile(latencies, 50):>9.1f} {percentile(latencies, 95):>9.1f} "
+            f"{percentile(latencies, 99):>9.1f} {latencies[-1]:>9.1f}"
+        )
+
+    lags = sorted(lag * 1000 for lag in lag_samples)
+    if lags:
+        print(
+            f"\n  event loop lag: p50 {percentile(lags, 50):.1f} ms, "
+            f"p99 {percentile(lags, 99):.1f} ms, max {lags[-1]:.1f} ms"
+        )
+        if lags[-1] > 100:
+            print("  ⚠️ Event loop bị chặn > 100 ms: có code blocking trong endpoint async")
+
+    if stages:
+        print("\n  stage concurrency (GET /metrics):")
+        for stage, data in sorted(stages.items()):
+            print(
+                f"    {stage:<7} limit {data['limit']:>3} [{data['min']}-{data['max']}] "
+                f"{data['mode']:<5} done {data['completed']:>5} "
+                f"err {data['errors']} throttled {data['throttled']} "
+                f"p50 {data['latency_ms'].get('p50', 0)} ms"
+            )
+
+
+def main():
+    args = parse_args()
+    mix = {}
+    for item in args.mix.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in ("analyze", "webhook", "search"):
+            sys.exit(f"❌ --mix: endpoint không hợp lệ '{kind}'")
+        mix[kind] = float(weight or 1)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="drift-loadtest-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    # Config đọc env lúc import -> đặt trước khi import api
+    os.environ["WEBHOOK_DEBOUNCE_SECONDS"] = str(args.webhook_debounce)
+    os.environ.setdefault("OUTPUT_SINK", "s3")
+    os.environ["S3_ENDPOINT_URL"] = ""
+
+    templates = {}
+    for r in range(args.repos):
+        url = REPO_URL.format(r)
+        templates[url] = os.path.join(workdir, "templates", f"infra-{r:03d}")
+        write_template(templates[url], args.files, args.resources, args.seed + r)
+
+    real_stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")  # log của pipeline
+    try:
+        from api import app
+
+        install_stubs(templates, args)
+        rnd = random.Random(args.seed)
+        kinds = list(mix)
+        plan = [
+            make_request(kind, list(templates), args, rnd)
+            for kind in rnd.choices(kinds, weights=[mix[k] for k in kinds], k=args.requests)
+        ]
+        results, lag_samples, elapsed, stages = asyncio.run(run_load(app, plan, args))
+    finally:
+        sys.stdout.close()
+        sys.stdout = real_stdout
+
+    print(
+        f"{args.repos} repo x {args.files} file x {args.resources} resource; "
+        f"stub clone {args.clone_ms:.0f} ms, S3 {args.s3_ms:.0f} ms, "
+        f"Bedrock {args.bedrock_ms:.0f} ms"
+    )
+    report(results, lag_samples, elapsed, stages, args)
+    if not args.workdir:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Đo thời gian import `api` (cold start của 1 worker) bằng `python -X importtime`.
+
+    python benchmarks/startup_report.py [--runs 5] [--top 15]
+
+In ra median / min wall time của `import api` qua nhiều process mới, và các
+module tốn thời gian nhất (cumulative) của lần chạy cuối.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import api; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def measure_once():
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SNIPPET],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall_ms = float(proc.stdout.strip().splitlines()[-1])
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:   <self us> | <cumulative us> | <indented module>"
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append((int(cumulative_us), int(self_us), name.strip()))
+    return wall_ms, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    walls = []
+    modules = []
+    for _ in range(args.runs):
+        wall_ms, modules = measure_once()
+        walls.append(wall_ms)
+
+    print(
+        f"import api: median {statistics.median(walls):.0f} ms, "
+        f"min {min(walls):.0f} ms over {args.runs} runs"
+    )
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in sorted(modules, reverse=True)[: args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    imported = {name for _, _, name in modules}
+    heavy = [m for m in ("boto3", "botocore", "git", "hcl2", "lark") if m in imported]
+    print(f"\nheavy modules imported at startup: {', '.join(heavy) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
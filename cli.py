@@ -0,0 +1,113 @@
+"""
+Chạy pipeline từ command line, không cần API server.
+
+    python cli.py ./infra-live                    # checkout local, ghi output/
+    python cli.py file:///srv/git/infra.git --sink null
+    python cli.py https://github.com/org/repo --sink s3
+    python cli.py --repos-file repos.json --sink memory --events
+    python cli.py ./a ./b --sink null --parquet output/chunks
+    python cli.py ./infra --env dev=envs/dev.tfvars --env prod=envs/prod.tfvars
+    python cli.py --run-id <run_id>               # chạy tiếp run bị gián đoạn
+
+Mặc định sink "local": không gọi S3/Bedrock, dùng được offline và trong CI.
+"""
+
+import argparse
+import json
+import sys
+
+import config
+from core.checkpoints import get_run
+from core.drift_analyzer import run_drift_analyzer
+from core.sinks import SINKS, make_sink
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="IaC Drift Analyzer CLI")
+    parser.add_argument(
+        "repos", nargs="*", help="URL git, file:// hoặc đường dẫn tới checkout local"
+    )
+    parser.add_argument("--repos-file", help="File JSON chứa list repo (như repos.json)")
+    parser.add_argument("--sink", choices=sorted(SINKS), default="local")
+    parser.add_argument(
+        "--output-dir",
+        default=config.OUTPUT_DIR,
+        help="Thư mục output cho sink local/s3",
+    )
+    parser.add_argument("--fetch-mode", choices=["worktree", "blobs"])
+    parser.add_argument(
+        "--parquet",
+        metavar="DIR",
+        help="Export thêm chunk ra dataset Parquet, 1 file / repo (cần pyarrow)",
+    )
+    parser.add_argument(
+        "--env",
+        action="append",
+        metavar="NAME=PATH",
+        help="Môi trường + file .tfvars (tương đối repo), lặp lại cho nhiều môi trường",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Bỏ qua result cache (sink s3)"
+    )
+    parser.add_argument(
+        "--run-id",
+        help="Chạy tiếp 1 run bị gián đoạn (bỏ qua repo/stage đã có checkpoint); "
+        "không truyền repo = dùng lại danh sách repo của run đó",
+    )
+    parser.add_argument(
+        "--events",
+        action="store_true",
+        help="In progress event (NDJSON) ra stderr",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    repos = list(args.repos)
+    if args.repos_file:
+        with open(args.repos_file, "r", encoding="utf-8") as f:
+            repos.extend(json.load(f))
+    if not repos and not args.run_id:
+        sys.exit("❌ Cần ít nhất 1 repo (tham số, --repos-file hoặc --run-id)")
+    if not repos and get_run(args.run_id) is None:
+        sys.exit(f"❌ Không tìm thấy run {args.run_id}")
+
+    environments = None
+    if args.env:
+        try:
+            environments = dict(item.split("=", 1) for item in args.env)
+        except ValueError:
+            sys.exit("❌ --env phải có dạng NAME=PATH")
+
+    summary = {}
+
+    def on_event(event):
+        if event["event"] == "run":
+            print(f"   Bị gián đoạn? Chạy lại: python cli.py --run-id {event['run_id']} ...")
+        elif event["event"] == "summary":
+            summary.update(event)
+        if args.events:
+            print(json.dumps(event, ensure_ascii=False), file=sys.stderr, flush=True)
+
+    sink = make_sink(args.sink, output_dir=args.output_dir)
+    if repos:
+        print(f"🚀 Analyzing {len(repos)} repo(s) → sink '{sink.name}'")
+    else:
+        print(f"🚀 Resuming run {args.run_id} → sink '{sink.name}'")
+    run_drift_analyzer(
+        repos,
+        fetch_mode=args.fetch_mode,
+        on_event=on_event,
+        use_cache=False if args.no_cache else None,
+        sink=sink,
+        parquet_path=args.parquet,
+        environments=environments,
+        run_id=args.run_id,
+        collect=False,
+    )
+    print(f"✅ Processed {summary['chunks']} IaC chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,153 @@
+import os
+
 OUTPUT_DIR = "output"
 OUTPUT_FILE = "drift_output.json"
 BASE_REPO_DIR = "repos"
+# Workspace clone / staging output theo job (core/workspace.py): xoá khi job
+# xong, trừ khi KEEP_WORKSPACES=true (debug). Workspace bị bỏ lại quá
+# WORKSPACE_MAX_AGE_SECONDS được dọn ở lần chạy sau.
+KEEP_WORKSPACES = os.getenv("KEEP_WORKSPACES", "false").lower() == "true"
+WORKSPACE_MAX_AGE_SECONDS = int(os.getenv("WORKSPACE_MAX_AGE_SECONDS", str(24 * 3600)))
+STATE_DIR = "state"  # SQLite state cục bộ (chunk store, cache, ...)
 
 MAX_BYTES_PER_FILE = 20_000
 
-OUTPUT_S3_BUCKET = "drift-iac-kb"
-KNOWLEDGE_BASE_ID = "SKE1TNSYZM"
+# Cách lấy source Terraform từ git:
+#   "worktree" - shallow clone + checkout toàn bộ working tree (mặc định)
+#   "blobs"    - blobless clone, chỉ stream các blob Terraform từ object store
+GIT_FETCH_MODE = os.getenv("GIT_FETCH_MODE", "worktree")
+TERRAFORM_EXTENSIONS = (".tf", ".tfvars", ".hcl", ".tf.json", ".tfvars.json")
+
+# Token budget cho chunk (terraform_parser.apply_token_budget):
+# gộp block nhỏ cùng file đến ~TARGET, chia block lớn hơn LIMIT
+CHUNK_TOKEN_BUDGET = os.getenv("CHUNK_TOKEN_BUDGET", "true").lower() == "true"
+CHUNK_TOKEN_TARGET = int(os.getenv("CHUNK_TOKEN_TARGET", "400"))
+CHUNK_TOKEN_LIMIT = int(os.getenv("CHUNK_TOKEN_LIMIT", "1000"))
+
+# Fan-out nhiều môi trường (terraform_parser.chunk_source_envs): mỗi file parse
+# 1 lần, resolve biến theo từng .tfvars, chunk gắn "environment".
+# "dev=envs/dev.tfvars,prod=envs/prod.tfvars" (đường dẫn tương đối repo); rỗng = tắt
+TFVARS_ENVIRONMENTS = dict(
+    item.strip().split("=", 1)
+    for item in os.getenv("TFVARS_ENVIRONMENTS", "").split(",")
+    if "=" in item
+)
+
+# Format chunk ghi ra JSONL/S3/chunk store:
+#   1 = legacy (repo/commit/owner/region/account lặp lại trong "metadata")
+#   2 = compact (mỗi field 1 lần, có key "schema")
+CHUNK_SCHEMA_VERSION = int(os.getenv("CHUNK_SCHEMA_VERSION", "2"))
+
+CHUNK_STORE_DB = "chunks.db"
+# /search: index trong RAM đồng bộ lại với chunk store tối đa 1 lần / N giây
+SEARCH_REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", "5"))
+SEARCH_MAX_LIMIT = 200
+CHUNKS_PAGE_LIMIT = 1000  # số chunk tối đa mỗi trang của /chunks
+
+# /analyze?stream=...: gửi heartbeat nếu không có event trong N giây
+# (phải nhỏ hơn idle timeout của ALB, mặc định 60s)
+STREAM_HEARTBEAT_SECONDS = 15
+
+# Budget parse mỗi file (core/parse_guard.py): file vượt time/size budget bị
+# quarantine theo blob hash, các lần chạy sau đi thẳng vào line-window fallback
+PARSE_ISOLATION = os.getenv("PARSE_ISOLATION", "true").lower() == "true"
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", "30"))
+PARSE_MAX_BYTES = int(os.getenv("PARSE_MAX_BYTES", str(2 * 1024 * 1024)))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Worker = process mới `python -m core.parse_worker` (không fork process cha,
+# không import lại script __main__ của cha)
+PARSE_WORKER_START_TIMEOUT_SECONDS = float(
+    os.getenv("PARSE_WORKER_START_TIMEOUT_SECONDS", "60")
+)
+QUARANTINE_DB = "quarantine.db"
+
+# Concurrency theo stage (core/concurrency.py): số repo xử lý song song tối đa,
+# từng stage tự chỉnh limit trong [1, *_MAX] theo latency / lỗi / throttle
+# (clone, upload: AIMD) và CPU (parse: tối đa PARSE_CONCURRENCY_MAX, mặc định = số core)
+REPO_CONCURRENCY = int(os.getenv("REPO_CONCURRENCY", "8"))
+ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+CLONE_CONCURRENCY = int(os.getenv("CLONE_CONCURRENCY", "4"))  # limit ban đầu
+CLONE_CONCURRENCY_MAX = int(os.getenv("CLONE_CONCURRENCY_MAX", "16"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_CONCURRENCY_MAX = int(os.getenv("UPLOAD_CONCURRENCY_MAX", "32"))
+PARSE_CONCURRENCY_MAX = int(os.getenv("PARSE_CONCURRENCY_MAX", "0"))
+LIMITER_WINDOW = 50  # số latency gần nhất để tính median
+LIMITER_MIN_SAMPLES = 5
+LIMITER_LATENCY_TOLERANCE = 3.0  # latency > 3x median = dấu hiệu nghẽn
+# slot(key=repo): so latency với lịch sử của chính repo (repo lớn vốn clone lâu)
+LIMITER_KEY_WINDOW = 10
+LIMITER_KEY_MIN_SAMPLES = 3
+LIMITER_KEY_HISTORY = 1000  # số key giữ lịch sử (LRU)
+LIMITER_BACKOFF = 0.5
+LIMITER_MIN_COOLDOWN_SECONDS = 1.0
+LIMITER_CPU_HIGH = 0.9
+LIMITER_CPU_LOW = 0.7
+LIMITER_CPU_INTERVAL_SECONDS = 1.0
+
+# Dedup chunk: bỏ chunk trùng trong repo; module dùng chung giữa các repo được
+# gắn content_ref / shared_from (nội dung vẫn giữ trong document của mỗi repo)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_INDEX_DB = "dedup.db"
+
+# Module graph theo repo (phục vụ region kế thừa + phân tích incremental)
+MODULE_GRAPH_DB = "module_graph.db"
+
+# Cache kết quả theo (repo, commit SHA, analyzer version): HEAD không đổi ->
+# /analyze trả summary cũ, bỏ qua clone/parse/S3/Bedrock.
+# Tăng ANALYZER_VERSION khi thay đổi parser/format chunk để vô hiệu cache cũ.
+ANALYZER_VERSION = os.getenv("ANALYZER_VERSION", "3")
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_DB = "results.db"
+GIT_LS_REMOTE_TIMEOUT = int(os.getenv("GIT_LS_REMOTE_TIMEOUT", "15"))
+
+# Work queue (core/work_queue.py, worker.py): POST /jobs enqueue, worker claim
+# job kèm lease và heartbeat; lease hết hạn -> job được giao lại.
+WORK_QUEUE_DB = "queue.db"
+# Worker: rỗng = SQLite cục bộ (cùng máy với API); http(s)://<api> = qua API server
+WORK_QUEUE_URL = os.getenv("WORK_QUEUE_URL", "")
+WORK_QUEUE_TOKEN = os.getenv("WORK_QUEUE_TOKEN", "")  # bảo vệ /queue/*; rỗng = tắt
+WORK_QUEUE_LEASE_SECONDS = int(os.getenv("WORK_QUEUE_LEASE_SECONDS", "120"))
+WORK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WORK_QUEUE_MAX_ATTEMPTS", "3"))
+WORK_QUEUE_POLL_SECONDS = float(os.getenv("WORK_QUEUE_POLL_SECONDS", "2"))
+WORK_QUEUE_RETENTION_SECONDS = 7 * 24 * 3600
+
+# Checkpoint theo (run_id, repo, stage): chạy lại cùng run_id -> tiếp tục từ
+# stage chưa xong của từng repo (core/checkpoints.py)
+CHECKPOINT_DB = "checkpoints.db"
+
+# /webhook/github: idempotency theo (repo, commit) + debounce theo repo
+WEBHOOK_STATE_DB = "webhook.db"
+WEBHOOK_DEBOUNCE_SECONDS = float(os.getenv("WEBHOOK_DEBOUNCE_SECONDS", "10"))
+# Nhánh được theo dõi (phân cách bằng dấu phẩy); rỗng = default branch của repo
+WEBHOOK_BRANCHES = [
+    b.strip() for b in os.getenv("WEBHOOK_BRANCHES", "").split(",") if b.strip()
+]
+
+OUTPUT_S3_BUCKET = os.getenv("OUTPUT_S3_BUCKET", "drift-iac-kb")
+KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGE_BASE_ID", "SKE1TNSYZM")
+# Endpoint S3-compatible (MinIO, LocalStack...); rỗng = AWS S3
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+
+# Đích ghi chunk mặc định: s3 | local | memory | null (xem core/sinks.py)
+OUTPUT_SINK = os.getenv("OUTPUT_SINK", "s3")
+# Thư mục dataset Parquet (cần pyarrow) cho analytics: mỗi repo 1 file
+# <dir>/<owner>/<repo>.parquet, được thay khi repo được phân tích lại; rỗng = tắt
+PARQUET_EXPORT_PATH = os.getenv("PARQUET_EXPORT_PATH", "")
+# Cho phép /analyze nhận đường dẫn local / file:// (đọc filesystem của server)
+ALLOW_LOCAL_REPOS = os.getenv("ALLOW_LOCAL_REPOS", "false").lower() == "true"
+
+BEDROCK_REGION = "us-east-1"
+
+# boto3 client (core/aws_clients.py)
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "32"))
+AWS_CONNECT_TIMEOUT = 5
+AWS_READ_TIMEOUT = 60
+AWS_MAX_ATTEMPTS = 5
+
+# main.py: chế độ production (uvicorn nhiều worker, không reload)
+APP_ENV = os.getenv("APP_ENV", "development")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+# Phải lớn hơn idle timeout của ALB (60s) để ALB không gặp 502 do keep-alive
+UVICORN_KEEPALIVE_SECONDS = 75
 
 DOMAIN_PUBLIC = "http://drift-api-alb-ingress-1782422278.us-east-1.elb.amazonaws.com:80"
@@ -0,0 +1,47 @@
+import os
+import threading
+
+import config
+
+# pid -> {service_name: client}. Client boto3 không fork-safe: mỗi process
+# (uvicorn worker, worker queue...) tự tạo client của riêng nó, lần đầu dùng.
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(service_name, region_name=None, endpoint_url=None):
+    """
+    Lazy factory cho boto3 client, cache theo (process, service).
+    boto3/botocore chỉ được import khi thực sự cần gọi AWS, giúp API
+    khởi động nhanh.
+    """
+    pid = os.getpid()
+    with _lock:
+        per_process = _clients.setdefault(pid, {})
+        client = per_process.get(service_name)
+        if client is None:
+            import boto3
+            from botocore.config import Config
+
+            client = boto3.session.Session().client(
+                service_name,
+                region_name=region_name,
+                endpoint_url=endpoint_url,
+                config=Config(
+                    max_pool_connections=config.AWS_MAX_POOL_CONNECTIONS,
+                    connect_timeout=config.AWS_CONNECT_TIMEOUT,
+                    read_timeout=config.AWS_READ_TIMEOUT,
+                    retries={"mode": "adaptive", "max_attempts": config.AWS_MAX_ATTEMPTS},
+                    tcp_keepalive=True,
+                ),
+            )
+            per_process[service_name] = client
+    return client
+
+
+def get_s3_client():
+    return get_client("s3", endpoint_url=config.S3_ENDPOINT_URL)
+
+
+def get_bedrock_agent_client():
+    return get_client("bedrock-agent", region_name=config.BEDROCK_REGION)
@@ -1,27 +1,43 @@
-import boto3
+import hashlib
+import re
 import time
-from botocore.exceptions import ClientError
 
 import config
-
-bedrock = boto3.client("bedrock-agent", region_name="us-east-1")
+from .aws_clients import get_bedrock_agent_client
 
 # ⚙️ Knowledge Base ID cố định của bạn
 KNOWLEDGE_BASE_ID = config.KNOWLEDGE_BASE_ID
 
 
+def data_source_name(repo_key: str):
+    """
+    Tên Data Source cho 1 repo key (vd. 'org-a/infra'): Bedrock chỉ cho
+    [0-9a-zA-Z] nối bởi '-'/'_' (tối đa 100 ký tự), nên slug + hash ngắn của key
+    để org-a/infra và org-b/infra (hay org/a-infra) không trùng tên.
+    """
+    digest = hashlib.sha1(repo_key.encode("utf-8")).hexdigest()[:8]
+    slug = re.sub(r"[^0-9A-Za-z]+", "-", repo_key)[:90].strip("-")
+    return f"{slug}-{digest}" if slug else digest
+
+
 def sync_data_source_by_repo(s3_repo_path: str):
     """
     Sync hoặc tạo mới Data Source cho từng repo trong Bedrock Knowledge Base.
-    :param s3_repo_path: ví dụ 's3://drift-iac-kb/repoA/'
+    :param s3_repo_path: ví dụ 's3://drift-iac-kb/iac_config/org-a/infra/';
+        data source đặt tên theo phần sau 'iac_config/' (repo key, xem data_source_name)
     """
+    from botocore.exceptions import ClientError
+
+    bedrock = get_bedrock_agent_client()
+
     # Chuẩn hóa path
     s3_repo_path = s3_repo_path.rstrip("/") + "/"
 
     # Tách bucket và prefix chính xác
     no_scheme = s3_repo_path.replace("s3://", "")
     bucket_name, prefix = no_scheme.split("/", 1)
-    repo_name = prefix.rstrip("/").split("/")[-1]
+    repo_key = prefix.rstrip("/").split("/", 1)[-1]
+    repo_name = data_source_name(repo_key)
 
     print(f"🔍 Checking data source for repo: {repo_name}")
 
@@ -50,7 +66,7 @@ def sync_data_source_by_repo(s3_repo_path: str):
                     "inclusionPrefixes": [prefix],  # ✅ SỬA LẠI CHỖ NÀY
                 },
             },
-            description=f"Data source for {repo_name}",
+            description=f"Data source for {repo_key}",
             dataDeletionPolicy="DELETE",  # hoặc "RETAIN"
         )["dataSource"]
 
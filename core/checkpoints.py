@@ -0,0 +1,123 @@
+"""
+Checkpoint theo (run_id, repo, stage) để chạy lại 1 run bị gián đoạn (crash,
+pod restart) từ stage chưa xong đầu tiên của mỗi repo.
+
+    clone   {"commit", "head"}                 commit đã clone (head = SHA đầy đủ)
+    write   {"commit", "chunks", "out_key"}    chunk đã ghi sink + chunk store
+    upload  {"files": [...]}                   manifest file đã upload
+    sync    {"ingestion_job_id", "status"}     ingestion job Bedrock
+    done    {"commit", "chunks"}               repo xong hoàn toàn
+
+Chunk của stage write không lưu ở đây: chunk store đã giữ (lọc theo commit).
+"""
+
+import json
+from contextlib import closing
+from datetime import datetime, timezone
+
+import config
+from .state_db import connect
+
+STAGES = ("clone", "write", "upload", "sync", "done")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    repos TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    run_id TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, repo, stage)
+);
+"""
+
+
+def _connect():
+    conn = connect(config.CHECKPOINT_DB)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def get_run(run_id):
+    """{"run_id", "repos", "options", "status", ...} hoặc None."""
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+    if row is None:
+        return None
+    return {**dict(row), "repos": json.loads(row["repos"]), "options": json.loads(row["options"])}
+
+
+def start_run(run_id, repos, options=None):
+    """Ghi run mới, hoặc đánh dấu run cũ đang chạy lại (giữ repos/options cũ)."""
+    now = _now()
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT INTO runs VALUES (?, ?, ?, 'running', ?, ?) "
+            "ON CONFLICT (run_id) DO UPDATE SET status = 'running', updated_at = ?",
+            (run_id, json.dumps(repos), json.dumps(options or {}), now, now, now),
+        )
+
+
+def finish_run(run_id, status="done"):
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?",
+            (status, _now(), run_id),
+        )
+
+
+def save_checkpoint(run_id, repo_url, stage, data=None):
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?)",
+            (run_id, repo_url, stage, json.dumps(data or {}), _now()),
+        )
+
+
+def load_checkpoints(run_id, repo_url=None):
+    """{repo: {stage: data}} của 1 run (hoặc chỉ 1 repo)."""
+    sql = "SELECT repo, stage, data FROM checkpoints WHERE run_id = ?"
+    params = [run_id]
+    if repo_url is not None:
+        sql += " AND repo = ?"
+        params.append(repo_url)
+    with closing(_connect()) as conn:
+        rows = conn.execute(sql, params).fetchall()
+    result = {}
+    for row in rows:
+        result.setdefault(row["repo"], {})[row["stage"]] = json.loads(row["data"])
+    return result
+
+
+def clear_checkpoints(run_id, repo_url):
+    """Bỏ checkpoint của 1 repo (dữ liệu đã lưu không còn khớp -> làm lại từ đầu)."""
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "DELETE FROM checkpoints WHERE run_id = ? AND repo = ?", (run_id, repo_url)
+        )
+
+
+def run_progress(run_id):
+    """Run + stage đã xong của từng repo (GET /runs/{run_id})."""
+    run = get_run(run_id)
+    if run is None:
+        return None
+    done = load_checkpoints(run_id)
+    run["progress"] = {
+        repo: [stage for stage in STAGES if stage in done.get(repo, {})]
+        for repo in run["repos"]
+    }
+    run["completed"] = sum(1 for repo in run["repos"] if "done" in done.get(repo, {}))
+    return run
@@ -0,0 +1,214 @@
+import hashlib
+from contextlib import closing
+
+import config
+from . import json_codec
+from .state_db import connect
+
+# Các cột được index, map tên filter -> tên cột
+FILTER_COLUMNS = {
+    "repo": "repo",
+    "commit": "commit_sha",
+    "resource_type": "resource_type",
+    "resource_address": "resource_address",
+    "region": "region",
+    "owner": "owner",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chunk_key TEXT NOT NULL UNIQUE,
+    run_id TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    commit_sha TEXT,
+    file TEXT,
+    lines TEXT,
+    resource_type TEXT,
+    resource_address TEXT,
+    region TEXT,
+    owner TEXT,
+    doc TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_repo ON chunks (repo);
+CREATE INDEX IF NOT EXISTS idx_chunks_commit ON chunks (commit_sha);
+CREATE INDEX IF NOT EXISTS idx_chunks_resource_type ON chunks (resource_type);
+CREATE INDEX IF NOT EXISTS idx_chunks_resource_address ON chunks (resource_address);
+CREATE INDEX IF NOT EXISTS idx_chunks_region ON chunks (region);
+CREATE INDEX IF NOT EXISTS idx_chunks_owner ON chunks (owner);
+-- Mọi address trong 1 chunk (chunk gộp bởi token budget có nhiều member)
+CREATE TABLE IF NOT EXISTS chunk_addresses (
+    seq INTEGER NOT NULL,
+    address TEXT NOT NULL,
+    PRIMARY KEY (address, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_chunk_addresses_seq ON chunk_addresses (seq);
+"""
+
+
+def _connect():
+    conn = connect(config.CHUNK_STORE_DB)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def chunk_key(chunk):
+    """Khoá ổn định giữa các lần chạy (id của chunk là uuid mới mỗi lần)."""
+    raw = "\x1f".join(
+        str(chunk.get(k, ""))
+        for k in ("repo", "file", "resource_type", "resource_address", "lines", "part")
+    )
+    if chunk.get("environment"):
+        # Chỉ thêm khi có để key của chunk không fan-out giữ nguyên
+        raw += f"\x1fenv={chunk['environment']}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def chunk_addresses(chunk):
+    """Address của mọi block trong chunk: members nếu là chunk gộp, ngược lại address của chunk."""
+    members = chunk.get("members")
+    if members:
+        return [m["resource_address"] for m in members]
+    return [chunk["resource_address"]] if chunk.get("resource_address") else []
+
+
+def chunk_keys(chunks):
+    """
+    chunk_key của từng chunk, không trùng trong 1 lần ghi: chunk thứ n (n >= 1)
+    có cùng key (vd. 2 block locals cùng span dòng trong 1 file) được thêm số
+    thứ tự, để upsert không gộp mất chunk. Chunk đầu tiên giữ key như cũ.
+    """
+    seen = {}
+    keys = []
+    for chunk in chunks:
+        key = chunk_key(chunk)
+        n = seen.get(key, 0)
+        seen[key] = n + 1
+        if n:
+            key = hashlib.sha1(f"{key}\x1f#{n}".encode("utf-8")).hexdigest()
+        keys.append(key)
+    return keys
+
+
+def upsert_repo_chunks(repo_url, chunks, run_id):
+    """
+    Upsert toàn bộ chunk của 1 repo trong 1 lần chạy, rồi xoá các chunk cũ
+    của repo không còn xuất hiện (resource đã bị xoá khỏi code).
+    Chunk giữ nguyên `seq` khi được update -> cursor pagination ổn định.
+    """
+    keys = chunk_keys(chunks)
+    rows = [
+        (
+            key,
+            run_id,
+            repo_url,
+            c.get("commit"),
+            c.get("file"),
+            c.get("lines"),
+            c.get("resource_type"),
+            c.get("resource_address"),
+            c.get("region"),
+            c.get("owner"),
+            json_codec.dumps(c),
+        )
+        for key, c in zip(keys, chunks)
+    ]
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "DELETE FROM chunk_addresses WHERE seq IN (SELECT seq FROM chunks WHERE repo = ?)",
+            (repo_url,),
+        )
+        conn.executemany(
+            """
+            INSERT INTO chunks (chunk_key, run_id, repo, commit_sha, file, lines,
+                                resource_type, resource_address, region, owner, doc)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (chunk_key) DO UPDATE SET
+                run_id = excluded.run_id,
+                commit_sha = excluded.commit_sha,
+                region = excluded.region,
+                owner = excluded.owner,
+                doc = excluded.doc
+            """,
+            rows,
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO chunk_addresses (seq, address) "
+            "SELECT seq, ? FROM chunks WHERE chunk_key = ?",
+            [
+                (address, key)
+                for key, c in zip(keys, chunks)
+                for address in chunk_addresses(c)
+            ],
+        )
+        deleted = conn.execute(
+            "DELETE FROM chunks WHERE repo = ? AND run_id != ?", (repo_url, run_id)
+        ).rowcount
+    print(f"🗄️ Chunk store: {len(rows)} upserted, {deleted} stale removed ({repo_url})")
+    return {"upserted": len(rows), "deleted": deleted}
+
+
+def query_chunks(filters=None, cursor=None, limit=100):
+    """
+    Truy vấn chunk theo filter (xem FILTER_COLUMNS) với keyset pagination.
+
+    Returns:
+        (docs, next_cursor): docs là list JSON string (chưa parse),
+        next_cursor = None khi đã hết dữ liệu.
+    """
+    limit = max(1, min(int(limit), config.CHUNKS_PAGE_LIMIT))
+    where, params = [], []
+    for name, value in (filters or {}).items():
+        if value is None:
+            continue
+        if name not in FILTER_COLUMNS:
+            raise ValueError(f"Unsupported filter: {name}")
+        if name == "resource_address":
+            # Khớp cả member của chunk gộp
+            where.append(
+                "(resource_address = ? OR seq IN "
+                "(SELECT seq FROM chunk_addresses WHERE address = ?))"
+            )
+            params.extend([value, value])
+            continue
+        where.append(f"{FILTER_COLUMNS[name]} = ?")
+        params.append(value)
+    if cursor:
+        where.append("seq > ?")
+        params.append(int(cursor))
+
+    sql = "SELECT seq, doc FROM chunks"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY seq LIMIT ?"
+    params.append(limit + 1)
+
+    with closing(_connect()) as conn:
+        rows = conn.execute(sql, params).fetchall()
+
+    next_cursor = str(rows[limit - 1]["seq"]) if len(rows) > limit else None
+    return [r["doc"] for r in rows[:limit]], next_cursor
+
+
+def load_repo_chunks(repo_url, commit_sha=None):
+    """Đọc lại toàn bộ chunk đã lưu của 1 repo (tuỳ chọn lọc theo commit)."""
+    sql = "SELECT doc FROM chunks WHERE repo = ?"
+    params = [repo_url]
+    if commit_sha:
+        sql += " AND commit_sha = ?"
+        params.append(commit_sha)
+    with closing(_connect()) as conn:
+        rows = conn.execute(sql + " ORDER BY seq", params).fetchall()
+    return [json_codec.loads(r["doc"]) for r in rows]
+
+
+def repo_run_ids():
+    """
+    {repo: run_id} của lần ghi gần nhất mỗi repo. Sau upsert_repo_chunks mọi
+    chunk của 1 repo cùng run_id, nên đây là "phiên bản" hiện tại của repo.
+    """
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT repo, MAX(run_id) AS run_id FROM chunks GROUP BY repo"
+        ).fetchall()
+    return {r["repo"]: r["run_id"] for r in rows}
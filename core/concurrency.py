@@ -0,0 +1,239 @@
+"""
+Giới hạn số tác vụ chạy đồng thời cho từng stage (clone / parse / upload),
+tự điều chỉnh theo đo đạc lúc chạy thay vì hard-code số worker.
+
+    aimd  stage mạng (clone, upload): mỗi lần xong thành công mà limit đang
+          được dùng hết -> limit += 1/limit (~ +1 mỗi "vòng"); lỗi, bị throttle
+          hoặc latency > LIMITER_LATENCY_TOLERANCE x median gần đây ->
+          limit *= LIMITER_BACKOFF (tối đa 1 lần / cooldown).
+          slot(key=repo): latency chỉ so với lịch sử của chính key đó (repo
+          lớn clone lâu không phải nghẽn); key chưa đủ mẫu -> chỉ lỗi /
+          throttle mới làm giảm limit.
+    cpu   stage parse: CPU toàn máy > LIMITER_CPU_HIGH -> limit - 1,
+          < LIMITER_CPU_LOW mà limit đang dùng hết -> limit + 1 (trần = số core).
+
+    with limiter("clone").slot(key=repo_url) as outcome:
+        ...
+        outcome["error"] = True        # lỗi không raise exception
+        outcome["throttled"] = True    # 429 / SlowDown / Throttling
+
+Mỗi process có bộ limiter riêng; snapshot() cho GET /metrics.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import config
+
+THROTTLE_RE = re.compile(
+    r"SlowDown|Throttl|TooManyRequests|RequestLimitExceeded|rate limit|\b429\b|\b503\b",
+    re.IGNORECASE,
+)
+
+
+def is_throttle_error(message):
+    """Lỗi do phía server giới hạn tốc độ (S3 SlowDown, Bedrock Throttling, 429...)."""
+    return bool(message) and bool(THROTTLE_RE.search(str(message)))
+
+
+def _read_cpu_times():
+    """(busy, total) jiffies toàn máy từ /proc/stat; None nếu không có (macOS/Windows)."""
+    try:
+        with open("/proc/stat", "r", encoding="ascii") as f:
+            fields = [int(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0)  # idle + iowait
+    total = sum(fields)
+    return total - idle, total
+
+
+class AdaptiveLimiter:
+    def __init__(self, name, initial, min_limit=1, max_limit=None, mode="aimd", adaptive=True):
+        self.name = name
+        self.mode = mode
+        self.adaptive = adaptive
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit or initial)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.inflight = 0
+        self.waiting = 0
+        self.stats = {"completed": 0, "errors": 0, "throttled": 0, "decreases": 0}
+        self._latencies = deque(maxlen=config.LIMITER_WINDOW)
+        self._key_latencies = OrderedDict()  # key -> deque, LRU
+        self._last_decrease = 0.0
+        self._cpu_sample = _read_cpu_times()
+        self._cpu_checked = time.monotonic()
+        self.cpu_busy = None
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, key=None):
+        """
+        Chờ tới khi inflight < limit, chạy block, ghi nhận latency/kết quả.
+
+        key: đơn vị có latency riêng (vd. repo_url); None = so với median chung.
+        """
+        with self._cond:
+            self.waiting += 1
+            while self.inflight >= int(self.limit):
+                self._cond.wait()
+            self.waiting -= 1
+            self.inflight += 1
+        outcome = {"error": False, "throttled": False}
+        started = time.perf_counter()
+        try:
+            yield outcome
+        except Exception as e:
+            outcome["error"] = True
+            outcome["throttled"] = outcome["throttled"] or is_throttle_error(e)
+            raise
+        finally:
+            self._complete(time.perf_counter() - started, outcome, key)
+
+    def _complete(self, latency, outcome, key=None):
+        with self._cond:
+            saturated = self.inflight >= int(self.limit)
+            self.inflight -= 1
+            self.stats["completed"] += 1
+            if outcome["error"]:
+                self.stats["errors"] += 1
+            if outcome["throttled"]:
+                self.stats["throttled"] += 1
+            median = self._median()
+            baseline = self._baseline(key, median)
+            if not outcome["error"]:
+                self._latencies.append(latency)
+                if key is not None:
+                    self._key_history(key).append(latency)
+            if self.adaptive:
+                if self.mode == "cpu":
+                    self._adjust_cpu(saturated)
+                else:
+                    self._adjust_aimd(latency, median, baseline, outcome, saturated)
+            self._cond.notify_all()
+
+    def _median(self, latencies=None):
+        ordered = sorted(self._latencies if latencies is None else latencies)
+        return ordered[len(ordered) // 2] if ordered else None
+
+    def _key_history(self, key):
+        history = self._key_latencies.pop(key, None)
+        if history is None:
+            history = deque(maxlen=config.LIMITER_KEY_WINDOW)
+        self._key_latencies[key] = history
+        while len(self._key_latencies) > config.LIMITER_KEY_HISTORY:
+            self._key_latencies.popitem(last=False)
+        return history
+
+    def _baseline(self, key, median):
+        """Latency "bình thường" để so: median chung, hoặc của riêng key."""
+        if key is None:
+            if len(self._latencies) >= config.LIMITER_MIN_SAMPLES:
+                return median
+            return None
+        history = self._key_latencies.get(key)
+        if history is None or len(history) < config.LIMITER_KEY_MIN_SAMPLES:
+            return None
+        return self._median(history)
+
+    def _decrease(self, factor=None, step=None):
+        old = int(self.limit)
+        if step is not None:
+            self.limit = max(self.min_limit, self.limit - step)
+        else:
+            self.limit = max(self.min_limit, self.limit * factor)
+        self._last_decrease = time.monotonic()
+        if int(self.limit) < old:
+            self.stats["decreases"] += 1
+            print(f"🚦 {self.name}: concurrency {old} -> {int(self.limit)}")
+
+    def _adjust_aimd(self, latency, median, baseline, outcome, saturated):
+        slow = baseline is not None and latency > config.LIMITER_LATENCY_TOLERANCE * baseline
+
+        if outcome["error"] or outcome["throttled"] or slow:
+            # 1 đợt nghẽn chỉ giảm 1 lần: các tác vụ đang chạy cùng lúc đó
+            # cũng sẽ báo lỗi/chậm ngay sau
+            cooldown = max(median or 0.0, config.LIMITER_MIN_COOLDOWN_SECONDS)
+            if time.monotonic() - self._last_decrease >= cooldown:
+                self._decrease(factor=config.LIMITER_BACKOFF)
+        elif saturated and self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _adjust_cpu(self, saturated):
+        now = time.monotonic()
+        if now - self._cpu_checked < config.LIMITER_CPU_INTERVAL_SECONDS:
+            return
+        sample = _read_cpu_times()
+        previous, self._cpu_sample, self._cpu_checked = self._cpu_sample, sample, now
+        if sample is None or previous is None or sample[1] <= previous[1]:
+            return
+        self.cpu_busy = (sample[0] - previous[0]) / (sample[1] - previous[1])
+        if self.cpu_busy > config.LIMITER_CPU_HIGH:
+            self._decrease(step=1)
+        elif self.cpu_busy < config.LIMITER_CPU_LOW and saturated:
+            self.limit = min(self.max_limit, self.limit + 1)
+
+    def snapshot(self):
+        with self._cond:
+            ordered = sorted(self._latencies)
+            latency = {}
+            if ordered:
+                p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+                latency = {
+                    "p50": round(ordered[len(ordered) // 2] * 1000, 1),
+                    "p95": round(p95 * 1000, 1),
+                }
+            data = {
+                "mode": self.mode if self.adaptive else "fixed",
+                "limit": int(self.limit),
+                "min": self.min_limit,
+                "max": self.max_limit,
+                "inflight": self.inflight,
+                "waiting": self.waiting,
+                **self.stats,
+                "latency_ms": latency,
+            }
+            if self.mode == "cpu" and self.cpu_busy is not None:
+                data["cpu_busy"] = round(self.cpu_busy, 3)
+            return data
+
+
+# stage -> (initial, max, mode)
+def _stage_defaults():
+    cores = os.cpu_count() or 1
+    return {
+        "clone": (config.CLONE_CONCURRENCY, config.CLONE_CONCURRENCY_MAX, "aimd"),
+        "parse": (cores, config.PARSE_CONCURRENCY_MAX or cores, "cpu"),
+        "upload": (config.UPLOAD_CONCURRENCY, config.UPLOAD_CONCURRENCY_MAX, "aimd"),
+    }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(stage):
+    """Limiter (dùng chung trong process) của 1 stage: clone | parse | upload."""
+    with _limiters_lock:
+        if stage not in _limiters:
+            initial, max_limit, mode = _stage_defaults()[stage]
+            _limiters[stage] = AdaptiveLimiter(
+                stage,
+                initial,
+                max_limit=max_limit,
+                mode=mode,
+                adaptive=config.ADAPTIVE_CONCURRENCY,
+            )
+        return _limiters[stage]
+
+
+def snapshot():
+    """{stage: trạng thái limiter} của các stage đã dùng trong process."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {stage: lim.snapshot() for stage, lim in limiters.items()}
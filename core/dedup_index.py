@@ -0,0 +1,164 @@
+import hashlib
+import json
+from contextlib import closing
+from datetime import datetime, timezone
+
+import config
+from .state_db import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contents (
+    content_hash TEXT PRIMARY KEY,
+    owner_repo TEXT NOT NULL,
+    file TEXT,
+    resource_address TEXT,
+    bytes INTEGER NOT NULL,
+    first_seen TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    content_hash TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    commit_sha TEXT,
+    file TEXT NOT NULL,
+    resource_address TEXT,
+    lines TEXT,
+    PRIMARY KEY (repo, file, content_hash, lines)
+);
+CREATE INDEX IF NOT EXISTS idx_refs_hash ON refs (content_hash);
+CREATE INDEX IF NOT EXISTS idx_contents_owner ON contents (owner_repo);
+"""
+
+
+def _connect():
+    conn = connect(config.DEDUP_INDEX_DB)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def content_hash(chunk):
+    """Hash nội dung block, không phụ thuộc đường dẫn (module vendored ở path khác)."""
+    raw = "\x1f".join(
+        (chunk.get("resource_type", ""), chunk.get("resource_address", ""), chunk["content"])
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def mark_shared(chunk, digest, owner):
+    """
+    Chunk có nội dung trùng module của repo khác: giữ nguyên content (document
+    trong KB phải tự đủ, không phụ thuộc repo chủ còn giữ nội dung đó), chỉ gắn
+    content_ref + shared_from để tầng truy vấn gộp kết quả trùng.
+    """
+    return {**chunk, "content_ref": digest, "shared_from": owner["owner_repo"]}
+
+
+def release_contents(conn, repo_url, files=None):
+    """
+    Nhả nội dung repo đang giữ (sau khi đã xoá ref của nó): chuyển quyền sở hữu
+    cho repo khác còn tham chiếu, nếu không còn ai thì xoá.
+    files: JSON list file (chạy incremental), None = cả repo.
+    """
+    scope = "owner_repo = ?"
+    params = [repo_url]
+    if files is not None:
+        scope += " AND file IN (SELECT value FROM json_each(?))"
+        params.append(files)
+    conn.execute(
+        f"""
+        UPDATE contents SET (owner_repo, file, resource_address) = (
+            SELECT repo, file, resource_address FROM refs
+            WHERE refs.content_hash = contents.content_hash
+            ORDER BY repo, file LIMIT 1
+        )
+        WHERE {scope} AND EXISTS (
+            SELECT 1 FROM refs WHERE refs.content_hash = contents.content_hash
+        )
+        """,
+        params,
+    )
+    conn.execute(f"DELETE FROM contents WHERE {scope}", params)
+
+
+def dedup_repo_chunks(repo_url, commit_sha, chunks, reset_files=None):
+    """
+    Dedup chunk của 1 repo sau khi normalize.
+    - Chunk trùng hoàn toàn trong cùng repo (cùng file + nội dung) bị bỏ.
+    - Chunk thuộc module (module != "none") được đăng ký trong content-hash
+      index; nếu nội dung đã thuộc về repo khác thì chunk được gắn content_ref /
+      shared_from (nội dung vẫn giữ nguyên, xem mark_shared).
+
+    reset_files: chạy incremental - chỉ xoá ref/nội dung của các file này
+        (mặc định: toàn bộ repo được phân tích lại).
+
+    Returns:
+        (chunks đã dedup, stats) với stats gồm số chunk/bytes tiết kiệm được.
+    """
+    stats = {
+        "chunks_in": len(chunks),
+        "duplicates_dropped": 0,
+        "shared_refs": 0,
+        "bytes_saved": 0,
+    }
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    seen = set()
+    result = []
+    refs = []
+
+    with closing(_connect()) as conn, conn:
+        # Repo được phân tích lại: xoá ref cũ và nhả các nội dung nó đang giữ
+        if reset_files is None:
+            conn.execute("DELETE FROM refs WHERE repo = ?", (repo_url,))
+            release_contents(conn, repo_url)
+        else:
+            files = json.dumps(sorted(reset_files))
+            conn.execute(
+                "DELETE FROM refs WHERE repo = ? AND file IN (SELECT value FROM json_each(?))",
+                (repo_url, files),
+            )
+            release_contents(conn, repo_url, files)
+
+        for chunk in chunks:
+            digest = content_hash(chunk)
+            size = len(chunk["content"].encode("utf-8"))
+
+            key = (chunk.get("file"), chunk.get("part"), chunk.get("environment"), digest)
+            if key in seen:
+                stats["duplicates_dropped"] += 1
+                stats["bytes_saved"] += size
+                continue
+            seen.add(key)
+
+            if chunk.get("module", "none") in ("none", "root"):
+                result.append(chunk)
+                continue
+
+            conn.execute(
+                "INSERT OR IGNORE INTO contents VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, repo_url, chunk.get("file"), chunk.get("resource_address"), size, now),
+            )
+            owner = conn.execute(
+                "SELECT owner_repo, file FROM contents WHERE content_hash = ?",
+                (digest,),
+            ).fetchone()
+            refs.append(
+                (
+                    digest,
+                    repo_url,
+                    commit_sha,
+                    chunk.get("file"),
+                    chunk.get("resource_address"),
+                    f"{chunk.get('lines')}#{chunk.get('part', '')}",
+                )
+            )
+
+            if owner["owner_repo"] == repo_url:
+                result.append(chunk)
+                continue
+
+            stats["shared_refs"] += 1
+            result.append(mark_shared(chunk, digest, owner))
+
+        conn.executemany("INSERT OR IGNORE INTO refs VALUES (?, ?, ?, ?, ?, ?)", refs)
+
+    stats["chunks_out"] = len(result)
+    return result, stats
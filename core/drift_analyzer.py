@@ -1,98 +1,796 @@
+import os
 import re
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
 import config
-from core.bedrock_sync import sync_data_source_by_repo
-from .s3_uploader import clear_repo_output_in_s3, upload_folder_to_s3
-from .git_handler import clone_or_pull
-from .terraform_parser import process_directory
-from .jsonl_writer import write_jsonl_safely
+from .checkpoints import (
+    clear_checkpoints,
+    finish_run,
+    get_run,
+    load_checkpoints,
+    save_checkpoint,
+    start_run,
+)
+from .chunk_store import load_repo_chunks, upsert_repo_chunks
+from .concurrency import is_throttle_error, limiter, snapshot as concurrency_snapshot
+from .dedup_index import dedup_repo_chunks
+from .git_handler import (
+    clone_blobless,
+    clone_or_pull,
+    describe_checkout,
+    iter_terraform_blobs,
+    local_checkout,
+    local_head,
+    resolve_remote_head,
+)
+from .module_graph import (
+    affected_dirs,
+    build_module_graph,
+    load_graph,
+    rel_dir,
+    rewired_dirs,
+    save_graph,
+)
+from .terraform_parser import (
+    load_blob_sources,
+    load_directory_sources,
+    process_sources,
+)
+from .search_index import on_repo_written
+from .result_cache import get_cached_result, store_result
+from .parquet_export import ParquetExporter
+from .sinks import make_sink
+from .workspace import (
+    job_workspace,
+    prune_workspaces,
+    release_workspace,
+    repo_key,
+    repo_lock,
+)
 
 
 def extract_owner_repo(repo_url: str):
-    """Lấy owner và repo name từ URL GitHub."""
+    """
+    Lấy owner và repo name từ URL GitHub.
+    URL khác (file://, đường dẫn local, git server nội bộ): owner "unknown",
+    repo name = tên thư mục/URL cuối cùng.
+    """
     match = re.search(
         r"github\.com[:/](?P<owner>[^/]+)/(?P<repo>[^/]+?)(?:\.git)?$", repo_url
     )
     if match:
         return match.group("owner"), match.group("repo")
-    return "unknown", "unknown"
+    name = re.sub(r"\.git$", "", repo_url.rstrip("/").split("/")[-1])
+    return "unknown", name or "unknown"
 
 
-def normalize_chunk(chunk, repo_url, commit_sha, timestamp):
-    """Chuẩn hoá 1 resource block về format chuẩn."""
+def repo_context(repo_url, commit_sha, timestamp):
+    """Các field giống nhau cho mọi chunk của 1 repo - tính 1 lần mỗi lần chạy."""
     owner, repo_name = extract_owner_repo(repo_url)
-
     return {
         "repo": repo_url,
+        "repo_name": repo_name,
         "commit": commit_sha,
-        "file": chunk.get("file", "unknown"),
+        "owner": owner,
+        "update_at": timestamp,
+        "schema": config.CHUNK_SCHEMA_VERSION,
+    }
+
+
+def logical_path(file_path, repo_dir, file_root):
+    """Đổi đường dẫn trong workspace của job về đường dẫn ổn định dưới file_root."""
+    if file_root and file_path.startswith(repo_dir):
+        return file_root + file_path[len(repo_dir) :]
+    return file_path
+
+
+def normalize_chunk(chunk, context):
+    """
+    Chuẩn hoá 1 resource block về format chuẩn.
+
+    context: kết quả repo_context() (+ repo_dir/file_root nếu clone vào
+    workspace của job). Schema 2 (compact) giữ mỗi field 1 lần;
+    schema 1 giữ format cũ (account + metadata lặp lại repo/commit/owner/region).
+    """
+    region = chunk.get("region", "unknown")
+    normalized = {
+        "repo": context["repo"],
+        "commit": context["commit"],
+        "file": logical_path(
+            chunk.get("file", "unknown"),
+            context.get("repo_dir", ""),
+            context.get("file_root"),
+        ),
         "lines": chunk.get("lines", "0-0"),
         "resource_address": chunk.get("resource_address", "unknown"),
         "resource_type": chunk.get("resource_type", "unknown"),
         "module": chunk.get("module", "root"),
-        "account": owner,
-        "region": chunk.get("region", "unknown"),
+        "region": region,
         "content": chunk.get("content", ""),
         "type": "iac_configuration",
         "id": str(uuid.uuid1()),
-        "update_at": timestamp,
-        "owner": owner,
-        "metadata": {
-            "repo": repo_url,
-            "commit": commit_sha,
-            "owner": owner,
-            "region": chunk.get("region", "unknown"),
-            "account": owner,
-        },
+        "update_at": context["update_at"],
+        "owner": context["owner"],
     }
+    if context["schema"] >= 2:
+        normalized["schema"] = context["schema"]
+    else:
+        normalized["account"] = context["owner"]
+        normalized["metadata"] = {
+            "repo": context["repo"],
+            "commit": context["commit"],
+            "owner": context["owner"],
+            "region": region,
+            "account": context["owner"],
+        }
+    # Chunk gộp/chia bởi token budget: giữ address + lines của từng block gốc;
+    # chunk fan-out theo môi trường giữ tên môi trường
+    for key in ("members", "part", "environment"):
+        if key in chunk:
+            normalized[key] = chunk[key]
+    return normalized
 
 
-def run_drift_analyzer(repos):
-    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-    all_chunks = []
-    bucket_name = config.OUTPUT_S3_BUCKET
+@contextmanager
+def track_stage(on_event, repo_url, stage):
+    """
+    Đo thời gian 1 stage của 1 repo, phát event start/done/failed qua on_event.
+    Block bên trong ghi thêm thông tin (số chunk, số file...) vào dict được
+    yield; đặt info["status"] = "failed" để đánh dấu lỗi không raise exception.
+    """
+    emit(on_event, "stage", repo=repo_url, stage=stage, status="start")
+    started = time.perf_counter()
+    info = {}
+    try:
+        yield info
+    except Exception as e:
+        info["status"] = "failed"
+        info["error"] = str(e)
+        raise
+    finally:
+        emit(
+            on_event,
+            "stage",
+            repo=repo_url,
+            stage=stage,
+            status=info.pop("status", "done"),
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+            **info,
+        )
+
+
+def emit(on_event, event, **data):
+    """Gửi 1 progress event (dict) cho callback nếu có."""
+    if on_event is not None:
+        on_event({"event": event, **data})
+
+
+def before_stage(run, repo_url, stage):
+    """Gọi hook before_stage của run (nếu có) trước 1 stage ghi ra ngoài."""
+    if run["before_stage"] is not None:
+        run["before_stage"](repo_url, stage)
+
+
+def parse_repo(
+    repo_url,
+    repo_dir,
+    commit_sha,
+    blob_mode,
+    changed=None,
+    file_root=None,
+    environments=None,
+):
+    """
+    Load + chunk 1 repo theo module graph.
 
-    for repo_url in repos:
-        repo_dir, commit_sha = clone_or_pull(repo_url)
-        print(f"🔍 Processing repo: {repo_url} @ {commit_sha}")
+    file_root: gốc đường dẫn file trong chunk đã lưu (khác repo_dir khi clone
+    vào workspace của job, xem logical_path).
 
+    changed: list file (path tương đối repo) đã thay đổi. Khi có và đã lưu
+    graph từ lần chạy trước, chỉ các thư mục bị ảnh hưởng (module đổi + các
+    module phụ thuộc) được parse lại; chunk của phần còn lại lấy từ chunk store.
+
+    environments: {tên: đường dẫn .tfvars tương đối repo} - mỗi file parse 1
+    lần, chunk sinh ra cho từng môi trường (xem chunk_source_envs).
+
+    Returns:
+        dict: chunks (mới), reused (tái sử dụng), only_dirs (thư mục đã parse
+        lại, None = toàn bộ), stale_files (file cũ thuộc các thư mục đó - để
+        reset dedup index), quarantined (file vượt budget parse).
+    """
+    old_graph = load_graph(repo_url) if changed is not None else None
+    only_dirs = affected_dirs(old_graph, changed) if old_graph else None
+    stored = load_repo_chunks(repo_url) if only_dirs is not None else []
+    if any(c.get("schema", 1) != config.CHUNK_SCHEMA_VERSION for c in stored) or (
+        stored
+        and {c.get("environment") for c in stored} != set(environments or [None])
+    ):
+        # Chunk cũ khác schema / bộ môi trường hiện tại -> không tái sử dụng,
+        # parse lại toàn bộ
+        only_dirs, stored = None, []
+
+    def load(dirs):
+        if blob_mode:
+            return load_blob_sources(iter_terraform_blobs(repo_dir), repo_dir, dirs)
+        return load_directory_sources(repo_dir, dirs)
+
+    sources = load(only_dirs)
+    graph = build_module_graph(repo_dir, sources, old_graph, only_dirs)
+    if only_dirs is not None:
+        # Module call thêm / bỏ hoặc region đổi trong file vừa sửa: module ở
+        # thư mục khác (không đổi file) có thể kế thừa context mới
+        extra = rewired_dirs(old_graph, graph, only_dirs)
+        if extra:
+            print(f"🔗 Module graph đổi, phân tích lại thêm: {sorted(extra)}")
+            sources += load(extra)
+            only_dirs = only_dirs | extra
+            graph = build_module_graph(repo_dir, sources, old_graph, only_dirs)
+    if environments:
+        environments = {
+            env: os.path.join(repo_dir, path) for env, path in environments.items()
+        }
+    chunks = process_sources(sources, repo_dir, graph=graph, environments=environments)
+    save_graph(repo_url, commit_sha, graph)
+
+    reused, stale_files = [], set()
+    if only_dirs is not None:
+        for chunk in stored:
+            if rel_dir(file_root or repo_dir, chunk["file"]) in only_dirs:
+                stale_files.add(chunk["file"])
+            else:
+                reused.append(restamp_chunk(chunk, commit_sha))
+
+    quarantined = [
+        {
+            "file": logical_path(s["file_path"], repo_dir, file_root),
+            "reason": s["quarantined"],
+            "blob_hash": s["blob_hash"],
+        }
+        for s in sources
+        if s.get("quarantined")
+    ]
+    return {
+        "chunks": chunks,
+        "reused": reused,
+        "only_dirs": only_dirs,
+        "stale_files": stale_files,
+        "quarantined": quarantined,
+    }
+
+
+def restamp_chunk(chunk, commit_sha):
+    """Chunk của file không đổi: giữ nguyên nội dung, gắn commit mới."""
+    chunk = {**chunk, "commit": commit_sha}
+    if "metadata" in chunk:
+        chunk["metadata"] = {**chunk["metadata"], "commit": commit_sha}
+    return chunk
+
+
+def lookup_cached_run(repo_url, branch=None, commit=None):
+    """
+    Kiểm tra cache trước khi clone: `ls-remote` lấy HEAD của remote (hoặc của
+    `branch`; bỏ qua nếu đã biết `commit`), tra (repo, commit, analyzer
+    version) trong result cache.
+    Chỉ tính là hit khi chunk store còn đủ chunk của đúng commit đó
+    (chunk store chỉ giữ bản mới nhất của mỗi repo).
+
+    Returns:
+        {"summary": ..., "chunks": [...], "head": SHA đầy đủ} hoặc None.
+    """
+    remote_sha = commit or resolve_remote_head(repo_url, branch)
+    if remote_sha is None:
+        return None
+    summary = get_cached_result(repo_url, remote_sha)
+    if summary is None:
+        return None
+    chunks = load_repo_chunks(repo_url, summary["commit"])
+    if len(chunks) != summary["chunks"]:
+        return None
+    return {"summary": summary, "chunks": chunks, "head": remote_sha}
+
+
+def analyze_repo(repo_url, run):
+    """
+    Clone -> parse -> write -> upload -> sync cho 1 repo, giữ repo lock suốt
+    quá trình và dùng workspace/output riêng của job (core/workspace.py).
+    Mỗi stage xong được ghi checkpoint; run được chạy lại (cùng run_id) bắt
+    đầu từ stage chưa xong đầu tiên (xem core/checkpoints.py).
+
+    run: trạng thái chung của lần chạy (xem run_drift_analyzer).
+
+    Returns:
+        dict: chunks, cached (summary nếu cache hit), dedup, quarantined,
+        resumed (stage đã xong từ lần chạy trước, None nếu chạy mới),
+        head (SHA đầy đủ đã phân tích xong hết các stage; None nếu lỗi giữa
+        chừng hoặc checkout local).
+    """
+    on_event = run["on_event"]
+    report = {
+        "chunks": [],
+        "cached": None,
+        "dedup": None,
+        "quarantined": [],
+        "resumed": None,
+        "head": None,
+    }
+    owner, repo_name = extract_owner_repo(repo_url)
+    key = repo_key(owner, repo_name, repo_url)
+    checkout_dir = local_checkout(repo_url)
+
+    with repo_lock(key):
+        done = resumable_checkpoints(repo_url, run)
+        if "done" in done:
+            print(f"⏩ {repo_url} đã xong trong lần chạy trước của run này, bỏ qua")
+            emit(on_event, "stage", repo=repo_url, stage="done", status="resumed")
+            report["chunks"] = load_repo_chunks(repo_url, done["done"]["commit"])
+            report["resumed"] = "done"
+            report["head"] = done["done"].get("head")
+            return report
+
+        if run["use_cache"] and checkout_dir is None and not done:
+            with track_stage(on_event, repo_url, "cache") as stage:
+                hit = lookup_cached_run(repo_url, **run["refs"].get(repo_url, {}))
+                stage["hit"] = hit is not None
+                if hit is not None:
+                    stage["commit"] = hit["summary"]["commit"]
+            if hit is not None:
+                summary = hit["summary"]
+                print(
+                    f"⚡ Cache hit: {repo_url} @ {summary['commit']} "
+                    f"(analyzed {summary['analyzed_at']}), skip clone/upload/sync"
+                )
+                report["chunks"] = hit["chunks"]
+                report["cached"] = {"repo": repo_url, **summary}
+                report["head"] = hit["head"]
+                return report
+
+        workspace = None if checkout_dir else job_workspace(key, run["run_id"][:8])
+        try:
+            return _analyze_checkout(
+                repo_url, run, report, key, checkout_dir, workspace, done
+            )
+        finally:
+            release_workspace(workspace)
+
+
+def resumable_checkpoints(repo_url, run):
+    """
+    Checkpoint của repo từ lần chạy trước của run (rỗng nếu run mới). Bỏ hết
+    nếu chunk store không còn đúng số chunk của stage write (repo đã được
+    phân tích lại bởi run khác) -> làm lại từ đầu.
+    """
+    done = run["resumed"].get(repo_url, {})
+    written = done.get("write")
+    if written and len(load_repo_chunks(repo_url, written["commit"])) != written["chunks"]:
+        print(f"⚠️ Chunk store của {repo_url} đã thay đổi, không resume được")
+        clear_checkpoints(run["run_id"], repo_url)
+        return {}
+    if "write" not in done:
+        # Chưa ghi gì: chỉ giữ checkpoint clone (workspace có thể còn nguyên)
+        done = {k: v for k, v in done.items() if k == "clone"}
+    return done
+
+
+def _analyze_checkout(repo_url, run, report, key, checkout_dir, workspace, done):
+    sink = run["sink"]
+
+    if "write" in done:
+        written = done["write"]
+        print(
+            f"⏩ Resume {repo_url} @ {written['commit']}: "
+            f"bỏ qua clone/parse/write ({written['chunks']} chunks đã ghi)"
+        )
+        emit(
+            run["on_event"],
+            "stage",
+            repo=repo_url,
+            stage="write",
+            status="resumed",
+            chunks=written["chunks"],
+        )
+        report["chunks"] = load_repo_chunks(repo_url, written["commit"])
+        report["quarantined"] = [
+            {"repo": repo_url, **q} for q in written.get("quarantined", [])
+        ]
+        report["resumed"] = "write"
+        state = written
+        if sink.publishes and "upload" not in done:
+            # Staging output của lần trước có thể đã mất: ghi lại từ chunk store
+            before_stage(run, repo_url, "write")
+            sink.write(written["repo_name"], report["chunks"], written["out_key"])
+    else:
+        state = _clone_parse_write(repo_url, run, report, key, checkout_dir, workspace, done)
+        if state is None:
+            return report
+
+    if sink.publishes and not _publish(repo_url, run, report, state, done, checkout_dir):
+        return report
+    save_checkpoint(
+        run["run_id"],
+        repo_url,
+        "done",
+        {"commit": state["commit"], "chunks": state["chunks"], "head": state["head"]},
+    )
+    report["head"] = state["head"]
+    return report
+
+
+def _clone_parse_write(repo_url, run, report, key, checkout_dir, workspace, done):
+    """Stage clone -> parse -> write. Returns: dict giống checkpoint "write", None nếu clone lỗi."""
+    on_event, sink = run["on_event"], run["sink"]
+
+    with track_stage(on_event, repo_url, "clone") as stage:
+        cloned = done.get("clone")
+        if checkout_dir is not None:
+            # Checkout local (CI, máy dev): đọc thẳng working tree
+            repo_dir, commit_sha = checkout_dir, describe_checkout(checkout_dir)
+            stage["local"] = True
+        elif (
+            cloned
+            and os.path.isdir(workspace)
+            and local_head(workspace) == cloned["head"]
+        ):
+            # Workspace của run (cùng run_id) còn nguyên sau khi bị gián đoạn
+            repo_dir, commit_sha = workspace, cloned["commit"]
+            stage["status"] = "resumed"
+        else:
+            with limiter("clone").slot(key=repo_url) as slot:
+                clone = clone_blobless if run["blob_mode"] else clone_or_pull
+                repo_dir, commit_sha = clone(
+                    repo_url, workspace, **run["refs"].get(repo_url, {})
+                )
+                slot["error"] = repo_dir is None
+            if repo_dir is not None:
+                save_checkpoint(
+                    run["run_id"],
+                    repo_url,
+                    "clone",
+                    {"commit": commit_sha, "head": local_head(repo_dir)},
+                )
+        stage["commit"] = commit_sha
         if repo_dir is None:
-            print(f"⚠️ Bỏ qua {repo_url} vì clone thất bại.\n")
-            continue
+            stage["status"] = "failed"
+    print(f"🔍 Processing repo: {repo_url} @ {commit_sha}")
 
-        chunks = process_directory(repo_dir)
-        normalized_chunks = []
+    if repo_dir is None:
+        print(f"⚠️ Bỏ qua {repo_url} vì clone thất bại.\n")
+        return None
 
-        for chunk in chunks:
-            normalized = normalize_chunk(chunk, repo_url, commit_sha, timestamp)
-            normalized_chunks.append(normalized)
-            all_chunks.append(normalized)
+    context = repo_context(repo_url, commit_sha, run["timestamp"])
+    # Đường dẫn file trong chunk không phụ thuộc workspace của job:
+    # repos/<repo>/... như trước (checkout local giữ đường dẫn thật)
+    context["repo_dir"] = repo_dir
+    context["file_root"] = checkout_dir or os.path.join(
+        config.BASE_REPO_DIR, context["repo_name"]
+    )
 
-        # Ghi ra thư mục riêng theo repo
-        _, repo_name = extract_owner_repo(repo_url)
-        repo_output_dir = f"output/{repo_name}"
-        write_jsonl_safely(normalized_chunks, repo_output_dir, base_name=repo_name)
-        print(f"📄 {len(normalized_chunks)} chunks written to {repo_output_dir}")
+    with track_stage(on_event, repo_url, "parse") as stage:
+        with limiter("parse").slot():
+            parsed = parse_repo(
+                repo_url,
+                repo_dir,
+                commit_sha,
+                run["blob_mode"] and checkout_dir is None,
+                (run["changed_files"] or {}).get(repo_url),
+                context["file_root"],
+                run["environments"],
+            )
+        reused, only_dirs = parsed["reused"], parsed["only_dirs"]
+        if parsed["quarantined"]:
+            stage["quarantined"] = parsed["quarantined"]
+            report["quarantined"] = [{"repo": repo_url, **q} for q in parsed["quarantined"]]
+        if only_dirs is not None:
+            stage["reanalyzed_dirs"] = sorted(only_dirs)
+            stage["reused_chunks"] = len(reused)
+            print(
+                f"🧭 Incremental: {len(only_dirs)} dir(s) re-analyzed, "
+                f"{len(reused)} chunk(s) reused"
+            )
+        normalized_chunks = [
+            normalize_chunk(chunk, context) for chunk in parsed["chunks"]
+        ]
 
-        # ✅ Clear S3 output chỉ cho repo này
-        clear_repo_output_in_s3(bucket_name, repo_name)
+        if config.DEDUP_ENABLED:
+            reset_files = None
+            if only_dirs is not None:
+                reset_files = parsed["stale_files"] | {c["file"] for c in normalized_chunks}
+            normalized_chunks, dedup_stats = dedup_repo_chunks(
+                repo_url, commit_sha, normalized_chunks, reset_files
+            )
+            print(
+                f"🧹 Dedup: -{dedup_stats['duplicates_dropped']} duplicate(s), "
+                f"{dedup_stats['shared_refs']} shared module ref(s), "
+                f"{dedup_stats['bytes_saved'] / 1024:.1f} KB saved"
+            )
+            stage["dedup"] = dedup_stats
+            report["dedup"] = dedup_stats
 
-        # ✅ Upload lại dữ liệu mới
-        upload_prefix = f"iac_config/{repo_name}"
-        result = upload_folder_to_s3(repo_output_dir, bucket_name, upload_prefix)
+        normalized_chunks.extend(reused)
+        report["chunks"] = normalized_chunks
+        stage["chunks"] = len(normalized_chunks)
 
-        if result["status"] == "success":
-            print(f"☁️ Upload hoàn tất: {len(result['uploaded'])} file(s)\n")
+    # Ghi ra thư mục riêng theo owner/repo/commit
+    repo_name = context["repo_name"]
+    out_key = f"{key}/{commit_sha}"
+    before_stage(run, repo_url, "write")
+    with track_stage(on_event, repo_url, "write") as stage:
+        stage.update(sink.write(repo_name, normalized_chunks, out_key))
+
+        # 🗄️ Upsert vào chunk store cục bộ (phục vụ /chunks)
+        upsert_repo_chunks(repo_url, normalized_chunks, run["run_id"])
+        on_repo_written(repo_url, normalized_chunks, run["run_id"])
+        if run["exporter"]:
+            run["exporter"].write_repo(key, normalized_chunks)
+
+    state = {
+        "commit": commit_sha,
+        "head": None if checkout_dir else local_head(repo_dir),
+        "repo_name": repo_name,
+        "out_key": out_key,
+        "chunks": len(normalized_chunks),
+        "quarantined": parsed["quarantined"],
+    }
+    save_checkpoint(run["run_id"], repo_url, "write", state)
+    return state
+
+
+def _publish(repo_url, run, report, state, done, checkout_dir):
+    """
+    Stage upload -> sync (sink publishes), bỏ qua stage đã có checkpoint.
+    Returns: True nếu repo đã publish xong (upload + sync).
+    """
+    on_event, sink = run["on_event"], run["sink"]
+    out_key = state["out_key"]
+    key = out_key.rsplit("/", 1)[0]  # out_key = <repo key>/<commit>
+
+    try:
+        if "upload" in done:
+            uploaded = done["upload"]["files"]
+            emit(on_event, "stage", repo=repo_url, stage="upload", status="resumed")
         else:
-            print(f"⚠️ Upload thất bại: {result['error']}\n")
-            continue
+            before_stage(run, repo_url, "upload")
+            with track_stage(on_event, repo_url, "upload") as stage:
+                with limiter("upload").slot(key=repo_url) as slot:
+                    result = sink.upload(key, out_key)
+                    slot["error"] = result["status"] != "success"
+                    slot["throttled"] = is_throttle_error(result.get("error"))
+                stage["files"] = len(result["uploaded"])
+
+                if result["status"] == "success":
+                    print(f"☁️ Upload hoàn tất: {len(result['uploaded'])} file(s)\n")
+                else:
+                    print(f"⚠️ Upload thất bại: {result['error']}\n")
+                    stage["status"] = "failed"
+                    stage["error"] = result["error"]
+            if result["status"] != "success":
+                return False
+            uploaded = result["uploaded"]
+            save_checkpoint(run["run_id"], repo_url, "upload", {"files": uploaded})
 
         # 🤖 Sync vào Amazon Bedrock KB
-        s3_repo_path = f"s3://{bucket_name}/{upload_prefix}/"
-        sync_result = sync_data_source_by_repo(s3_repo_path)
-        print(f"🤖 Bedrock Sync Result:", sync_result, "\n")
+        if "sync" in done:
+            sync_result = done["sync"]
+            emit(on_event, "stage", repo=repo_url, stage="sync", status="resumed")
+        else:
+            before_stage(run, repo_url, "sync")
+            with track_stage(on_event, repo_url, "sync") as stage:
+                sync_result = sink.sync(key)
+                stage["ingestion_job_id"] = sync_result.get("ingestion_job_id")
+                if sync_result.get("status") == "skipped":
+                    stage["status"] = "skipped"
+                print(f"🤖 Bedrock Sync Result:", sync_result, "\n")
+            save_checkpoint(
+                run["run_id"],
+                repo_url,
+                "sync",
+                {
+                    "status": sync_result.get("status"),
+                    "ingestion_job_id": sync_result.get("ingestion_job_id"),
+                },
+            )
+    finally:
+        sink.release(out_key)
+
+    # Chỉ cache khi ingestion job chạy trên dữ liệu vừa upload
+    # ("already_running" = job cũ, có thể chưa thấy dữ liệu mới); cache không
+    # phân biệt bộ môi trường nên bỏ qua khi fan-out tfvars
+    if (
+        checkout_dir is None
+        and state["head"]
+        and not run["environments"]
+        and sync_result.get("status") == "STARTED"
+    ):
+        store_result(
+            repo_url,
+            state["head"],
+            {
+                "commit": state["commit"],
+                "chunks": state["chunks"],
+                "files": len(uploaded),
+                "ingestion_job_id": sync_result["ingestion_job_id"],
+                "quarantined": state["quarantined"],
+            },
+        )
+    return True
+
+
+def run_drift_analyzer(
+    repos,
+    fetch_mode=None,
+    on_event=None,
+    changed_files=None,
+    use_cache=None,
+    sink=None,
+    parquet_path=None,
+    environments=None,
+    run_id=None,
+    refs=None,
+    before_stage=None,
+    collect=True,
+):
+    """
+    fetch_mode: "worktree" (clone + walk thư mục) hoặc "blobs" (blobless clone,
+    stream blob Terraform từ git object store). Mặc định lấy config.GIT_FETCH_MODE.
+    on_event: callback nhận progress event (dict) của từng stage:
+        {"event": "stage", "repo", "stage", "status", "elapsed_ms", ...}
+    và cuối cùng {"event": "summary", ...}.
+    changed_files: {repo_url: [path đã đổi]} - phân tích lại incremental
+    (xem parse_repo); repo không có trong dict được phân tích toàn bộ.
+    use_cache: bỏ qua repo có HEAD trùng lần phân tích thành công trước đó
+    (xem lookup_cached_run). Mặc định config.RESULT_CACHE_ENABLED; chỉ áp dụng
+    cho sink publish ra ngoài (s3) và repo clone từ remote.
+    sink: tên sink hoặc object sink (core/sinks.py), mặc định config.OUTPUT_SINK.
+    repos có thể là đường dẫn local / file:// tới 1 checkout: phân tích tại chỗ,
+    không clone.
+    parquet_path: thư mục dataset Parquet, ghi thêm chunk của mỗi repo ra
+    <parquet_path>/<repo key>.parquet (core/parquet_export.py), mặc
+    định config.PARQUET_EXPORT_PATH; rỗng = tắt.
+    environments: {tên môi trường: đường dẫn .tfvars tương đối repo}, mặc định
+    config.TFVARS_ENVIRONMENTS. Mỗi repo được parse 1 lần và sinh chunk cho
+    từng môi trường (field "environment"); result cache bị tắt.
+
+    refs: {repo_url: {"branch": ..., "commit": SHA đầy đủ}} - clone đúng nhánh /
+    commit thay vì HEAD hiện tại của default branch (webhook push).
+    run_id: id của run (mặc định sinh mới). Truyền lại run_id của 1 run bị
+    gián đoạn để chạy tiếp: repo đã xong được bỏ qua, repo dở dang bắt đầu
+    từ stage chưa có checkpoint đầu tiên (core/checkpoints.py). repos rỗng ->
+    dùng lại danh sách repo của run đó.
+    before_stage: callable(repo_url, stage) gọi trước các stage ghi ra ngoài
+    (write, upload, sync); raise để dừng run (vd. worker đã mất lease của job).
+    collect: trả về list chunk của mọi repo (giữ trong RAM tới hết run).
+    False -> trả về [] và bỏ chunk của từng repo ngay khi repo xong (chạy cả
+    fleet); số chunk vẫn có trong event summary.
 
-    print(f"✅ Done. Tổng cộng {len(all_chunks)} chunks đã upload lên S3.")
+    An toàn khi gọi song song (nhiều request / worker): mỗi repo được khoá
+    riêng và mỗi job clone vào workspace của nó (xem analyze_repo).
+    Các repo được xử lý song song (tối đa REPO_CONCURRENCY); số clone / parse /
+    upload chạy cùng lúc do limiter thích ứng của từng stage quyết định
+    (core/concurrency.py).
+    """
+    run_started = time.perf_counter()
+    if sink is None or isinstance(sink, str):
+        sink = make_sink(sink)
+    if use_cache is None:
+        use_cache = config.RESULT_CACHE_ENABLED
+    parquet_path = parquet_path or config.PARQUET_EXPORT_PATH
+    if environments is None:
+        environments = config.TFVARS_ENVIRONMENTS
+    resumed = {}
+    if run_id:
+        previous = get_run(run_id)
+        if previous is not None:
+            repos = repos or previous["repos"]
+            resumed = load_checkpoints(run_id)
+            print(
+                f"♻️ Resume run {run_id} ({previous['status']}): "
+                f"{len(resumed)}/{len(repos)} repo(s) có checkpoint"
+            )
+    run_id = run_id or str(uuid.uuid4())
+    # Báo run_id trước khi chạy: run lỗi giữa chừng vẫn resume được
+    print(f"🆔 Run {run_id} ({len(repos)} repo(s))")
+    emit(on_event, "run", run_id=run_id, repos=len(repos), resumed=bool(resumed))
+    run = {
+        "run_id": run_id,
+        "resumed": resumed,
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "on_event": on_event,
+        "sink": sink,
+        "use_cache": use_cache and sink.publishes and not environments,
+        "blob_mode": (fetch_mode or config.GIT_FETCH_MODE) == "blobs",
+        "changed_files": changed_files,
+        "refs": refs or {},
+        "environments": environments or None,
+        "exporter": None,
+        "before_stage": before_stage,
+    }
+    all_chunks = []
+    dedup_totals = {"chunks_saved": 0, "bytes_saved": 0}
+    quarantined = []
+    cached = []
+    commits = {}
+    resumed_repos = 0
+    prune_workspaces()
+    start_run(
+        run_id,
+        repos,
+        {
+            "fetch_mode": fetch_mode,
+            "sink": sink.name,
+            "environments": run["environments"],
+        },
+    )
+
+    def run_repo(repo_url):
+        report = analyze_repo(repo_url, run)
+        if (report["cached"] or report["resumed"]) and run["exporter"]:
+            key = repo_key(*extract_owner_repo(repo_url), repo_url)
+            run["exporter"].write_repo(key, report["chunks"])
+        report["chunk_count"] = len(report["chunks"])
+        if not collect:
+            report["chunks"] = []  # không giữ chunk của cả fleet trong RAM
+        return report
+
+    workers = max(1, min(config.REPO_CONCURRENCY, len(repos)))
+    try:
+        if parquet_path:
+            run["exporter"] = ParquetExporter(parquet_path)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="repo") as pool:
+            # map giữ thứ tự repos -> output giống chạy tuần tự
+            reports = list(pool.map(run_repo, repos))
+        if run["exporter"]:
+            run["exporter"].close()
+    except BaseException:
+        finish_run(run_id, "failed")
+        if run["exporter"]:
+            run["exporter"].abort()
+        raise
+    finish_run(run_id)
+
+    total_chunks = 0
+    for repo_url, report in zip(repos, reports):
+        if report["head"]:
+            commits[repo_url] = report["head"]
+        all_chunks.extend(report["chunks"])
+        total_chunks += report["chunk_count"]
+        quarantined.extend(report["quarantined"])
+        if report["resumed"]:
+            resumed_repos += 1
+        if report["cached"]:
+            cached.append(report["cached"])
+        if report["dedup"]:
+            dedup_totals["chunks_saved"] += report["dedup"]["duplicates_dropped"]
+            dedup_totals["bytes_saved"] += report["dedup"]["bytes_saved"]
+
+    print(f"✅ Done. Tổng cộng {total_chunks} chunks → sink '{sink.name}'.")
+    if config.DEDUP_ENABLED:
+        print(
+            f"🧹 Dedup: {dedup_totals['chunks_saved']} chunk(s), "
+            f"{dedup_totals['bytes_saved'] / 1024:.1f} KB saved this run"
+        )
+    if resumed_repos:
+        print(f"⏩ {resumed_repos} repo(s) resumed from run {run_id} checkpoints")
+    if cached:
+        print(f"⚡ {len(cached)} repo(s) served from result cache")
+    if quarantined:
+        print(f"🚧 {len(quarantined)} file(s) quarantined (parse budget exceeded):")
+        for q in quarantined:
+            print(f"   - {q['repo']} {q['file']} ({q['reason']})")
+    emit(
+        on_event,
+        "summary",
+        run_id=run_id,
+        repos=len(repos),
+        chunks=total_chunks,
+        dedup=dedup_totals,
+        quarantined=quarantined,
+        cached=cached,
+        resumed=resumed_repos,
+        commits=commits,
+        concurrency=concurrency_snapshot(),
+        elapsed_ms=round((time.perf_counter() - run_started) * 1000, 1),
+    )
     return all_chunks
@@ -1,10 +1,13 @@
 import os
 import shutil
 import stat
-from git import Repo, GitCommandError
 import config
 
 BASE_REPO_DIR = config.BASE_REPO_DIR
+TERRAFORM_EXTENSIONS = config.TERRAFORM_EXTENSIONS
+
+# Số blob tối đa cho 1 lệnh `git fetch` prefetch (tránh command line quá dài)
+PREFETCH_BATCH_SIZE = 500
 
 
 def remove_readonly(func, path, _):
@@ -22,17 +25,42 @@ def safe_rmtree(path):
         shutil.rmtree(path, onerror=remove_readonly)
 
 
-def clone_or_pull(repo_url: str):
+def pin_commit(repo, commit_sha, bare=False):
+    """
+    Đưa HEAD của bản clone shallow về đúng `commit_sha` (SHA đầy đủ, vd. commit
+    trong webhook push): HEAD của nhánh có thể đã đi tiếp từ lúc push. Fetch
+    riêng commit đó nếu chưa có (GitHub cho fetch SHA đã push lên).
+    """
+    if repo.head.commit.hexsha == commit_sha:
+        return
+    print(f"📌 Pin {commit_sha[:7]} (HEAD remote đang ở {repo.head.commit.hexsha[:7]})")
+    options = ["--depth=1", "--no-tags"]
+    if bare:
+        options.append("--filter=blob:none")
+    repo.git.fetch(*options, "origin", commit_sha)
+    if bare:
+        repo.git.update_ref("--no-deref", "HEAD", commit_sha)
+    else:
+        repo.git.checkout("--detach", commit_sha)
+
+
+def clone_or_pull(repo_url: str, local_path=None, branch=None, commit=None):
     """
     CHỈ dành cho GitHub public repos.
+    - local_path: thư mục clone (workspace riêng của job, xem core/workspace.py);
+      mặc định repos/<repo_name> như trước.
+    - branch / commit: clone nhánh `branch` (mặc định default branch) và
+      checkout đúng `commit` nếu có (xem pin_commit).
     - Repo tồn tại -> XÓA -> CLONE.
     - Clone shallow depth=1 để phân tích drift.
     - Hoạt động đúng trên cả Windows & Linux.
     """
+    from git import GitCommandError, Repo
+
     os.makedirs(BASE_REPO_DIR, exist_ok=True)
 
     repo_name = repo_url.rstrip("/").split("/")[-1].replace(".git", "")
-    local_path = os.path.join(BASE_REPO_DIR, repo_name)
+    local_path = local_path or os.path.join(BASE_REPO_DIR, repo_name)
 
     try:
         # Always re-clone
@@ -41,9 +69,12 @@ def clone_or_pull(repo_url: str):
             safe_rmtree(local_path)
 
         print(f"🔹 Cloning {repo_name} (depth=1)...")
-        Repo.clone_from(repo_url, local_path, depth=1)  # ✅ always shallow clone
+        options = {"branch": branch} if branch else {}
+        Repo.clone_from(repo_url, local_path, depth=1, **options)  # ✅ always shallow clone
 
         repo = Repo(local_path)
+        if commit:
+            pin_commit(repo, commit)
         commit_sha = repo.head.commit.hexsha[:7]
         print(f"✅ Clone OK: {repo_name} @ {commit_sha}")
         return local_path, commit_sha
@@ -54,3 +85,186 @@ def clone_or_pull(repo_url: str):
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
         return None, None
+
+
+def clone_blobless(repo_url: str, local_path=None, branch=None, commit=None):
+    """
+    Blobless clone để đọc Terraform trực tiếp từ git object store.
+    - `--bare --filter=blob:none --depth=1`: chỉ tải commit + tree, bare repo
+      nên không có working tree, không tải blob (docs, binary, lambda zip...).
+    - Blob cần thiết được stream sau bằng `iter_terraform_blobs`.
+    Trả về (local_path, commit_sha) giống `clone_or_pull` (cùng tham số
+    local_path, branch, commit).
+    """
+    from git import GitCommandError, Repo
+
+    os.makedirs(BASE_REPO_DIR, exist_ok=True)
+
+    repo_name = repo_url.rstrip("/").split("/")[-1].replace(".git", "")
+    local_path = local_path or os.path.join(BASE_REPO_DIR, repo_name)
+
+    try:
+        if os.path.exists(local_path):
+            print(f"♻️  Removing old repo: {repo_name}")
+            safe_rmtree(local_path)
+
+        print(f"🔹 Blobless cloning {repo_name} (depth=1, bare)...")
+        options = {"branch": branch} if branch else {}
+        Repo.clone_from(
+            repo_url,
+            local_path,
+            depth=1,
+            bare=True,
+            multi_options=["--filter=blob:none"],
+            **options,
+        )
+
+        repo = Repo(local_path)
+        if commit:
+            pin_commit(repo, commit, bare=True)
+        commit_sha = repo.head.commit.hexsha[:7]
+        print(f"✅ Blobless clone OK: {repo_name} @ {commit_sha}")
+        return local_path, commit_sha
+
+    except GitCommandError as e:
+        print(f"❌ Git error while cloning {repo_name}: {e}")
+        return None, None
+    except Exception as e:
+        print(f"❌ Unexpected error: {e}")
+        return None, None
+
+
+def list_terraform_blobs(repo, extensions=TERRAFORM_EXTENSIONS):
+    """Liệt kê (path, blob_oid) của các file Terraform trong HEAD tree."""
+    entries = []
+    output = repo.git.ls_tree("-r", "-z", "--full-tree", "HEAD")
+    for entry in output.split("\0"):
+        if not entry:
+            continue
+        info, path = entry.split("\t", 1)
+        _, obj_type, oid = info.split()
+        if obj_type == "blob" and path.lower().endswith(tuple(extensions)):
+            entries.append((path, oid))
+    return entries
+
+
+def prefetch_blobs(repo, oids):
+    """
+    Tải trước các blob còn thiếu bằng vài lệnh fetch gộp, thay vì để
+    `cat-file` lazy-fetch từng object một từ promisor remote.
+    Lỗi ở đây không nghiêm trọng: cat-file vẫn tự fetch khi thiếu.
+    """
+    from git import GitCommandError
+
+    for i in range(0, len(oids), PREFETCH_BATCH_SIZE):
+        batch = oids[i : i + PREFETCH_BATCH_SIZE]
+        try:
+            # Cùng tham số git dùng nội bộ khi lazy-fetch từ promisor remote
+            repo.git(c="fetch.negotiationAlgorithm=noop").fetch(
+                "origin",
+                "--no-tags",
+                "--no-write-fetch-head",
+                "--recurse-submodules=no",
+                "--filter=blob:none",
+                *batch,
+            )
+        except GitCommandError as e:
+            print(f"⚠️ Prefetch blobs failed, falling back to lazy fetch: {e}")
+            return
+
+
+def iter_terraform_blobs(local_path, extensions=TERRAFORM_EXTENSIONS):
+    """
+    Stream nội dung các file Terraform từ object database.
+    Dùng 1 tiến trình `git cat-file --batch` sống suốt vòng lặp (persistent
+    command của GitPython), không ghi gì ra working tree.
+
+    Yields:
+        (file_path, content) với file_path = local_path/<path trong repo>,
+        cùng format đường dẫn với chế độ worktree.
+    """
+    from git import Repo
+
+    repo = Repo(local_path)
+    try:
+        entries = list_terraform_blobs(repo, extensions)
+        print(f"🧬 {len(entries)} Terraform blob(s) in HEAD tree")
+        prefetch_blobs(repo, [oid for _, oid in entries])
+
+        for path, oid in entries:
+            _, _, _, data = repo.git.get_object_data(oid)
+            yield os.path.join(local_path, path), data.decode("utf-8", errors="replace")
+    finally:
+        repo.close()
+
+
+def resolve_remote_head(repo_url: str, branch=None):
+    """
+    SHA đầy đủ của HEAD (hoặc của nhánh `branch`) trên remote qua
+    `git ls-remote` (không clone, chỉ 1 round-trip đọc ref).
+    None nếu remote không truy cập được.
+    """
+    from git import Git, GitCommandError
+
+    wanted = f"refs/heads/{branch}" if branch else "HEAD"
+    try:
+        output = Git().ls_remote(
+            repo_url, wanted, kill_after_timeout=config.GIT_LS_REMOTE_TIMEOUT
+        )
+    except GitCommandError as e:
+        print(f"⚠️ ls-remote failed for {repo_url}: {e}")
+        return None
+    for line in output.splitlines():
+        sha, _, ref = line.partition("\t")
+        if ref == wanted:
+            return sha
+    return None
+
+
+def local_head(local_path):
+    """SHA đầy đủ của HEAD trong bản clone cục bộ."""
+    from git import Repo
+
+    repo = Repo(local_path)
+    try:
+        return repo.head.commit.hexsha
+    finally:
+        repo.close()
+
+
+def is_local_repo(repo: str):
+    """Repo nằm trên filesystem của máy này (file:// hoặc đường dẫn, kể cả bare repo)."""
+    return repo.startswith("file://") or ("://" not in repo and os.path.exists(repo))
+
+
+def local_checkout(repo: str):
+    """
+    Đường dẫn thư mục nếu `repo` trỏ tới 1 checkout trên máy (đường dẫn hoặc
+    file://), để phân tích tại chỗ thay vì clone. None với URL remote và với
+    bare repo (file:// tới bare repo vẫn được clone như remote).
+    """
+    path = repo[len("file://") :] if repo.startswith("file://") else repo
+    if "://" in path or not os.path.isdir(path):
+        return None
+    is_bare = os.path.isfile(os.path.join(path, "HEAD")) and os.path.isdir(
+        os.path.join(path, "objects")
+    )
+    return None if is_bare else os.path.abspath(path)
+
+
+def describe_checkout(local_path):
+    """Short SHA của checkout local; "local" nếu không phải git repo."""
+    from git import InvalidGitRepositoryError, NoSuchPathError, Repo
+
+    try:
+        repo = Repo(local_path, search_parent_directories=True)
+    except (InvalidGitRepositoryError, NoSuchPathError):
+        return "local"
+    try:
+        sha = repo.head.commit.hexsha[:7]
+        return f"{sha}-dirty" if repo.is_dirty(untracked_files=True) else sha
+    except ValueError:
+        # Repo chưa có commit nào
+        return "local"
+    finally:
+        repo.close()
@@ -0,0 +1,33 @@
+"""
+JSON encode/decode nhanh: dùng orjson nếu có, fallback về stdlib json.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson là tuỳ chọn
+    orjson = None
+
+
+def loads(data):
+    """Parse JSON từ str hoặc bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj):
+    """Serialize ra UTF-8 bytes (không escape ký tự non-ASCII)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson không hỗ trợ (key không phải str, int > 64 bit...) -> stdlib
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj):
+    """Như dumps_bytes nhưng trả về str (cột TEXT trong SQLite, NDJSON)."""
+    return dumps_bytes(obj).decode("utf-8")
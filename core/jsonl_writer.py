@@ -1,7 +1,6 @@
-import os
-import json
 from pathlib import Path
 import config
+from . import json_codec
 
 MAX_BYTES_PER_FILE = config.MAX_BYTES_PER_FILE
 
@@ -28,7 +27,7 @@ def write_jsonl_safely(chunks, output_dir, base_name="drift_output"):
         if not buffer:
             return
         output_file = output_dir / f"{base_name}_{idx}.jsonl"
-        with open(output_file, "w", encoding="utf-8") as f:
+        with open(output_file, "wb") as f:
             f.writelines(buffer)
         print(
             f"✅ Saved {output_file} ({len(buffer)} chunks, {buffer_size/1024:.1f} KB)"
@@ -38,8 +37,7 @@ def write_jsonl_safely(chunks, output_dir, base_name="drift_output"):
         buffer_size = 0
 
     for chunk in chunks:
-        json_line = json.dumps(chunk, ensure_ascii=False) + "\n"
-        json_bytes = json_line.encode("utf-8")
+        json_bytes = json_codec.dumps_bytes(chunk) + b"\n"
         json_size = len(json_bytes)
 
         # 🔹 Nếu chunk vượt quá giới hạn file → chia nhỏ ra nhiều file riêng
@@ -67,7 +65,7 @@ def write_jsonl_safely(chunks, output_dir, base_name="drift_output"):
         if buffer_size + json_size > MAX_BYTES_PER_FILE:
             flush_buffer()
 
-        buffer.append(json_line)
+        buffer.append(json_bytes)
         buffer_size += json_size
 
     flush_buffer()
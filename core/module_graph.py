@@ -0,0 +1,209 @@
+import json
+import os
+import posixpath
+from contextlib import closing
+
+import config
+from .state_db import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS module_graphs (
+    repo TEXT PRIMARY KEY,
+    commit_sha TEXT,
+    graph TEXT NOT NULL
+);
+"""
+
+
+def rel_dir(root, file_path):
+    """Thư mục (tương đối so với root repo, dạng posix) chứa file. Root = '.'"""
+    rel = os.path.relpath(os.path.dirname(file_path), root)
+    return rel.replace(os.sep, "/")
+
+
+def _blocks(config_dict, block_type):
+    blocks = (config_dict or {}).get(block_type, [])
+    return [b for b in blocks if isinstance(b, dict)] if isinstance(blocks, list) else []
+
+
+def _var_default(variables, value):
+    """'${var.x}' -> default của variable x trong cùng thư mục (nếu là literal)."""
+    if isinstance(value, str) and value.startswith("${var.") and value.endswith("}"):
+        default = variables.get(value[len("${var.") : -1])
+        return default if isinstance(default, str) else None
+    return value if isinstance(value, str) else None
+
+
+def scan_dir(dir_key, configs):
+    """
+    Tóm tắt 1 thư mục Terraform (1 module) từ các config đã parse:
+    region khai báo trong provider, các module local được gọi.
+    """
+    variables = {}
+    for cfg in configs:
+        for block in _blocks(cfg, "variable"):
+            for name, body in block.items():
+                if isinstance(body, dict) and "default" in body:
+                    variables[name] = body["default"]
+
+    regions = set()
+    calls = {}
+    for cfg in configs:
+        for block in _blocks(cfg, "provider"):
+            for _, body in block.items():
+                bodies = body if isinstance(body, list) else [body]
+                for b in bodies:
+                    if isinstance(b, dict) and "alias" not in b:
+                        region = _var_default(variables, b.get("region"))
+                        if region:
+                            regions.add(region)
+        module_sources = [
+            (name, body.get("source"))
+            for block in _blocks(cfg, "module")
+            for name, body in block.items()
+            if isinstance(body, dict)
+        ]
+        # terragrunt.hcl: terraform { source = "../modules//vpc" }
+        module_sources += [
+            ("terragrunt", block.get("source")) for block in _blocks(cfg, "terraform")
+        ]
+        for name, source in module_sources:
+            if isinstance(source, str) and source.startswith(("./", "../")):
+                target = posixpath.normpath(posixpath.join(dir_key, source))
+                if not target.startswith(".."):
+                    calls[name] = target
+
+    return {"regions": sorted(regions), "calls": calls}
+
+
+def build_module_graph(root, sources, graph=None, dirs=None):
+    """
+    Dựng (hoặc cập nhật) module graph của 1 repo từ các source đã parse.
+
+    Args:
+        sources: list dict {"file_path", "config"} (từ terraform_parser.load_source).
+        graph: graph cũ để cập nhật; chỉ các thư mục trong `dirs` được quét lại.
+
+    Returns:
+        {"dirs": {dir: {"regions": [...], "calls": {name: dir_con}}}}
+    """
+    by_dir = {}
+    for source in sources:
+        by_dir.setdefault(rel_dir(root, source["file_path"]), []).append(source["config"])
+
+    result = {"dirs": dict((graph or {}).get("dirs", {}))}
+    for dir_key in dirs if dirs is not None else by_dir:
+        if dir_key in by_dir:
+            result["dirs"][dir_key] = scan_dir(dir_key, by_dir[dir_key])
+        else:
+            result["dirs"].pop(dir_key, None)  # thư mục không còn file Terraform
+    return result
+
+
+def callers_of(graph):
+    """dir module -> tập dir gọi tới nó."""
+    callers = {}
+    for dir_key, entry in graph["dirs"].items():
+        for target in entry["calls"].values():
+            callers.setdefault(target, set()).add(dir_key)
+    return callers
+
+
+def _walk(start, edges):
+    seen, stack = set(), list(start)
+    while stack:
+        node = stack.pop()
+        for nxt in edges.get(node, ()):
+            if nxt not in seen:
+                seen.add(nxt)
+                stack.append(nxt)
+    return seen
+
+
+def resolve_dir_context(graph):
+    """
+    Region + module hiệu lực của từng thư mục:
+    - region: provider trong chính thư mục; nếu không có thì kế thừa từ các
+      module gọi tới nó (truyền dọc theo graph, nhiều region -> nối bằng ',').
+    - module: đường dẫn thư mục nếu nó được module khác gọi, ngược lại "none" (root).
+    """
+    callers = callers_of(graph)
+    context = {}
+
+    def region_of(dir_key, visiting):
+        if dir_key in context:
+            return context[dir_key]["region"]
+        entry = graph["dirs"].get(dir_key, {"regions": []})
+        if entry["regions"]:
+            return ",".join(entry["regions"])
+        inherited = set()
+        for parent in callers.get(dir_key, ()):
+            if parent in visiting:
+                continue
+            region = region_of(parent, visiting | {dir_key})
+            if region != "unknown":
+                inherited.update(region.split(","))
+        return ",".join(sorted(inherited)) or "unknown"
+
+    for dir_key in graph["dirs"]:
+        context[dir_key] = {
+            "region": region_of(dir_key, {dir_key}),
+            "module": dir_key if dir_key in callers else "none",
+        }
+    return context
+
+
+def affected_dirs(graph, changed_files):
+    """
+    Các thư mục cần phân tích lại khi `changed_files` (path tương đối repo) đổi:
+    thư mục chứa file đổi + các module phụ thuộc vào nó (dependents, gọi tới nó)
+    + các module nó gọi (region kế thừa có thể đổi theo).
+    """
+    changed = {posixpath.dirname(f) or "." for f in changed_files}
+    calls = {d: set(e["calls"].values()) for d, e in graph["dirs"].items()}
+    return changed | _walk(changed, callers_of(graph)) | _walk(changed, calls)
+
+
+def rewired_dirs(old_graph, new_graph, dirs):
+    """
+    Thư mục ngoài `dirs` cần phân tích lại sau khi quét lại `dirs`: module
+    gọi / được gọi từ `dirs` theo cạnh của graph cũ hoặc graph mới (module
+    call vừa thêm / bỏ), và mọi thư mục có context kế thừa (region, module)
+    khác so với graph cũ.
+    """
+    calls = {}
+    for graph in (old_graph, new_graph):
+        for dir_key, entry in graph["dirs"].items():
+            calls.setdefault(dir_key, set()).update(entry["calls"].values())
+    callers = {}
+    for dir_key, targets in calls.items():
+        for target in targets:
+            callers.setdefault(target, set()).add(dir_key)
+    linked = _walk(dirs, calls) | _walk(dirs, callers)
+
+    old_context = resolve_dir_context(old_graph)
+    new_context = resolve_dir_context(new_graph)
+    moved = {d for d, ctx in new_context.items() if old_context.get(d) != ctx}
+    return (linked | moved) - set(dirs)
+
+
+def _connect():
+    conn = connect(config.MODULE_GRAPH_DB)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def load_graph(repo_url):
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT graph FROM module_graphs WHERE repo = ?", (repo_url,)
+        ).fetchone()
+    return json.loads(row["graph"]) if row else None
+
+
+def save_graph(repo_url, commit_sha, graph):
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO module_graphs VALUES (?, ?, ?)",
+            (repo_url, commit_sha, json.dumps(graph)),
+        )
@@ -0,0 +1,169 @@
+"""
+Export chunk đã normalize ra Parquet cho analytics toàn fleet (đếm resource
+theo type/region/owner... trên hàng nghìn repo) mà không phải parse lại JSONL.
+
+- Cột lặp nhiều giá trị (repo, commit, owner, resource_type, region, module,
+  file, environment) dùng dictionary encoding.
+- Export là 1 dataset (thư mục): mỗi repo 1 file `<repo key>.parquet` (1 row
+  group), ghi ngay khi repo xong stage write nên không giữ toàn bộ fleet
+  trong RAM. Run chỉ thay file của các repo nó phân tích -> thư mục luôn là
+  snapshot mới nhất của cả fleet, kể cả khi nhiều run (API, webhook, worker)
+  chạy song song.
+- pyarrow là dependency tuỳ chọn: chỉ import khi bật export.
+
+Đọc cả fleet: `pq.read_table("<thư mục>")` / DuckDB `read_parquet('<thư mục>/**/*.parquet')`.
+Mỗi file có dictionary riêng; khi group_by bằng pyarrow thì gọi
+`table.unify_dictionaries()` trước (DuckDB/Spark tự xử lý).
+"""
+
+import os
+import threading
+import uuid
+
+DICTIONARY_COLUMNS = [
+    "repo",
+    "commit",
+    "owner",
+    "file",
+    "resource_type",
+    "region",
+    "module",
+    "update_at",
+    "environment",
+]
+
+
+def _schema():
+    import pyarrow as pa
+
+    dict_str = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [
+            ("repo", dict_str),
+            ("commit", dict_str),
+            ("owner", dict_str),
+            ("file", dict_str),
+            ("resource_type", dict_str),
+            ("region", dict_str),
+            ("module", dict_str),
+            ("update_at", dict_str),
+            ("environment", dict_str),
+            ("resource_address", pa.string()),
+            ("lines", pa.string()),
+            ("line_start", pa.int32()),
+            ("line_end", pa.int32()),
+            ("part", pa.string()),
+            ("content_ref", pa.string()),
+            ("content_bytes", pa.int32()),
+            ("content", pa.string()),
+            ("id", pa.string()),
+            ("schema", pa.int8()),
+        ]
+    )
+
+
+def _line_span(lines):
+    start, _, end = str(lines).partition("-")
+    try:
+        return int(start), int(end or start)
+    except ValueError:
+        return None, None
+
+
+def chunks_to_columns(chunks):
+    """List chunk (dict) -> dict cột cho pyarrow.Table.from_pydict."""
+    columns = {name: [] for name in _schema().names}
+    for chunk in chunks:
+        start, end = _line_span(chunk.get("lines", ""))
+        content = chunk.get("content", "")
+        for name in DICTIONARY_COLUMNS + ["resource_address", "lines", "id"]:
+            columns[name].append(chunk.get(name))
+        columns["line_start"].append(start)
+        columns["line_end"].append(end)
+        columns["part"].append(chunk.get("part"))
+        columns["content_ref"].append(chunk.get("content_ref"))
+        columns["content_bytes"].append(len(content.encode("utf-8")))
+        columns["content"].append(content)
+        columns["schema"].append(chunk.get("schema", 1))
+    return columns
+
+
+class ParquetExporter:
+    """
+    Ghi Parquet theo từng repo vào thư mục dataset `path`. Mỗi lần ghi dùng
+    file tạm riêng (tên ngẫu nhiên) rồi rename sang `<path>/<repo key>.parquet`,
+    nên reader không thấy file dở dang và 2 run ghi cùng repo không ghi chung
+    1 file (run ghi sau thắng).
+
+        exporter = ParquetExporter("output/chunks")
+        exporter.write_repo("org/infra", chunks)   # gọi sau mỗi repo
+        exporter.close()                           # run lỗi: exporter.abort()
+    """
+
+    def __init__(self, path, compression="zstd"):
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError(
+                "Parquet export cần pyarrow: pip install pyarrow"
+            ) from e
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.compression = compression
+        self.schema = _schema()
+        self.rows = 0
+        self.files = 0
+        self._lock = threading.Lock()  # các repo ghi song song từ nhiều thread
+        self._pending = set()  # file tạm đang ghi
+
+    def repo_path(self, key):
+        return os.path.join(self.path, f"{key}.parquet")
+
+    def write_repo(self, key, chunks):
+        """Thay file của repo `key` (xem workspace.repo_key); repo không còn chunk -> xoá file."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        target = self.repo_path(key)
+        if not chunks:
+            if os.path.exists(target):
+                os.remove(target)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        table = pa.Table.from_pydict(chunks_to_columns(chunks), schema=self.schema)
+        tmp_path = f"{target}.{uuid.uuid4().hex[:12]}.tmp"
+        with self._lock:
+            self._pending.add(tmp_path)
+        try:
+            # row_group_size = số dòng -> đúng 1 row group cho repo
+            pq.write_table(
+                table,
+                tmp_path,
+                row_group_size=len(chunks),
+                compression=self.compression,
+                use_dictionary=DICTIONARY_COLUMNS,
+            )
+            os.replace(tmp_path, target)
+        finally:
+            with self._lock:
+                self._pending.discard(tmp_path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self._lock:
+            self.rows += len(chunks)
+            self.files += 1
+
+    def close(self):
+        print(
+            f"🧱 Parquet export: {self.path} "
+            f"({self.rows} rows, {self.files} repo file(s) updated)"
+        )
+
+    def abort(self):
+        """Run lỗi: xoá file tạm còn sót; file của repo đã ghi xong giữ nguyên."""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        for tmp_path in pending:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
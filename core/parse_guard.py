@@ -0,0 +1,292 @@
+import hashlib
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from multiprocessing.connection import Connection
+
+import config
+from .state_db import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quarantine (
+    blob_hash TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    reason TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 1
+);
+"""
+
+
+class ParseBudgetExceeded(Exception):
+    """File không parse được trong worker; `reason` là lý do quarantine."""
+
+    reason = "budget"
+
+
+class ParseTimeout(ParseBudgetExceeded):
+    """Parse 1 file vượt quá PARSE_TIMEOUT_SECONDS, worker đã bị kill."""
+
+    reason = "timeout"
+
+
+class ParseCrash(ParseBudgetExceeded):
+    """Worker chết khi đang parse file (segfault, bị OOM kill...)."""
+
+    reason = "crash"
+
+
+class WorkerUnavailable(Exception):
+    """Worker không khởi động được (không liên quan tới file đang parse)."""
+
+
+def blob_hash(data):
+    """Hash giống `git hash-object`: cùng nội dung -> cùng key ở mọi repo/commit."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    header = f"blob {len(data)}\0".encode("ascii")
+    return hashlib.sha1(header + data).hexdigest()
+
+
+# ---------------------------------------------------------------------------
+# Quarantine store
+# ---------------------------------------------------------------------------
+
+
+# load_source tra quarantine cho mọi file: giữ 1 connection / thread (SCHEMA
+# chạy 1 lần khi mở) thay vì mở connection + executescript mỗi file
+_local = threading.local()
+
+
+def _connect():
+    """Connection dùng lại của thread hiện tại (mở lại khi đổi DB / sau fork)."""
+    path = os.path.abspath(os.path.join(config.STATE_DIR, config.QUARANTINE_DB))
+    key = (os.getpid(), path)
+    cached = getattr(_local, "conn", None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    if cached is not None and cached[0][0] == key[0]:
+        cached[1].close()
+    conn = connect(config.QUARANTINE_DB)
+    conn.executescript(SCHEMA)
+    _local.conn = (key, conn)
+    return conn
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def quarantine_reason(digest):
+    """Lý do file đã bị quarantine (None nếu chưa)."""
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT reason FROM quarantine WHERE blob_hash = ?", (digest,)
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE quarantine SET hits = hits + 1, last_seen = ? WHERE blob_hash = ?",
+                (_now(), digest),
+            )
+    return row["reason"] if row else None
+
+
+def add_quarantine(digest, file_path, reason, size):
+    now = _now()
+    with _connect() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO quarantine VALUES (?, ?, ?, ?, ?, ?, 1)",
+            (digest, file_path, reason, size, now, now),
+        )
+    print(f"🚧 Quarantined {file_path} ({reason}, {size / 1024:.0f} KB)")
+
+
+# ---------------------------------------------------------------------------
+# Worker process pool
+# ---------------------------------------------------------------------------
+
+
+def _handlers():
+    from core import terraform_parser
+
+    return {
+        "hcl": lambda path, content: terraform_parser.parse_ast(path, content),
+        "json": lambda path, content: terraform_parser.parse_json_config(path, content),
+        "fallback": lambda path, content: terraform_parser.fallback_chunking(
+            path, content=content
+        ),
+    }
+
+
+def _worker_main(tasks, results):
+    """
+    Vòng lặp của worker process (core/parse_worker.py): nhận
+    (task, file_path, content) từ `tasks`, trả kết quả qua `results`.
+    """
+    handlers = _handlers()
+    results.send(("ready", None))
+    while True:
+        try:
+            task = tasks.recv()
+        except EOFError:
+            return  # process cha đã thoát / đóng pipe
+        if task is None:
+            return
+        kind, file_path, content = task
+        try:
+            results.send(("ok", handlers[kind](file_path, content)))
+        except Exception as e:
+            results.send(("error", str(e)))
+
+
+class WorkerConnection:
+    """Cặp pipe tới 1 worker: gửi task qua `tasks`, nhận kết quả từ `results`."""
+
+    def __init__(self, tasks, results):
+        self.tasks = tasks
+        self.results = results
+
+    def send(self, obj):
+        self.tasks.send(obj)
+
+    def poll(self, timeout):
+        return self.results.poll(timeout)
+
+    def recv(self):
+        return self.results.recv()
+
+    def close(self):
+        self.tasks.close()
+        self.results.close()
+
+
+# Worker là process mới chạy module cố định `python -m core.parse_worker`:
+# không fork process cha đang có nhiều thread, cũng không import lại script
+# __main__ của cha như multiprocessing spawn/forkserver.
+WORKER_MODULE = "core.parse_worker"
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _start_worker():
+    """Khởi động worker và chờ nó báo sẵn sàng (import xong)."""
+    task_r, task_w = os.pipe()
+    result_r, result_w = os.pipe()
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (PROJECT_ROOT, env.get("PYTHONPATH")) if p
+    )
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", WORKER_MODULE, str(task_r), str(result_w)],
+            pass_fds=(task_r, result_w),
+            env=env,
+        )
+    except (OSError, ValueError) as e:  # ValueError: pass_fds không hỗ trợ (Windows)
+        os.close(task_w)
+        os.close(result_r)
+        raise WorkerUnavailable(f"parse worker did not start: {e}") from e
+    finally:
+        os.close(task_r)
+        os.close(result_w)
+
+    worker = {
+        "proc": proc,
+        "conn": WorkerConnection(
+            Connection(task_w, readable=False), Connection(result_r, writable=False)
+        ),
+    }
+    try:
+        ready = worker["conn"].poll(config.PARSE_WORKER_START_TIMEOUT_SECONDS)
+        if ready and worker["conn"].recv()[0] == "ready":
+            return worker
+    except (EOFError, OSError):
+        pass
+    _stop_worker(worker)
+    raise WorkerUnavailable(f"parse worker did not start (exitcode {proc.returncode})")
+
+
+def _stop_worker(worker):
+    worker["proc"].kill()
+    worker["proc"].wait()
+    worker["conn"].close()
+
+
+_isolation = {"available": True}
+
+
+def isolation_available():
+    return _isolation["available"]
+
+
+def _disable_isolation(error):
+    print(f"⚠️ {error} -> parse trong process (không có time budget / cách ly crash)")
+    _isolation["available"] = False
+
+
+# pid -> queue worker rảnh. Worker không dùng chung qua fork.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool():
+    pid = os.getpid()
+    with _pools_lock:
+        pool = _pools.get(pid)
+        if pool is None:
+            pool = queue.Queue()
+            for _ in range(config.PARSE_WORKERS):
+                pool.put(None)  # slot, worker được spawn khi dùng lần đầu
+            _pools[pid] = pool
+    return pool
+
+
+def run_guarded(kind, file_path, content, timeout=None):
+    """
+    Chạy 1 tác vụ parse trong worker process với time budget.
+    Hết thời gian -> kill worker (slot được spawn lại lần sau) và raise ParseTimeout;
+    worker chết giữa chừng -> raise ParseCrash (caller quarantine file).
+    Không dùng được worker (xem isolation_available) -> parse trong process.
+    """
+    if not isolation_available():
+        return _handlers()[kind](file_path, content)
+    timeout = config.PARSE_TIMEOUT_SECONDS if timeout is None else timeout
+    pool = _pool()
+    worker = pool.get()
+    try:
+        if worker is None or worker["proc"].poll() is not None:
+            try:
+                worker = _start_worker()
+            except WorkerUnavailable as e:
+                worker = None
+                _disable_isolation(e)
+                return _handlers()[kind](file_path, content)
+        started = time.perf_counter()
+        worker["conn"].send((kind, file_path, content))
+        if not worker["conn"].poll(timeout):
+            _stop_worker(worker)
+            worker = None
+            raise ParseTimeout(
+                f"{kind} parse of {file_path} exceeded {timeout}s "
+                f"({time.perf_counter() - started:.1f}s)"
+            )
+        status, result = worker["conn"].recv()
+        if status == "error":
+            print(f"Parse worker error for {file_path}: {result}")
+            return None
+        return result
+    except (EOFError, OSError) as e:
+        # Worker chết giữa chừng (OOM, segfault...): quarantine như timeout để
+        # lần chạy sau không crash (và spawn lại worker) vì cùng file
+        print(f"Parse worker crashed on {file_path}: {e}")
+        if worker is not None:
+            _stop_worker(worker)
+        worker = None
+        raise ParseCrash(f"{kind} parse of {file_path} crashed the worker: {e}") from e
+    finally:
+        pool.put(worker)
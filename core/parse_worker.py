@@ -0,0 +1,28 @@
+"""
+Entrypoint của parse worker, được core/parse_guard.py khởi động bằng
+
+    python -m core.parse_worker <fd nhận task> <fd trả kết quả>
+
+Module cố định này là __main__ của worker: không phụ thuộc script đã khởi
+động process cha (có `if __name__ == "__main__":` hay không).
+"""
+
+import signal
+import sys
+from multiprocessing.connection import Connection
+
+
+def main(argv=None):
+    task_fd, result_fd = (int(v) for v in (argv or sys.argv[1:]))
+    # Ctrl+C gửi tới cả process group: process cha tự dừng worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from core.parse_guard import _worker_main
+
+    _worker_main(
+        Connection(task_fd, writable=False), Connection(result_fd, readable=False)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import json
+from contextlib import closing
+from datetime import datetime, timezone
+
+import config
+from .state_db import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_results (
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    analyzer_version TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    analyzed_at TEXT NOT NULL,
+    PRIMARY KEY (repo, commit_sha, analyzer_version)
+);
+"""
+
+
+def _connect():
+    conn = connect(config.RESULT_CACHE_DB)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def get_cached_result(repo_url, commit_sha, analyzer_version=None):
+    """
+    Summary của lần phân tích thành công trước đó cho đúng (repo, commit đầy đủ,
+    analyzer version). None nếu chưa có.
+    """
+    version = analyzer_version or config.ANALYZER_VERSION
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT summary, analyzed_at FROM analysis_results "
+            "WHERE repo = ? AND commit_sha = ? AND analyzer_version = ?",
+            (repo_url, commit_sha, version),
+        ).fetchone()
+    if row is None:
+        return None
+    return {**json.loads(row["summary"]), "analyzed_at": row["analyzed_at"]}
+
+
+def store_result(repo_url, commit_sha, summary, analyzer_version=None):
+    """Ghi summary sau khi repo đã đi hết clone -> sync thành công."""
+    version = analyzer_version or config.ANALYZER_VERSION
+    analyzed_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO analysis_results VALUES (?, ?, ?, ?, ?)",
+            (repo_url, commit_sha, version, json.dumps(summary), analyzed_at),
+        )
+
+
+def invalidate_repo(repo_url):
+    """Xoá toàn bộ kết quả cache của 1 repo (vd. khi bucket/KB bị reset tay)."""
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM analysis_results WHERE repo = ?", (repo_url,))
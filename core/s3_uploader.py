@@ -1,16 +1,15 @@
 import os
-import boto3
-from botocore.exceptions import ClientError
 
-s3 = boto3.client("s3")
+from .aws_clients import get_s3_client
 
 
-def clear_repo_output_in_s3(bucket: str, repo_name: str):
+def clear_repo_output_in_s3(bucket: str, repo_key: str):
     """
-    Xóa toàn bộ object thuộc repo_name trên S3.
-    VD: s3://bucket/iac_config/terraform-aws-examples/*
+    Xóa toàn bộ object thuộc repo_key (<owner>/<repo>, xem workspace.repo_key) trên S3.
+    VD: s3://bucket/iac_config/hashicorp/terraform-aws-examples/*
     """
-    prefix = f"iac_config/{repo_name}/"
+    s3 = get_s3_client()
+    prefix = f"iac_config/{repo_key}/"
     print(f"🧹 Clearing old output for repo: s3://{bucket}/{prefix}")
 
     response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
@@ -26,6 +25,9 @@ def clear_repo_output_in_s3(bucket: str, repo_name: str):
 
 
 def upload_folder_to_s3(local_folder: str, bucket: str, prefix: str):
+    from botocore.exceptions import ClientError
+
+    s3 = get_s3_client()
     uploaded = []
 
     for root, _, files in os.walk(local_folder):
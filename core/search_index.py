@@ -0,0 +1,294 @@
+"""
+Inverted index trong RAM cho /search: tra cứu resource theo address, type,
+region, module, attribute (khớp chính xác) và free-text xếp hạng BM25.
+
+- Nguồn dữ liệu là chunk store: pipeline gọi on_repo_written() sau stage write;
+  process khác (worker uvicorn) tự đồng bộ lại repo đã đổi run_id, tối đa
+  1 lần / SEARCH_REFRESH_SECONDS.
+- Cập nhật theo repo: index lại 1 repo chỉ thay các document của repo đó.
+"""
+
+import heapq
+import math
+import re
+import threading
+import time
+
+import config
+from .chunk_store import chunk_addresses, load_repo_chunks, repo_run_ids
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+COMMON_TERM_RATIO = 0.05
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[_\-./][a-z0-9]+)*")
+PART_RE = re.compile(r"[_\-./]")
+# `key = value` ở đầu dòng (HCL) - value bỏ dấu nháy
+ATTRIBUTE_RE = re.compile(r'^\s*([A-Za-z_][\w\-]*)\s*=\s*"?([^"\n{\[]*)"?\s*$', re.M)
+
+# Field khớp chính xác -> tên filter của /search
+FIELDS = ("address", "type", "region", "module", "repo", "attr", "env")
+
+_lock = threading.RLock()
+_docs = {}  # doc_id -> thông tin trả về (không giữ content)
+_doc_len = {}  # doc_id -> số term
+_postings = {}  # term -> {doc_id: tf}
+_fields = {}  # (field, value) -> set(doc_id)
+_repo_docs = {}  # repo -> [doc_id]
+_repo_runs = {}  # repo -> run_id đã index
+_state = {"next_id": 0, "total_len": 0, "refreshed_at": None}
+
+
+def tokenize(text):
+    """Term cho BM25: token ghép (aws_s3_bucket.logs) + từng phần của nó."""
+    for token in TOKEN_RE.findall(text.lower()):
+        yield token
+        if PART_RE.search(token):
+            yield from (p for p in PART_RE.split(token) if p)
+
+
+def chunk_fields(chunk):
+    """Các cặp (field, value) khớp chính xác của 1 chunk."""
+    block_kind = (chunk.get("resource_type") or "").lower()
+    pairs = {("type", block_kind), ("repo", (chunk.get("repo") or "").lower())}
+    pairs.add(("module", (chunk.get("module") or "none").lower()))
+    if chunk.get("environment"):
+        pairs.add(("env", chunk["environment"].lower()))
+    for region in (chunk.get("region") or "unknown").split(","):
+        pairs.add(("region", region.strip().lower()))
+
+    # Chunk gộp bởi token budget: index address của mọi member
+    for address in chunk_addresses(chunk):
+        address = address.strip().lower()
+        if not address:
+            continue
+        pairs.add(("address", address))
+        parts = address.split(".")
+        if parts[0] in ("resource", "data") and len(parts) >= 3:
+            # Tra cứu kiểu Terraform: aws_s3_bucket.logs / data.aws_ami.x
+            pairs.add(("address", ".".join(parts[1:])))
+            pairs.add(("type", parts[1]))
+
+    for key, value in ATTRIBUTE_RE.findall(chunk.get("content") or ""):
+        key = key.lower()
+        pairs.add(("attr", key))
+        value = value.strip().lower()
+        if value:
+            pairs.add(("attr", f"{key}={value}"))
+    return pairs
+
+
+def _remove_repo(repo_url):
+    for doc_id in _repo_docs.pop(repo_url, []):
+        doc = _docs.pop(doc_id)
+        _state["total_len"] -= _doc_len.pop(doc_id)
+        for term in doc["_terms"]:
+            postings = _postings[term]
+            del postings[doc_id]
+            if not postings:
+                del _postings[term]
+        for pair in doc["_fields"]:
+            ids = _fields[pair]
+            ids.discard(doc_id)
+            if not ids:
+                del _fields[pair]
+    _repo_runs.pop(repo_url, None)
+
+
+def index_repo(repo_url, chunks, run_id=None):
+    """Thay toàn bộ document của repo bằng `chunks` (chunk đã normalize)."""
+    with _lock:
+        _remove_repo(repo_url)
+        doc_ids = []
+        for chunk in chunks:
+            doc_id = _state["next_id"]
+            _state["next_id"] += 1
+
+            terms = {}
+            text = " ".join(
+                str(chunk.get(k) or "")
+                for k in ("resource_address", "resource_type", "module", "region", "content")
+            )
+            for term in tokenize(text):
+                terms[term] = terms.get(term, 0) + 1
+            for term, tf in terms.items():
+                _postings.setdefault(term, {})[doc_id] = tf
+            fields = chunk_fields(chunk)
+            for pair in fields:
+                _fields.setdefault(pair, set()).add(doc_id)
+
+            length = sum(terms.values())
+            _doc_len[doc_id] = length
+            _state["total_len"] += length
+            _docs[doc_id] = {
+                "repo": chunk.get("repo"),
+                "commit": chunk.get("commit"),
+                "file": chunk.get("file"),
+                "lines": chunk.get("lines"),
+                "resource_address": chunk.get("resource_address"),
+                "resource_type": chunk.get("resource_type"),
+                "module": chunk.get("module"),
+                "region": chunk.get("region"),
+                "members": chunk.get("members"),
+                "environment": chunk.get("environment"),
+                "_terms": tuple(terms),
+                "_fields": tuple(fields),
+            }
+            doc_ids.append(doc_id)
+        _repo_docs[repo_url] = doc_ids
+        if run_id is not None:
+            _repo_runs[repo_url] = run_id
+
+
+def on_repo_written(repo_url, chunks, run_id):
+    """
+    Gọi từ pipeline sau khi ghi chunk store. Chỉ cập nhật nếu index đã được
+    nạp trong process này (CLI/batch không tốn công build index).
+    """
+    if _state["refreshed_at"] is not None:
+        index_repo(repo_url, chunks, run_id)
+
+
+def refresh(force=False):
+    """
+    Đồng bộ index với chunk store: index lại repo có run_id khác, bỏ repo đã
+    bị xoá. Bỏ qua nếu vừa refresh trong SEARCH_REFRESH_SECONDS.
+    """
+    now = time.monotonic()
+    last = _state["refreshed_at"]
+    if not force and last is not None and now - last < config.SEARCH_REFRESH_SECONDS:
+        return
+    with _lock:
+        _state["refreshed_at"] = now
+        current = repo_run_ids()
+        for repo_url in list(_repo_docs):
+            if repo_url not in current:
+                _remove_repo(repo_url)
+        for repo_url, run_id in current.items():
+            if _repo_runs.get(repo_url) != run_id:
+                index_repo(repo_url, load_repo_chunks(repo_url), run_id)
+
+
+def _bm25(terms, candidates, limit):
+    """
+    Điểm BM25 cho các document chứa ít nhất 1 term.
+    Term hiếm được tính trước; term phổ biến (df > COMMON_TERM_RATIO * N) chỉ
+    cộng điểm cho document đã khớp khi đã đủ `limit` kết quả - document chỉ
+    chứa term phổ biến có điểm quá thấp để lọt top, không cần duyệt cả list.
+
+    Returns:
+        (scores, total): total đếm cả document chỉ khớp term phổ biến (không
+        được chấm điểm).
+    """
+    n_docs = len(_docs)
+    avg_len = _state["total_len"] / n_docs if n_docs else 0
+    scores = {}
+    postings_by_df = sorted(
+        (p for p in (_postings.get(t) for t in set(terms)) if p), key=len
+    )
+    pruned = []
+    for postings in postings_by_df:
+        df = len(postings)
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        if len(scores) >= limit and df > COMMON_TERM_RATIO * n_docs:
+            pruned.append(postings)
+            matched = [(d, postings[d]) for d in scores if d in postings]
+        else:
+            matched = postings.items()
+        for doc_id, tf in matched:
+            if candidates is not None and doc_id not in candidates:
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * _doc_len[doc_id] / avg_len)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+    total = len(scores)
+    if pruned:
+        # Chỉ đếm (phép set trên key), không chấm điểm
+        unscored = set().union(*pruned)
+        unscored.difference_update(scores)
+        if candidates is not None:
+            unscored &= candidates
+        total += len(unscored)
+    return scores, total
+
+
+def _result(doc_id, score, address=None):
+    doc = _docs[doc_id]
+    result = {k: v for k, v in doc.items() if not k.startswith("_") and v is not None}
+    if score is not None:
+        result["score"] = round(score, 4)
+    if address and doc.get("members"):
+        # Chunk gộp: chỉ ra đúng block khớp address trong chunk
+        result["matches"] = [
+            m
+            for m in doc["members"]
+            if address in {a.lower() for a in _address_forms(m["resource_address"])}
+        ]
+    return result
+
+
+def _address_forms(address):
+    parts = address.split(".")
+    if parts[0] in ("resource", "data") and len(parts) >= 3:
+        return [address, ".".join(parts[1:])]
+    return [address]
+
+
+def search(q=None, filters=None, limit=20):
+    """
+    q: free-text, xếp hạng BM25. filters: {field: value} với field trong
+    FIELDS, khớp chính xác (không phân biệt hoa thường); nhiều filter = AND.
+    Không có q: trả chunk khớp filter theo thứ tự repo/file.
+
+    Returns:
+        {"total": số document khớp, "results": [...]}
+    """
+    refresh()
+    filters = {k: v for k, v in (filters or {}).items() if v}
+    unknown = set(filters) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown search field(s): {sorted(unknown)}")
+    terms = list(tokenize(q)) if q else []
+    if not terms and not filters:
+        raise ValueError("Cần q hoặc ít nhất 1 filter")
+
+    with _lock:
+        candidates = None
+        # Giao các tập nhỏ trước
+        sets = sorted(
+            (_fields.get((f, str(v).lower()), set()) for f, v in filters.items()),
+            key=len,
+        )
+        for ids in sets:
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                break
+
+        address = str(filters["address"]).lower() if "address" in filters else None
+        if terms:
+            scores, total = _bm25(terms, candidates, limit)
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            return {
+                "total": total,
+                "results": [_result(d, s, address) for d, s in top],
+            }
+
+        top = heapq.nsmallest(
+            limit,
+            candidates,
+            key=lambda d: (_docs[d]["repo"] or "", _docs[d]["file"] or "", d),
+        )
+        return {
+            "total": len(candidates),
+            "results": [_result(d, None, address) for d in top],
+        }
+
+
+def stats():
+    with _lock:
+        return {
+            "repos": len(_repo_docs),
+            "documents": len(_docs),
+            "terms": len(_postings),
+            "fields": len(_fields),
+        }
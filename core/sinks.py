@@ -0,0 +1,113 @@
+"""
+Output sink của pipeline: nơi nhận chunk đã normalize của từng repo.
+
+    local   ghi JSONL shard vào output/<repo> (không cần AWS)
+    s3      local + upload lên S3 (hoặc S3-compatible: S3_ENDPOINT_URL) + sync
+            Bedrock Knowledge Base - hành vi mặc định trước đây
+    memory  giữ chunk trong RAM (test, benchmark, gọi từ code)
+    null    bỏ hết, chỉ đo pipeline clone/parse
+
+write() tương ứng stage "write" của run_drift_analyzer; out_key là thư mục con
+riêng của job (<owner>/<repo>/<commit>, xem core/workspace.py). Sink có publishes=True
+có thêm upload() / sync() cho stage "upload" / "sync", theo repo key
+(<owner>/<repo>: 2 repo cùng tên khác owner không ghi đè nhau); chỉ các sink này mới
+dùng result cache (HEAD không đổi -> dữ liệu ở đích vẫn còn nguyên).
+"""
+
+import os
+
+import config
+from .git_handler import safe_rmtree
+from .jsonl_writer import write_jsonl_safely
+from .workspace import remove_job_dir
+
+
+class NullSink:
+    name = "null"
+    publishes = False
+
+    def write(self, repo_name, chunks, out_key=None):
+        """Trả về dict thông tin thêm cho stage event."""
+        return {}
+
+    def release(self, out_key=None):
+        """Dọn dữ liệu tạm của job sau khi repo xử lý xong."""
+
+
+class MemorySink(NullSink):
+    name = "memory"
+
+    def __init__(self):
+        self.chunks = {}
+
+    def write(self, repo_name, chunks, out_key=None):
+        self.chunks[out_key or repo_name] = list(chunks)
+        return {}
+
+
+class LocalSink(NullSink):
+    name = "local"
+
+    def __init__(self, output_dir=None):
+        self.output_dir = output_dir or config.OUTPUT_DIR
+
+    def repo_dir(self, repo_name, out_key=None):
+        return os.path.join(self.output_dir, out_key or repo_name)
+
+    def write(self, repo_name, chunks, out_key=None):
+        repo_output_dir = self.repo_dir(repo_name, out_key)
+        # Ghi lại cùng commit: xoá shard cũ để không sót file thừa
+        safe_rmtree(repo_output_dir)
+        write_jsonl_safely(chunks, repo_output_dir, base_name=repo_name)
+        print(f"📄 {len(chunks)} chunks written to {repo_output_dir}")
+        return {"path": repo_output_dir}
+
+
+class S3Sink(LocalSink):
+    name = "s3"
+    publishes = True
+
+    def __init__(self, output_dir=None, bucket=None):
+        super().__init__(output_dir)
+        self.bucket = bucket or config.OUTPUT_S3_BUCKET
+
+    def upload(self, repo_key, out_key=None):
+        """
+        Upload output của job lên s3://<bucket>/iac_config/<repo_key>/.
+        Returns: kết quả upload_folder_to_s3 ({"status", "uploaded", "error"}).
+        """
+        from .s3_uploader import clear_repo_output_in_s3, upload_folder_to_s3
+
+        # ✅ Clear S3 output chỉ cho repo này, rồi upload lại dữ liệu mới
+        clear_repo_output_in_s3(self.bucket, repo_key)
+        return upload_folder_to_s3(
+            self.repo_dir(repo_key, out_key), self.bucket, f"iac_config/{repo_key}"
+        )
+
+    def sync(self, repo_key):
+        """Returns: kết quả sync_data_source_by_repo, hoặc status "skipped"."""
+        if not config.KNOWLEDGE_BASE_ID or config.S3_ENDPOINT_URL:
+            # Bedrock KB chỉ đọc được từ AWS S3, không từ endpoint S3-compatible
+            print("⚠️ Không có Knowledge Base cho sink này, bỏ qua Bedrock sync")
+            return {"status": "skipped"}
+        from .bedrock_sync import sync_data_source_by_repo
+
+        return sync_data_source_by_repo(f"s3://{self.bucket}/iac_config/{repo_key}/")
+
+    def release(self, out_key=None):
+        # output/ chỉ là vùng staging trước khi upload
+        if out_key and not config.KEEP_WORKSPACES:
+            remove_job_dir(self.repo_dir(None, out_key))
+
+
+SINKS = {"local": LocalSink, "s3": S3Sink, "memory": MemorySink, "null": NullSink}
+
+
+def make_sink(name=None, output_dir=None):
+    """Tạo sink theo tên (mặc định config.OUTPUT_SINK)."""
+    name = name or config.OUTPUT_SINK
+    if name not in SINKS:
+        raise ValueError(f"Unknown sink '{name}', expected one of {sorted(SINKS)}")
+    if issubclass(SINKS[name], LocalSink):
+        return SINKS[name](output_dir)
+    return SINKS[name]()
@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import time
+
+import config
+
+
+def connect(db_name: str) -> sqlite3.Connection:
+    """
+    Mở 1 connection SQLite trong config.STATE_DIR.
+    - WAL: reader không chặn writer (API đọc trong khi pipeline ghi).
+    - Mỗi lời gọi mở connection riêng -> dùng được từ nhiều thread.
+    """
+    os.makedirs(config.STATE_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(config.STATE_DIR, db_name), timeout=30)
+    conn.row_factory = sqlite3.Row
+    _enable_wal(conn)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _enable_wal(conn, attempts=50):
+    """
+    Bật WAL (lưu trong file DB). Nhiều thread cùng mở 1 DB mới tạo có thể
+    đồng thời đổi journal mode; SQLite trả "database is locked" ngay thay
+    vì chờ busy timeout -> thử lại.
+    """
+    for attempt in range(attempts):
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            return
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) or attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
@@ -1,7 +1,4 @@
-import os
-import hcl2
-
-import hcl2
+import bisect
 import os
 import re
 import json
@@ -10,12 +7,50 @@ from collections import OrderedDict
 from dotenv import load_dotenv
 from fnmatch import fnmatch
 
+import config
+from . import json_codec
+from .parse_guard import (
+    ParseBudgetExceeded,
+    add_quarantine,
+    blob_hash,
+    quarantine_reason,
+    run_guarded,
+)
+from .module_graph import build_module_graph, rel_dir, resolve_dir_context
+
 # Load .env file
 load_dotenv()
 
+TOKEN_BUDGET_ENABLED = config.CHUNK_TOKEN_BUDGET
+PARSE_ISOLATION = config.PARSE_ISOLATION
+PARSE_MAX_BYTES = config.PARSE_MAX_BYTES
+
+# Block/attribute cấp cao nhất của terragrunt.hcl được chunk riêng
+TERRAGRUNT_BLOCKS = [
+    "include",
+    "dependency",
+    "dependencies",
+    "generate",
+    "inputs",
+    "remote_state",
+    "iam_role",
+    "download_dir",
+    "prevent_destroy",
+    "skip",
+    "retryable_errors",
+]
+TERRAGRUNT_LABELED_BLOCKS = ["include", "dependency", "generate"]
+
+JSON_FILE_TYPES = ["terraform_json", "tfvars_json"]
+SUPPORTED_FILE_TYPES = ["terraform", "tfvars", "terragrunt"] + JSON_FILE_TYPES
+
+
+def detect_file_type(file_path, content=None):
+    """Phase 1: File type detection
 
-def detect_file_type(file_path):
-    """Phase 1: File type detection"""
+    content: nội dung file đã đọc sẵn (vd. blob lấy từ git object store),
+    khi có thì không mở file trên đĩa.
+    """
     ignore_patterns = os.getenv("LIST_IGNORE_FILE", "").split(",")
     ignore_patterns = [
         pattern.strip() for pattern in ignore_patterns if pattern.strip()
@@ -27,31 +62,46 @@ def detect_file_type(file_path):
             print(f"Ignoring file {file_path} due to pattern {pattern}")
             return "unknown"
 
+    lower_name = file_name.lower()
+    if lower_name.endswith(".tf.json"):
+        return "terraform_json"
+    if lower_name.endswith(".tfvars.json"):
+        return "tfvars_json"
+    if lower_name == "terragrunt.hcl":
+        return "terragrunt"
+
     ext = os.path.splitext(file_path)[1].lower()
     if ext not in [".tf", ".tfvars", ".hcl"]:
         return "unknown"
 
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read(1000)
-            if (
-                "resource" in content
-                or "module" in content
-                or "variable" in content
-                or "provider" in content
-                or "terraform" in content
-            ):
-                return "terraform"
-            if ext == ".tfvars":
-                return "tfvars"
+        if content is None:
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read(1000)
+        else:
+            content = content[:1000]
+        if (
+            "resource" in content
+            or "module" in content
+            or "variable" in content
+            or "provider" in content
+            or "terraform" in content
+        ):
+            return "terraform"
+        if ext == ".tfvars":
+            return "tfvars"
     except Exception as e:
         print(f"Error reading {file_path}: {e}")
     return "unknown"
 
 
-def parse_ast(file_path):
+def parse_ast(file_path, content=None):
     """Phase 2: Attempt AST parse with hcl2"""
+    import hcl2  # lazy: hcl2/lark nặng, chỉ import khi thực sự parse
+
     try:
+        if content is not None:
+            return hcl2.loads(content)
         with open(file_path, "r", encoding="utf-8") as f:
             config = hcl2.load(f)
         return config
@@ -60,6 +110,49 @@ def parse_ast(file_path):
         return None
 
 
+def normalize_json_config(data):
+    """
+    Đưa Terraform JSON syntax về cùng shape với output của hcl2, để đi chung
+    pipeline generate_chunks: mỗi block type là 1 list các dict.
+    - {"resource": {"aws_x": {...}}}      -> {"resource": [{"aws_x": {...}}]}
+    - {"provider": {"aws": [{..}, {..}]}}  -> {"provider": [{"aws": {..}}, {"aws": {..}}]}
+    Key comment "//" bị bỏ qua.
+    """
+    config = {}
+    if not isinstance(data, dict):
+        return config
+    for block_type, value in data.items():
+        if block_type == "//":
+            continue
+        items = value if isinstance(value, list) else [value]
+        blocks = []
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            item = {k: v for k, v in item.items() if k != "//"}
+            if block_type in ["provider", "module", "variable", "output"]:
+                # Label có thể map tới list (nhiều block cùng label, vd. provider alias)
+                for label, body in item.items():
+                    bodies = body if isinstance(body, list) else [body]
+                    blocks.extend({label: b} for b in bodies)
+            else:
+                blocks.append(item)
+        config[block_type] = blocks
+    return config
+
+
+def parse_json_config(file_path, content=None):
+    """Phase 2 (fast path) cho .tf.json: JSON parse nhanh hơn HCL hàng chục lần."""
+    try:
+        if content is None:
+            with open(file_path, "rb") as f:
+                content = f.read()
+        return normalize_json_config(json_codec.loads(content))
+    except Exception as e:
+        print(f"JSON parse failed for {file_path}: {e}")
+        return None
+
+
 def canonicalize(config):
     """Phase 3: Canonicalize - sort attributes, handle heredoc (basic)"""
 
@@ -73,42 +166,213 @@ def canonicalize(config):
     return sort_dict(config)
 
 
+def load_tfvars(tfvars_path):
+    """Đọc 1 file .tfvars -> {tên biến: giá trị}; lỗi/không có file -> {}."""
+    if not tfvars_path or not os.path.exists(tfvars_path):
+        return {}
+    import hcl2
+
+    try:
+        with open(tfvars_path, "r", encoding="utf-8") as f:
+            return hcl2.load(f)
+    except Exception as e:
+        print(f"Error parsing tfvars {tfvars_path}: {e}")
+        return {}
+
+
+VAR_REF_RE = re.compile(r"\$\{var\.([A-Za-z_][\w-]*)\}")
+
+
+def substitute_variables(obj, variables):
+    """
+    Thay "${var.x}" (đứng riêng hoặc nội suy trong chuỗi, vd.
+    "${var.env}-bucket") bằng giá trị trong variables, copy-on-write: nhánh
+    không có biến nào được thay trả về đúng object cũ (không copy), nên N bộ
+    biến dùng chung phần lớn cây config đã parse.
+    """
+    if isinstance(obj, str):
+        if "${var." not in obj:
+            return obj
+        whole = VAR_REF_RE.fullmatch(obj)
+        if whole:
+            # "${var.x}" đứng riêng: giữ nguyên kiểu giá trị (list, map, số...)
+            return variables.get(whole.group(1), obj)
+
+        def replace(match):
+            value = variables.get(match.group(1))
+            if value is None or isinstance(value, (dict, list)):
+                return match.group(0)
+            if isinstance(value, bool):
+                return "true" if value else "false"
+            return str(value)
+
+        # "${var.env}-bucket": nội suy vào chuỗi
+        replaced = VAR_REF_RE.sub(replace, obj)
+        return obj if replaced == obj else replaced
+    if isinstance(obj, dict):
+        changed = None
+        for key, value in obj.items():
+            new_value = substitute_variables(value, variables)
+            if new_value is not value:
+                if changed is None:
+                    changed = obj.copy()
+                changed[key] = new_value
+        return obj if changed is None else changed
+    if isinstance(obj, list):
+        changed = None
+        for i, item in enumerate(obj):
+            new_item = substitute_variables(item, variables)
+            if new_item is not item:
+                if changed is None:
+                    changed = list(obj)
+                changed[i] = new_item
+        return obj if changed is None else changed
+    return obj
+
+
 def resolve_variables(config, tfvars_path=None):
     """Phase 4: Resolve variables best-effort"""
-    variables = {}
-    if tfvars_path and os.path.exists(tfvars_path):
-        try:
-            with open(tfvars_path, "r", encoding="utf-8") as f:
-                vars_config = hcl2.load(f)
-            variables = vars_config
-        except Exception as e:
-            print(f"Error parsing tfvars {tfvars_path}: {e}")
+    variables = load_tfvars(tfvars_path)
+    if not variables:
+        return config
+    return substitute_variables(config, variables)
 
-    def substitute(obj):
-        if isinstance(obj, str) and obj.startswith("${var."):
-            var_name = obj.split(".")[1].strip("}")
-            if var_name in variables:
-                return variables[var_name]
-            return obj
-        elif isinstance(obj, dict):
-            return {k: substitute(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [substitute(item) for item in obj]
-        return obj
 
-    return substitute(config)
+def read_lines(file_path):
+    """Đọc toàn bộ dòng của file (giữ nguyên ký tự xuống dòng)."""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.readlines()
 
 
-def calculate_lines(file_path, chunk_content, block_type, block_name):
-    """Calculate start_line and end_line for a chunk"""
+JSON_TOKEN_RE = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|([{}\[\],:])|([^\s{}\[\],:"]+))', re.S)
+
+
+def scan_json(text):
+    """
+    Parse JSON giữ vị trí: mỗi giá trị -> {"kind", "start", "end", "items"}
+    (offset ký tự trong text). Object: items = [(key, offset của key, node)],
+    array: items = [node], scalar: items = None. ValueError nếu JSON hỏng.
+    """
+    tokens = JSON_TOKEN_RE.finditer(text)
+
+    def next_token():
+        m = next(tokens, None)
+        if m is None or m.lastindex is None:
+            raise ValueError("unexpected end of JSON")
+        return m.group(m.lastindex), m.start(m.lastindex), m.end(m.lastindex)
+
+    def value(token):
+        tok, start, end = token
+        if tok == "{":
+            items = []
+            tok, key_start, _ = next_token()
+            while tok != "}":
+                if not tok.startswith('"'):
+                    raise ValueError(f"expected key at offset {key_start}")
+                if next_token()[0] != ":":
+                    raise ValueError(f"expected ':' at offset {key_start}")
+                node = value(next_token())
+                items.append((json.loads(tok), key_start, node))
+                tok, key_start, _ = next_token()
+                if tok == ",":
+                    tok, key_start, _ = next_token()
+            return {"kind": "object", "start": start, "end": key_start + 1, "items": items}
+        if tok == "[":
+            items = []
+            token = next_token()
+            while token[0] != "]":
+                items.append(value(token))
+                token = next_token()
+                if token[0] == ",":
+                    token = next_token()
+            return {"kind": "array", "start": start, "end": token[1] + 1, "items": items}
+        if tok in "}],:":
+            raise ValueError(f"unexpected '{tok}' at offset {start}")
+        return {"kind": "scalar", "start": start, "end": end, "items": None}
+
+    return value(next_token())
+
+
+def json_block_spans(lines):
+    """
+    Span dòng của mọi block trong file .tf.json, theo đúng vị trí trong cây
+    JSON (không tìm key theo text): label "tags" của 1 resource không bị nhầm
+    với attribute "tags" của block trước, JSON minify 1 dòng vẫn đúng.
+
+    Returns:
+        {(block_type, block_name): [(start_line, end_line), ...]} theo thứ tự
+        xuất hiện (nhiều phần tử khi cùng label, vd. provider alias).
+    """
+    text = "".join(lines)
     try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-            content_str = (
-                chunk_content
-                if isinstance(chunk_content, str)
-                else format_content(chunk_content, block_type, block_name)
-            )
+        root = scan_json(text)
+    except ValueError as e:
+        print(f"JSON span scan failed: {e}")
+        return {}
+    newlines = [m.start() for m in re.finditer("\n", text)]
+
+    def line_of(offset):
+        return bisect.bisect_left(newlines, offset) + 1
+
+    def objects(node, key_start):
+        """Object hoặc list các object -> [(offset bắt đầu block, object)]."""
+        if node["kind"] == "object":
+            return [(key_start, node)]
+        if node["kind"] == "array":
+            return [(n["start"], n) for n in node["items"] if n["kind"] == "object"]
+        return []
+
+    spans = {}
+
+    def add(block_type, block_name, start, node):
+        spans.setdefault((block_type, block_name), []).append(
+            (line_of(start), line_of(node["end"] - 1))
+        )
+
+    if root["kind"] != "object":
+        return spans
+    for block_type, type_start, value in root["items"]:
+        for start, block in objects(value, type_start):
+            if block_type in ["terraform", "locals"]:
+                add(block_type, block_type, start, block)
+                continue
+            for label, label_start, body in block["items"]:
+                if block_type in ["resource", "data"]:
+                    for _, names in objects(body, label_start):
+                        for name, name_start, attrs in names["items"]:
+                            add(block_type, f"{block_type}.{label}.{name}", name_start, attrs)
+                else:
+                    for body_start, item in objects(body, label_start):
+                        add(block_type, label, body_start, item)
+    return spans
+
+
+def calculate_json_lines(lines, block_type, block_name, occurrence=0, spans=None):
+    """
+    Span của block thứ `occurrence` (block_type, block_name) trong file
+    .tf.json; (0, 0) nếu không tìm thấy.
+
+    spans: kết quả json_block_spans(lines) đã tính sẵn cho file.
+    """
+    if spans is None:
+        spans = json_block_spans(lines)
+    found = spans.get((block_type, block_name), [])
+    return found[occurrence] if occurrence < len(found) else (0, 0)
+
+
+def calculate_lines(file_path, chunk_content, block_type, block_name, lines=None):
+    """Calculate start_line and end_line for a chunk
+
+    lines: danh sách dòng đã đọc sẵn; nếu None thì đọc lại từ file_path.
+    """
+    try:
+        if lines is None:
+            lines = read_lines(file_path)
+        content_str = (
+            chunk_content
+            if isinstance(chunk_content, str)
+            else format_content(chunk_content, block_type, block_name)
+        )
 
         # Determine block pattern based on block_type
         block_pattern = None
@@ -130,6 +394,12 @@ def calculate_lines(file_path, chunk_content, block_type, block_name):
                 if content_str.strip()
                 else None
             )
+        elif block_type in TERRAGRUNT_BLOCKS:
+            block_pattern = (
+                rf"^{block_type}\s*=?\s*{{"
+                if block_name == block_type
+                else rf'^{block_type}\s+"{re.escape(block_name)}"\s*{{'
+            )
 
         start_line = 0
         end_line = 0
@@ -302,15 +572,37 @@ def generate_chunks(config, file_path):
     return chunks
 
 
-def fallback_chunking(file_path, target_size=400, overlap=50):
-    """Phase 6: Fallback - regex + line-based"""
+def generate_terragrunt_chunks(config):
+    """
+    Phase 5 cho terragrunt.hcl: mỗi block/attribute cấp cao nhất (include,
+    dependency "x", inputs, remote_state, ...) là 1 chunk.
+    """
     chunks = []
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
+    if not config:
         return chunks
+    for block_type, value in config.items():
+        if block_type not in TERRAGRUNT_BLOCKS + ["terraform", "locals"]:
+            continue
+        blocks = value if isinstance(value, list) else [value]
+        for block in blocks:
+            if block_type in TERRAGRUNT_LABELED_BLOCKS and isinstance(block, dict):
+                for label, body in block.items():
+                    chunks.append(({block_type: {label: body}}, block_type, label))
+            else:
+                chunks.append(({block_type: block}, block_type, block_type))
+    return chunks
+
+
+def fallback_chunking(file_path, target_size=400, overlap=50, content=None):
+    """Phase 6: Fallback - regex + line-based"""
+    chunks = []
+    if content is None:
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+            return chunks
 
     block_pattern = re.compile(
         r'(resource|data|module|provider|terraform|variable|output|locals)\s+(")?([^"\s}]+)?(")?\s*(")?([^"\s}]+)?(")?\s*{((?:[^{}]+|{[^{}]*})*)}',
@@ -351,6 +643,25 @@ def fallback_chunking(file_path, target_size=400, overlap=50):
     return chunks
 
 
+def line_window_chunking(lines, target_size=400, overlap=50):
+    """
+    Phase 6b: Fallback rẻ nhất - cửa sổ dòng theo số token, không regex.
+    Dùng cho file bị quarantine. Trả về (text, start_line, end_line).
+    """
+    windows = []
+    start, current_tokens = 0, 0
+    for i, line in enumerate(lines):
+        tokens = len(line.split())
+        if i > start and current_tokens + tokens > target_size:
+            windows.append(("".join(lines[start:i]).rstrip("\n"), start + 1, i))
+            start = max(start + 1, i - overlap)
+            current_tokens = sum(len(l.split()) for l in lines[start:i])
+        current_tokens += tokens
+    if start < len(lines):
+        windows.append(("".join(lines[start:]).rstrip("\n"), start + 1, len(lines)))
+    return windows
+
+
 def attach_metadata(
     chunk,
     file_path,
@@ -377,12 +688,13 @@ def attach_metadata(
     return metadata
 
 
-def special_handling(config, chunks, file_path):
-    """C. Special handling"""
-    if not config:
-        return chunks
-    region = get_region(config)
-    module_path = get_module_path(file_path)
+def special_blocks(config):
+    """
+    C. Special handling: từng block variable / local / module riêng lẻ.
+    Block trùng với chunk generate_chunks đã sinh được dedup stage
+    (core/dedup_index.py) bỏ và tính vào số chunk tiết kiệm.
+    Yields (chunk_content, block_type, block_name).
+    """
     processed_blocks = set()
     for block_type in ["variable", "locals", "module"]:
         blocks = config.get(block_type, [])
@@ -393,29 +705,35 @@ def special_handling(config, chunks, file_path):
                 continue
             for label, content in block.items():
                 chunk_key = (block_type, label)
+                block_name = block_type if block_type == "locals" else label
                 if chunk_key not in processed_blocks:
-                    block_name = block_type if block_type == "locals" else label
                     # For locals, wrap content in a dictionary to avoid string issues
-                    chunk_content = (
-                        {block_type: {label: content}}
-                        if block_type == "locals"
-                        else {block_type: {label: content}}
-                    )
-                    start_line, end_line = calculate_lines(
-                        file_path, chunk_content, block_type, block_name
-                    )
-                    meta_chunk = attach_metadata(
-                        chunk_content,
-                        file_path,
-                        start_line,
-                        end_line,
-                        block_type,
-                        block_name,
-                        module_path,
-                        region,
-                    )
-                    chunks.append(meta_chunk)
+                    yield {block_type: {label: content}}, block_type, block_name
                     processed_blocks.add(chunk_key)
+
+
+def special_handling(config, chunks, file_path, lines=None):
+    """C. Special handling"""
+    if not config:
+        return chunks
+    region = get_region(config)
+    module_path = get_module_path(file_path)
+    for chunk_content, block_type, block_name in special_blocks(config):
+        start_line, end_line = calculate_lines(
+            file_path, chunk_content, block_type, block_name, lines
+        )
+        chunks.append(
+            attach_metadata(
+                chunk_content,
+                file_path,
+                start_line,
+                end_line,
+                block_type,
+                block_name,
+                module_path,
+                region,
+            )
+        )
     return chunks
 
 
@@ -437,57 +755,493 @@ def get_module_path(file_path):
     return "none"
 
 
-def process_directory(directory, tfvars_path=None):
-    chunks = []
+def estimate_tokens(text):
+    """Ước lượng số token (~4 ký tự / token), đủ dùng để chia budget."""
+    return max(1, len(text) // 4)
+
+
+def parse_span(lines):
+    start, _, end = str(lines).partition("-")
+    try:
+        return int(start), int(end or start)
+    except ValueError:
+        return 0, 0
+
+
+def split_attribute_segments(content):
+    """
+    Tách content HCL (do format_content sinh ra) thành header, các đoạn
+    attribute cấp 1 (mỗi đoạn gồm cả nested block của nó) và footer.
+    Content không có dạng `header { ... }` thì mỗi dòng là 1 đoạn.
+    """
+    lines = content.splitlines()
+    if len(lines) >= 3 and lines[0].rstrip().endswith("{") and lines[-1] == "}":
+        header, body, footer = lines[0], lines[1:-1], lines[-1]
+    else:
+        header, body, footer = None, lines, None
+
+    segments = []
+    for line in body:
+        is_attr_start = (
+            header is None
+            or (line.startswith("  ") and not line.startswith("   "))
+            and line.strip() != "}"
+        )
+        if is_attr_start or not segments:
+            segments.append([line])
+        else:
+            segments[-1].append(line)
+    return header, ["\n".join(seg) for seg in segments], footer
+
+
+ATTR_KEY_RE = re.compile(r'^\s*"?([A-Za-z_][\w\-]*)"?')
+
+
+def part_spans(lines, span, parts):
+    """
+    Span dòng của từng phần sau khi chia 1 block: dò tuần tự từng attribute
+    cấp 1 (theo thứ tự, nested block lặp lại như `ingress` tính từng lần) trong
+    file nguồn, ở đúng mức thụt lề attribute của block. None nếu không khớp
+    được (vd. format_content đổi thứ tự attribute) -> các phần giữ span của
+    cả block.
+    """
+    start, end = span
+    if not lines or start < 1 or end > len(lines) or end <= start:
+        return None
+    body = [l for l in lines[start : end - 1] if l.strip()]
+    if not body:
+        return None
+    indent = len(body[0]) - len(body[0].lstrip())
+
+    starts, cursor = [], start + 1
+    for part in parts:
+        for idx, segment in enumerate(part):
+            key = ATTR_KEY_RE.match(segment.splitlines()[0])
+            if key is None:
+                return None
+            pattern = re.compile(rf'^\s{{{indent}}}"?{re.escape(key.group(1))}"?\s*[=:{{]')
+            found = next(
+                (n for n in range(cursor, end) if pattern.match(lines[n - 1])), None
+            )
+            if found is None:
+                return None
+            if idx == 0:
+                starts.append(found)
+            cursor = found + 1
+    starts[0] = start
+    ends = [s - 1 for s in starts[1:]] + [end]
+    return [f"{s}-{e}" for s, e in zip(starts, ends)]
+
+
+def split_chunk(chunk, target_tokens, lines=None):
+    """
+    Chia 1 chunk quá lớn tại ranh giới attribute, mỗi phần ~target_tokens.
+    lines: dòng của file nguồn, để tính span riêng cho từng phần.
+    """
+    header, segments, footer = split_attribute_segments(chunk["content"])
+    overhead = estimate_tokens(f"{header}{footer}") if header is not None else 0
+    parts, current, current_tokens = [], [], overhead
+    for segment in segments:
+        tokens = estimate_tokens(segment)
+        if current and current_tokens + tokens > target_tokens:
+            parts.append(current)
+            current, current_tokens = [], overhead
+        current.append(segment)
+        current_tokens += tokens
+    if current:
+        parts.append(current)
+    if len(parts) <= 1:
+        return [chunk]
+
+    spans = part_spans(lines, parse_span(chunk["lines"]), parts) or [chunk["lines"]] * len(
+        parts
+    )
+    result = []
+    for idx, (part, part_lines) in enumerate(zip(parts, spans), 1):
+        body = "\n".join(part)
+        content = f"{header}\n{body}\n{footer}" if header is not None else body
+        result.append(
+            {
+                **chunk,
+                "content": content,
+                "lines": part_lines,
+                "part": f"{idx}/{len(parts)}",
+            }
+        )
+    return result
+
+
+def merge_kind(chunk):
+    """
+    Loại dùng để gộp: resource/data theo kiểu Terraform (aws_s3_bucket...),
+    block khác theo block kind (variable, output...).
+    """
+    parts = (chunk.get("resource_address") or "").split(".")
+    if chunk.get("resource_type") in ("resource", "data") and len(parts) >= 3:
+        return f"{parts[0]}.{parts[1]}"
+    return chunk.get("resource_type")
+
+
+def merge_chunks(group):
+    """
+    Gộp nhiều chunk nhỏ cùng file/module/kiểu thành 1 document. Address của
+    document là address của block đầu tiên; `members` giữ address + lines của
+    từng block (chunk store / search index tra cứu theo mọi member).
+    """
+    if len(group) == 1:
+        return group[0]
+    spans = [parse_span(c["lines"]) for c in group]
+    return {
+        **group[0],
+        "lines": f"{min(s for s, _ in spans)}-{max(e for _, e in spans)}",
+        "content": "\n\n".join(c["content"] for c in group),
+        "members": [
+            {"resource_address": c["resource_address"], "lines": c["lines"]}
+            for c in group
+        ],
+    }
+
+
+def apply_token_budget(chunks, target_tokens=None, limit_tokens=None, lines=None):
+    """
+    Phase 8: Token budget - chạy sau generate_chunks/attach_metadata cho 1 file.
+    - Chunk > limit_tokens: chia tại ranh giới attribute (đánh dấu `part`,
+      span của từng phần tính từ `lines` của file nguồn nếu có).
+    - Các chunk nhỏ liên tiếp cùng file/module/kiểu (merge_kind) được gộp đến
+      ~target_tokens (span = hợp các span, `members` giữ address + lines
+      của từng block). Chunk giống hệt 1 chunk đã có trong nhóm mở nhóm mới:
+      block lặp lại thành document trùng để dedup stage bỏ.
+    """
+    target_tokens = target_tokens or config.CHUNK_TOKEN_TARGET
+    limit_tokens = limit_tokens or config.CHUNK_TOKEN_LIMIT
+
+    sized = []
+    for chunk in chunks:
+        if estimate_tokens(chunk["content"]) > limit_tokens:
+            sized.extend(split_chunk(chunk, target_tokens, lines))
+        else:
+            sized.append(chunk)
+
+    result, group, group_tokens = [], [], 0
+    for chunk in sized:
+        tokens = estimate_tokens(chunk["content"])
+        same_sibling = (
+            group
+            and all(chunk.get(k) == group[0].get(k) for k in ("file", "module"))
+            and merge_kind(chunk) == merge_kind(group[0])
+            and not any(
+                c["content"] == chunk["content"]
+                and c.get("resource_address") == chunk.get("resource_address")
+                for c in group
+            )
+        )
+        if (
+            not same_sibling
+            or "part" in chunk
+            or "part" in group[0]
+            or group_tokens + tokens > target_tokens
+        ):
+            if group:
+                result.append(merge_chunks(group))
+            group, group_tokens = [], 0
+        group.append(chunk)
+        group_tokens += tokens
+    if group:
+        result.append(merge_chunks(group))
+    return result
+
+
+def load_source(file_path, content=None):
+    """Phase 1-2 cho 1 file: detect + đọc + parse AST (chưa chunk).
+
+    content: nội dung file nếu đã có sẵn trong bộ nhớ (blob mode); khi đó
+    không có thao tác đọc file nào trên đĩa.
+
+    Returns:
+        {"file_path", "file_type", "lines", "config"} hoặc None nếu không phải
+        file Terraform.
+    """
+    file_type = detect_file_type(file_path, content)
+    if file_type not in SUPPORTED_FILE_TYPES:
+        print(f"Skipping non-Terraform file: {file_path}")
+        return None
+
+    print(f"Processing file: {file_path}")
+    try:
+        lines = (
+            content.splitlines(keepends=True)
+            if content is not None
+            else read_lines(file_path)
+        )
+    except Exception as e:
+        print(f"Error reading {file_path}: {e}")
+        return None
+
+    text = content if content is not None else "".join(lines)
+    digest = blob_hash(text)
+    size = len(text.encode("utf-8"))
+
+    reason = quarantine_reason(digest)
+    if reason is None and size > PARSE_MAX_BYTES:
+        reason = "size"
+        add_quarantine(digest, file_path, reason, size)
+
+    parsed = None
+    if reason is None:
+        kind = "json" if file_type in JSON_FILE_TYPES else "hcl"
+        try:
+            parsed = parse_with_budget(kind, file_path, text)
+        except ParseBudgetExceeded as e:
+            print(f"⏱️ {e}")
+            reason = e.reason
+            add_quarantine(digest, file_path, reason, size)
+    else:
+        print(f"🚧 Skipping parse of quarantined file {file_path} ({reason})")
+
+    return {
+        "file_path": file_path,
+        "file_type": file_type,
+        "lines": lines,
+        "config": parsed,
+        "blob_hash": digest,
+        "size": size,
+        "quarantined": reason,
+    }
+
+
+def parse_with_budget(kind, file_path, text):
+    """
+    Parse ("hcl" | "json") hoặc regex fallback ("fallback") cho 1 file, trong
+    worker process có time budget nếu PARSE_ISOLATION bật.
+    """
+    if PARSE_ISOLATION:
+        return run_guarded(kind, file_path, text)
+    if kind == "json":
+        return parse_json_config(file_path, text)
+    if kind == "fallback":
+        return fallback_chunking(file_path, content=text)
+    return parse_ast(file_path, text)
+
+
+def chunk_source(source, tfvars_path=None, region=None, module_path=None):
+    """Phase 3-8 cho 1 file đã load.
+
+    region/module_path: giá trị từ module graph (nếu có); mặc định lấy từ
+    provider trong chính file và đường dẫn `modules/`.
+    """
+    variables = load_tfvars(tfvars_path)
+    return chunk_source_envs(source, {None: variables}, region, module_path)[None]
+
+
+def block_span(source, chunk_content, block_type, block_name, occurrence=0, json_spans=None):
+    """Span dòng của 1 block trong file nguồn (không phụ thuộc giá trị biến).
+
+    occurrence: thứ tự của block trong các block cùng (block_type, block_name).
+    json_spans: json_block_spans của file .tf.json (None = file HCL).
+    """
+    file_path, lines = source["file_path"], source["lines"]
+    if json_spans is not None:
+        return calculate_json_lines(lines, block_type, block_name, occurrence, json_spans)
+    return calculate_lines(
+        file_path,
+        chunk_content,
+        block_type,
+        block_name.split(".")[-1] if "." in block_name else block_name,
+        lines,
+    )
+
+
+def chunk_source_envs(source, env_variables, region=None, module_path=None):
+    """
+    Parse 1 lần, resolve nhiều lần: chunk 1 file cho N bộ biến (môi trường).
+
+    Phần không phụ thuộc biến - canonicalize, tìm block, span dòng, regex
+    fallback - chạy 1 lần. Với mỗi môi trường, nội dung block được resolve
+    copy-on-write (substitute_variables); block không dùng biến nào của môi
+    trường đó dùng lại chunk đã format.
+
+    Args:
+        env_variables: {tên môi trường: {biến: giá trị}}; tên None = không gắn tag.
+
+    Returns:
+        {tên môi trường: [chunk]}, chunk có thêm "environment" (trừ tên None).
+    """
+    file_path, lines, config = source["file_path"], source["lines"], source["config"]
+    file_type = source.get("file_type", "terraform")
+    if not region or region == "unknown":
+        region = get_region(config) if config else "unknown"
+    if not module_path or module_path == "none":
+        module_path = get_module_path(file_path)
+
+    def make_chunk(content, start_line, end_line, block_type, block_name):
+        return attach_metadata(
+            content, file_path, start_line, end_line, block_type, block_name,
+            module_path, region,
+        )
+
+    # Chunk giống nhau ở mọi môi trường
+    fixed = []
+    # (chunk_content chưa resolve, block_type, block_name, start, end)
+    blocks = []
+    file_chunks = []
+    if config:
+        config = canonicalize(config)
+        if file_type == "terragrunt":
+            file_chunks = generate_terragrunt_chunks(config)
+        else:
+            file_chunks = generate_chunks(config, file_path)
+    elif not source.get("quarantined"):
+        print(f"Falling back to regex for {file_path}")
+        try:
+            file_chunks = parse_with_budget("fallback", file_path, "".join(lines)) or []
+        except ParseBudgetExceeded as e:
+            print(f"⏱️ {e}")
+            source["quarantined"] = f"fallback_{e.reason}"
+            add_quarantine(
+                source["blob_hash"], file_path, source["quarantined"], source["size"]
+            )
+
+    if source.get("quarantined"):
+        for text, start_line, end_line in line_window_chunking(lines):
+            fixed.append(
+                make_chunk(
+                    {"fallback": {"content": text}}, start_line, end_line,
+                    "fallback", "chunk",
+                )
+            )
+
+    json_spans = json_block_spans(lines) if config and file_type in JSON_FILE_TYPES else None
+    occurrences = {}
+    for chunk_content, block_type, block_name in file_chunks:
+        occurrence = occurrences.get((block_type, block_name), 0)
+        occurrences[(block_type, block_name)] = occurrence + 1
+        start_line, end_line = block_span(
+            source, chunk_content, block_type, block_name, occurrence, json_spans
+        )
+        if isinstance(chunk_content, str):
+            chunk_content = {"fallback": {"content": chunk_content}}
+            block_type = "fallback"
+            block_name = (
+                "import" if "terraform import" in chunk_content else block_name
+            )
+        blocks.append((chunk_content, block_type, block_name, start_line, end_line))
+
+    if config:
+        for chunk_content, block_type, block_name in special_blocks(config):
+            start_line, end_line = block_span(
+                source, chunk_content, block_type, block_name, json_spans=json_spans
+            )
+            blocks.append((chunk_content, block_type, block_name, start_line, end_line))
+
+    base = {}  # index block -> chunk format từ nội dung chưa resolve
+    base_budgeted = None  # kết quả token budget khi không block nào đổi
+    results = {}
+    for env, variables in env_variables.items():
+        chunks = list(fixed)
+        unchanged = True
+        for i, (chunk_content, block_type, block_name, start, end) in enumerate(blocks):
+            resolved = (
+                substitute_variables(chunk_content, variables)
+                if variables
+                else chunk_content
+            )
+            if resolved is chunk_content:
+                if i not in base:
+                    base[i] = make_chunk(chunk_content, start, end, block_type, block_name)
+                chunks.append(base[i])
+            else:
+                unchanged = False
+                chunks.append(make_chunk(resolved, start, end, block_type, block_name))
+
+        if TOKEN_BUDGET_ENABLED:
+            if not unchanged:
+                chunks = apply_token_budget(chunks, lines=lines)
+            else:
+                if base_budgeted is None:
+                    base_budgeted = apply_token_budget(chunks, lines=lines)
+                chunks = base_budgeted
+        if env is not None:
+            chunks = [{**chunk, "environment": env} for chunk in chunks]
+        results[env] = chunks
+    return results
+
+
+def process_file(file_path, tfvars_path=None, content=None):
+    """Chạy toàn bộ pipeline parse/chunk cho 1 file (không dùng module graph)."""
+    source = load_source(file_path, content)
+    return chunk_source(source, tfvars_path) if source else []
+
+
+def load_directory_sources(directory, only_dirs=None):
+    """Load mọi file Terraform trong thư mục (tuỳ chọn: chỉ các dir trong only_dirs)."""
+    sources = []
     for root, _, files in os.walk(directory):
+        dir_key = os.path.relpath(root, directory).replace(os.sep, "/")
+        if only_dirs is not None and dir_key not in only_dirs:
+            continue
         for file in files:
-            file_path = os.path.join(root, file)
-            file_type = detect_file_type(file_path)
-            if file_type not in ["terraform", "tfvars"]:
-                print(f"Skipping non-Terraform file: {file_path}")
-                continue
+            source = load_source(os.path.join(root, file))
+            if source:
+                sources.append(source)
+    return sources
 
-            print(f"Processing file: {file_path}")
-            config = parse_ast(file_path)
-            region = get_region(config) if config else "unknown"
-            module_path = get_module_path(file_path)
 
-            if config:
-                config = canonicalize(config)
-                config = resolve_variables(config, tfvars_path)
-                file_chunks = generate_chunks(config, file_path)
-            else:
-                print(f"Falling back to regex for {file_path}")
-                file_chunks = fallback_chunking(file_path)
-
-            for chunk_content, block_type, block_name in file_chunks:
-                start_line, end_line = calculate_lines(
-                    file_path,
-                    chunk_content,
-                    block_type,
-                    block_name.split(".")[-1] if "." in block_name else block_name,
-                )
+def load_blob_sources(blobs, directory, only_dirs=None):
+    """
+    Load các file Terraform được stream trực tiếp từ git object store.
+
+    Args:
+        blobs: iterable (file_path, content) - vd. từ git_handler.iter_terraform_blobs.
+        directory: thư mục gốc của repo (để tính đường dẫn tương đối).
+    """
+    sources = []
+    for file_path, content in blobs:
+        if only_dirs is not None and rel_dir(directory, file_path) not in only_dirs:
+            continue
+        source = load_source(file_path, content=content)
+        if source:
+            sources.append(source)
+    return sources
 
-                if isinstance(chunk_content, str):
-                    chunk_content = {"fallback": {"content": chunk_content}}
-                    block_type = "fallback"
-                    block_name = (
-                        "import" if "terraform import" in chunk_content else block_name
-                    )
-
-                meta_chunk = attach_metadata(
-                    chunk_content,
-                    file_path,
-                    start_line,
-                    end_line,
-                    block_type,
-                    block_name,
-                    module_path,
-                    region,
-                )
-                chunks.append(meta_chunk)
 
-            if config:
-                chunks.extend(special_handling(config, [], file_path))
+def process_sources(sources, directory, tfvars_path=None, graph=None, environments=None):
+    """
+    Chunk các file đã load, region/module lấy từ module graph của repo
+    (provider kế thừa qua các lời gọi module local).
 
+    environments: {tên môi trường: đường dẫn .tfvars}. Mỗi file được parse 1
+    lần rồi resolve cho từng môi trường (chunk có "environment"); khi có
+    environments thì tfvars_path bị bỏ qua.
+    """
+    if graph is None:
+        graph = build_module_graph(directory, sources)
+    context = resolve_dir_context(graph)
+    if environments:
+        env_variables = {env: load_tfvars(path) for env, path in environments.items()}
+    else:
+        env_variables = {None: load_tfvars(tfvars_path)}
+
+    chunks = []
+    for source in sources:
+        ctx = context.get(rel_dir(directory, source["file_path"]), {})
+        by_env = chunk_source_envs(
+            source, env_variables, ctx.get("region"), ctx.get("module")
+        )
+        for env_chunks in by_env.values():
+            chunks.extend(env_chunks)
     return chunks
+
+
+def process_directory(directory, tfvars_path=None, environments=None):
+    return process_sources(
+        load_directory_sources(directory), directory, tfvars_path,
+        environments=environments,
+    )
+
+
+def process_blobs(blobs, directory, tfvars_path=None, environments=None):
+    """Parse các file Terraform stream từ git object store (xem load_blob_sources)."""
+    return process_sources(
+        load_blob_sources(blobs, directory), directory, tfvars_path,
+        environments=environments,
+    )
@@ -0,0 +1,214 @@
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+import config
+from .state_db import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_deliveries (
+    delivery_id TEXT PRIMARY KEY,
+    repo TEXT NOT NULL,
+    commit_sha TEXT,
+    received_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analyzed_commits (
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (repo, commit_sha)
+);
+"""
+
+# (repo_url, branch) -> {"commit": sha mới nhất đang chờ, "changed": set file đổi
+#     (None = phân tích toàn bộ), "timer": threading.Timer | None, "running": bool}
+_pending = {}
+_lock = threading.Lock()
+
+
+def _connect():
+    conn = connect(config.WEBHOOK_STATE_DB)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def is_tracked_ref(ref, default_branch=None):
+    """
+    Chỉ phân tích push vào nhánh được theo dõi:
+    config.WEBHOOK_BRANCHES nếu có, ngược lại là default branch của repo.
+    """
+    if not ref or not ref.startswith("refs/heads/"):
+        return False
+    branch = ref[len("refs/heads/") :]
+    tracked = config.WEBHOOK_BRANCHES or [default_branch or "main"]
+    return branch in tracked
+
+
+def record_delivery(delivery_id, repo_url, commit_sha):
+    """Ghi nhận delivery. Trả về False nếu là redelivery (đã thấy delivery_id)."""
+    if not delivery_id:
+        return True
+    with closing(_connect()) as conn, conn:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO webhook_deliveries VALUES (?, ?, ?, ?)",
+            (delivery_id, repo_url, commit_sha, _now()),
+        )
+        return cur.rowcount == 1
+
+
+def is_commit_analyzed(repo_url, commit_sha):
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT status FROM analyzed_commits WHERE repo = ? AND commit_sha = ?",
+            (repo_url, commit_sha),
+        ).fetchone()
+    return row is not None and row["status"] == "done"
+
+
+def last_analyzed_commit(repo_url):
+    """Commit phân tích thành công gần nhất của repo (None nếu chưa có)."""
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT commit_sha FROM analyzed_commits WHERE repo = ? AND status = 'done' "
+            "ORDER BY updated_at DESC LIMIT 1",
+            (repo_url,),
+        ).fetchone()
+    return row["commit_sha"] if row else None
+
+
+def mark_commit(repo_url, commit_sha, status):
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            """
+            INSERT INTO analyzed_commits VALUES (?, ?, ?, ?)
+            ON CONFLICT (repo, commit_sha) DO UPDATE SET
+                status = excluded.status, updated_at = excluded.updated_at
+            """,
+            (repo_url, commit_sha, status, _now()),
+        )
+
+
+def merge_changed(current, new):
+    """Gộp danh sách file đổi của nhiều push; None (không rõ) thắng tất cả."""
+    if current is None or new is None:
+        return None
+    return current | set(new)
+
+
+def is_pending(repo_url, commit_sha):
+    """Commit đang chờ debounce hoặc đang được phân tích trong process này."""
+    with _lock:
+        return any(
+            key[0] == repo_url and state["commit"] == commit_sha
+            for key, state in _pending.items()
+        )
+
+
+def schedule_analysis(
+    repo_url, commit_sha, run, window=None, changed_files=None, branch=None
+):
+    """
+    Debounce theo (repo, nhánh): các push đến trong `window` giây được gộp
+    thành 1 lần chạy tại commit mới nhất. Nếu đang phân tích, commit mới được
+    giữ lại và chạy tiếp ngay sau khi lần hiện tại xong.
+
+    Args:
+        run: callable(repo_url, commit_sha, changed_files, branch) phân tích
+            đúng commit đó, trả về SHA đầy đủ đã phân tích (None = thất bại).
+        changed_files: file đổi trong push (None = phân tích toàn bộ repo).
+        branch: nhánh được push (push vào các nhánh khác nhau không gộp).
+
+    Returns:
+        "scheduled" nếu tạo lần chạy mới, "coalesced" nếu gộp vào lần đang chờ.
+    """
+    window = config.WEBHOOK_DEBOUNCE_SECONDS if window is None else window
+    key = (repo_url, branch)
+    with _lock:
+        state = _pending.get(key)
+        if state is not None:
+            state["commit"] = commit_sha
+            state["changed"] = merge_changed(state["changed"], changed_files)
+            return "coalesced"
+        state = {
+            "commit": commit_sha,
+            "changed": None if changed_files is None else set(changed_files),
+            "timer": None,
+            "running": False,
+        }
+        _pending[key] = state
+        _start_timer(key, state, run, window)
+    return "scheduled"
+
+
+def _start_timer(key, state, run, window):
+    timer = threading.Timer(window, _fire, args=(key, run, window))
+    timer.daemon = True
+    state["timer"] = timer
+    timer.start()
+
+
+def record_run(repo_url, commit_sha, analyzed_sha):
+    """
+    Ghi kết quả 1 lần chạy: chỉ commit thực sự được checkout và phân tích xong
+    (analyzed_sha) được đánh dấu "done"; commit được yêu cầu mà không khớp
+    -> "failed" để redelivery / push sau phân tích lại.
+
+    Returns: True nếu commit được yêu cầu đã phân tích xong.
+    """
+    if analyzed_sha:
+        mark_commit(repo_url, analyzed_sha, "done")
+    if commit_sha and commit_sha != analyzed_sha:
+        mark_commit(repo_url, commit_sha, "failed")
+        return False
+    return analyzed_sha is not None
+
+
+def _fire(key, run, window):
+    repo_url, branch = key
+    with _lock:
+        state = _pending[key]
+        commit_sha = state["commit"]
+        changed = state["changed"]
+        state["changed"] = set()
+        state["running"] = True
+        state["timer"] = None
+
+    label = f"{repo_url}@{(commit_sha or branch or 'HEAD')[:7]}"
+    try:
+        if commit_sha and is_commit_analyzed(repo_url, commit_sha):
+            print(f"♻️ {label} đã được phân tích, bỏ qua.")
+        else:
+            started = time.perf_counter()
+            if commit_sha:
+                mark_commit(repo_url, commit_sha, "running")
+            try:
+                analyzed = run(
+                    repo_url,
+                    commit_sha,
+                    None if changed is None else sorted(changed),
+                    branch,
+                )
+            except Exception as e:
+                analyzed = None
+                print(f"❌ Webhook run lỗi {label}: {e}")
+            if record_run(repo_url, commit_sha, analyzed):
+                print(f"✅ Webhook run xong {label} ({time.perf_counter() - started:.1f}s)")
+            else:
+                if analyzed is not None:
+                    print(f"⚠️ {label}: đã phân tích {analyzed[:7]} thay vì commit được push")
+                with _lock:
+                    state["changed"] = None  # lần sau phải phân tích toàn bộ
+    finally:
+        with _lock:
+            state["running"] = False
+            if state["commit"] != commit_sha:
+                # Có push mới trong lúc đang chạy -> chạy tiếp cho commit mới nhất
+                _start_timer(key, state, run, window)
+            else:
+                _pending.pop(key, None)
@@ -0,0 +1,271 @@
+"""
+Work queue có lease để nhiều worker (process / node) chia nhau phân tích repo.
+
+    API   enqueue()                 POST /jobs -> mỗi repo 1 job
+    worker claim() -> heartbeat() ... -> complete() / fail()     (worker.py)
+
+- claim() giao job "queued" cũ nhất kèm lease WORK_QUEUE_LEASE_SECONDS; worker
+  phải heartbeat() để gia hạn. Worker chết -> lease hết hạn -> job được
+  claim lại (attempts + 1); quá WORK_QUEUE_MAX_ATTEMPTS thì "failed".
+- Không giao 2 job của cùng 1 repo cho 2 worker cùng lúc (repo lock chỉ có
+  tác dụng trong 1 máy).
+- enqueue() gộp job trùng (cùng repo + options) đang chờ.
+
+Backend:
+    SQLiteQueue  state/queue.db - API server và worker cùng máy
+    HTTPQueue    gọi các endpoint /queue/* của API server - worker ở node khác
+"""
+
+import json
+import time
+import uuid
+from contextlib import closing, contextmanager
+
+import config
+from .state_db import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    repo TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_repo ON jobs (repo, status);
+"""
+
+STATUSES = ("queued", "leased", "done", "failed")
+
+
+class LeaseLost(Exception):
+    """Worker không còn giữ lease của job (hết hạn / job đã được claim lại)."""
+
+
+def _row_to_job(row):
+    job = dict(row)
+    job["options"] = json.loads(job["options"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+class SQLiteQueue:
+    name = "sqlite"
+
+    def __init__(self, db_name=None):
+        self.db_name = db_name or config.WORK_QUEUE_DB
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE: khoá ghi ngay từ đầu, 2 worker không claim trùng job."""
+        with closing(connect(self.db_name)) as conn:
+            conn.isolation_level = None
+            conn.executescript(SCHEMA)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def enqueue(self, repo_url, options=None):
+        """Thêm job cho 1 repo. Trả về job (job đang chờ sẵn nếu trùng)."""
+        options_json = json.dumps(options or {}, sort_keys=True)
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE repo = ? AND options = ? AND status = 'queued'",
+                (repo_url, options_json),
+            ).fetchone()
+            job_id = row["id"] if row else uuid.uuid4().hex
+            if row is None:
+                conn.execute(
+                    "INSERT INTO jobs (id, repo, options, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (job_id, repo_url, options_json, now, now),
+                )
+        return {**self.get(job_id), "coalesced": row is not None}
+
+    def claim(self, worker_id, lease_seconds=None):
+        """Nhận job tiếp theo (kể cả job có lease đã hết hạn). None nếu không có."""
+        lease = lease_seconds or config.WORK_QUEUE_LEASE_SECONDS
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', worker = NULL, updated_at = ?, "
+                "error = 'lease expired ' || attempts || ' time(s)' "
+                "WHERE status = 'leased' AND lease_expires_at < ? AND attempts >= ?",
+                (now, now, config.WORK_QUEUE_MAX_ATTEMPTS),
+            )
+            row = conn.execute(
+                """
+                SELECT id FROM jobs
+                WHERE (status = 'queued' OR (status = 'leased' AND lease_expires_at < ?))
+                  AND repo NOT IN (
+                      SELECT repo FROM jobs
+                      WHERE status = 'leased' AND lease_expires_at >= ?
+                  )
+                ORDER BY created_at
+                LIMIT 1
+                """,
+                (now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, attempts = attempts + 1, "
+                "lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease, now, row["id"]),
+            )
+        return self.get(row["id"])
+
+    def _update_leased(self, job_id, worker_id, sql, params):
+        with self._transaction() as conn:
+            cur = conn.execute(
+                f"UPDATE jobs SET {sql} WHERE id = ? AND worker = ? AND status = 'leased'",
+                (*params, job_id, worker_id),
+            )
+            return cur.rowcount == 1
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=None):
+        """Gia hạn lease. False = đã mất lease (job bị worker khác claim lại)."""
+        now = time.time()
+        lease = lease_seconds or config.WORK_QUEUE_LEASE_SECONDS
+        return self._update_leased(
+            job_id,
+            worker_id,
+            "lease_expires_at = ?, updated_at = ?",
+            (now + lease, now),
+        )
+
+    def complete(self, job_id, worker_id, result=None):
+        return self._update_leased(
+            job_id,
+            worker_id,
+            "status = 'done', lease_expires_at = NULL, updated_at = ?, result = ?",
+            (time.time(), json.dumps(result or {})),
+        )
+
+    def fail(self, job_id, worker_id, error):
+        """Job lỗi: trả về queue nếu còn lượt thử, ngược lại "failed"."""
+        return self._update_leased(
+            job_id,
+            worker_id,
+            "status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END, "
+            "worker = NULL, lease_expires_at = NULL, updated_at = ?, error = ?",
+            (config.WORK_QUEUE_MAX_ATTEMPTS, time.time(), str(error)[:2000]),
+        )
+
+    def get(self, job_id):
+        with closing(connect(self.db_name)) as conn:
+            conn.executescript(SCHEMA)
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row else None
+
+    def stats(self):
+        now = time.time()
+        with closing(connect(self.db_name)) as conn:
+            conn.executescript(SCHEMA)
+            counts = dict(
+                conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+            )
+            oldest = conn.execute(
+                "SELECT MIN(created_at) FROM jobs WHERE status = 'queued'"
+            ).fetchone()[0]
+            expired = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'leased' AND lease_expires_at < ?",
+                (now,),
+            ).fetchone()[0]
+        return {
+            **{status: counts.get(status, 0) for status in STATUSES},
+            "expired_leases": expired,
+            "oldest_queued_seconds": round(now - oldest, 1) if oldest else None,
+        }
+
+    def prune(self, max_age=None):
+        """Xoá job done/failed cũ hơn max_age giây (mặc định WORK_QUEUE_RETENTION_SECONDS)."""
+        max_age = config.WORK_QUEUE_RETENTION_SECONDS if max_age is None else max_age
+        with self._transaction() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - max_age,),
+            ).rowcount
+
+
+class HTTPQueue:
+    """Cùng interface với SQLiteQueue, qua các endpoint /queue/* của API server."""
+
+    name = "http"
+
+    def __init__(self, base_url, token=None, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.headers = {}
+        token = token if token is not None else config.WORK_QUEUE_TOKEN
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+
+    def _request(self, method, path, body=None):
+        import requests
+
+        response = requests.request(
+            method,
+            f"{self.base_url}{path}",
+            json=body,
+            headers=self.headers,
+            timeout=self.timeout,
+        )
+        if response.status_code == 409:
+            return None
+        response.raise_for_status()
+        return response.json() if response.status_code != 204 else None
+
+    def enqueue(self, repo_url, options=None):
+        body = {"repos": [repo_url], **(options or {})}
+        return self._request("POST", "/jobs", body)["jobs"][0]
+
+    def claim(self, worker_id, lease_seconds=None):
+        body = {"worker": worker_id, "lease_seconds": lease_seconds}
+        return self._request("POST", "/queue/claim", body)
+
+    def heartbeat(self, job_id, worker_id, lease_seconds=None):
+        body = {"worker": worker_id, "lease_seconds": lease_seconds}
+        return self._request("POST", f"/queue/{job_id}/heartbeat", body) is not None
+
+    def complete(self, job_id, worker_id, result=None):
+        body = {"worker": worker_id, "result": result or {}}
+        return self._request("POST", f"/queue/{job_id}/complete", body) is not None
+
+    def fail(self, job_id, worker_id, error):
+        body = {"worker": worker_id, "error": str(error)}
+        return self._request("POST", f"/queue/{job_id}/fail", body) is not None
+
+    def get(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def stats(self):
+        return self._request("GET", "/queue/stats")
+
+    def prune(self, max_age=None):
+        return 0  # server tự dọn
+
+
+def make_queue(url=None):
+    """
+    url: rỗng -> SQLiteQueue cục bộ; http(s)://... -> HTTPQueue tới API server.
+    Mặc định config.WORK_QUEUE_URL.
+    """
+    url = url if url is not None else config.WORK_QUEUE_URL
+    if not url or url == "sqlite":
+        return SQLiteQueue()
+    if url.startswith(("http://", "https://")):
+        return HTTPQueue(url)
+    raise ValueError(f"Unknown work queue '{url}', expected empty, 'sqlite' or http(s)://")
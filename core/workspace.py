@@ -0,0 +1,126 @@
+"""
+Khoá theo repo + workspace riêng cho từng job, để nhiều request / worker chạy
+song song không rmtree hay ghi đè thư mục của nhau.
+
+    repos/<owner>/<repo>/<job_id>/      bản clone của 1 job (xoá khi xong)
+    output/<owner>/<repo>/<commit>/     JSONL shard của 1 commit
+
+Repo không phải GitHub (owner "unknown") dùng key `_/<repo>-<hash URL>` để 2
+URL trùng tên thư mục cuối không đụng nhau.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import config
+from .git_handler import safe_rmtree
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: chỉ khoá trong process
+    fcntl = None
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def repo_key(owner, repo_name, repo_url):
+    """Key thư mục / lock duy nhất cho 1 repo."""
+    if owner and owner != "unknown":
+        return f"{owner}/{repo_name}"
+    digest = hashlib.sha1(repo_url.encode("utf-8")).hexdigest()[:8]
+    return f"_/{repo_name}-{digest}"
+
+
+@contextmanager
+def repo_lock(key):
+    """
+    Khoá độc quyền 1 repo trong suốt clone -> sync.
+    - threading.Lock: các thread trong cùng process (request API, debounce).
+    - fcntl.flock trên state/locks/<key>.lock: các process (uvicorn workers,
+      CLI chạy song song). Lock tự nhả khi process chết.
+    """
+    with _locks_guard:
+        lock = _locks.setdefault(key, threading.Lock())
+
+    started = time.perf_counter()
+    if not lock.acquire(blocking=False):
+        print(f"⏳ Waiting for lock on {key}...")
+        lock.acquire()
+    try:
+        if fcntl is None:
+            yield
+            return
+        lock_dir = os.path.join(config.STATE_DIR, "locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, key.replace("/", "__") + ".lock"), "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print(f"⏳ {key} is locked by another process, waiting...")
+                fcntl.flock(f, fcntl.LOCK_EX)
+            waited = time.perf_counter() - started
+            if waited > 1:
+                print(f"🔓 Lock on {key} acquired after {waited:.1f}s")
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    finally:
+        lock.release()
+
+
+def job_workspace(key, job_id):
+    """Thư mục clone riêng của 1 job (chưa tồn tại; git clone sẽ tạo)."""
+    return os.path.join(config.BASE_REPO_DIR, key, job_id)
+
+
+def release_workspace(path):
+    """Xoá workspace của job khi xong (giữ lại nếu KEEP_WORKSPACES=true)."""
+    if path and not config.KEEP_WORKSPACES:
+        remove_job_dir(path)
+
+
+def remove_job_dir(path):
+    """Xoá thư mục của job + thư mục repo cha nếu đã rỗng (đang giữ repo lock)."""
+    safe_rmtree(path)
+    try:
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass  # còn job khác / không tồn tại
+
+
+def prune_workspaces(max_age=None):
+    """
+    Dọn workspace bị bỏ lại bởi job chết giữa chừng (process bị kill...):
+    thư mục job cũ hơn max_age giây (mặc định WORKSPACE_MAX_AGE_SECONDS).
+    """
+    max_age = config.WORKSPACE_MAX_AGE_SECONDS if max_age is None else max_age
+    cutoff = time.time() - max_age
+    removed = 0
+    root = config.BASE_REPO_DIR
+    if not os.path.isdir(root):
+        return 0
+    # repos/<owner>/<repo>/<job_id>
+    for owner in os.listdir(root):
+        owner_dir = os.path.join(root, owner)
+        if not os.path.isdir(owner_dir) or any(
+            os.path.exists(os.path.join(owner_dir, marker)) for marker in (".git", "HEAD")
+        ):
+            # Bỏ qua bản clone kiểu cũ repos/<repo> (worktree hoặc bare)
+            continue
+        for repo_name in os.listdir(owner_dir):
+            repo_dir = os.path.join(owner_dir, repo_name)
+            if not os.path.isdir(repo_dir):
+                continue
+            for job_id in os.listdir(repo_dir):
+                job_dir = os.path.join(repo_dir, job_id)
+                if os.path.isdir(job_dir) and os.path.getmtime(job_dir) < cutoff:
+                    safe_rmtree(job_dir)
+                    removed += 1
+    if removed:
+        print(f"🧽 Pruned {removed} stale workspace(s)")
+    return removed
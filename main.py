@@ -1,10 +1,48 @@
+import argparse
+
 import uvicorn
 
+import config
 
-if __name__ == "__main__":
-    uvicorn.run(
-        "api:app",  # tên file : object FastAPI
-        host="0.0.0.0",
-        port=8000,
-        reload=True,  # bật reload để dev code auto refresh
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="IaC Drift Analyzer API server")
+    parser.add_argument(
+        "--prod",
+        action="store_true",
+        default=config.APP_ENV == "production",
+        help="Chế độ production: nhiều worker, tắt reload (hoặc APP_ENV=production)",
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.WEB_CONCURRENCY,
+        help="Số worker process ở chế độ production (mặc định WEB_CONCURRENCY / số core)",
     )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.prod:
+        # Mỗi worker là 1 process riêng: boto3 client được tạo lazy trong từng
+        # process (core/aws_clients.py) nên không bị chia sẻ qua fork.
+        uvicorn.run(
+            "api:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            reload=False,
+            timeout_keep_alive=config.UVICORN_KEEPALIVE_SECONDS,
+            access_log=False,
+        )
+    else:
+        uvicorn.run(
+            "api:app",  # tên file : object FastAPI
+            host=args.host,
+            port=args.port,
+            reload=True,  # bật reload để dev code auto refresh
+        )
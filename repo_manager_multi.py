@@ -5,6 +5,7 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from git import Repo
 
 import config
+from core.concurrency import is_throttle_error, limiter
 
 BASE_REPO_DIR = config.BASE_REPO_DIR
 
@@ -59,11 +60,25 @@ def clone_or_pull(repo_url):
         return {"repo": repo_name, "error": str(e), "status": "fail"}
 
 
-def process_repo_list(repo_list, max_workers=4):
-    """Clone/pull nhiều repo song song"""
+def limited_clone_or_pull(repo_url):
+    """clone_or_pull trong giới hạn concurrency thích ứng của stage clone."""
+    with limiter("clone").slot() as slot:
+        result = clone_or_pull(repo_url)
+        slot["error"] = result["status"] != "ok"
+        slot["throttled"] = is_throttle_error(result.get("error"))
+    return result
+
+
+def process_repo_list(repo_list, max_workers=None):
+    """
+    Clone/pull nhiều repo song song. Số clone chạy cùng lúc do limiter "clone"
+    tự chỉnh (core/concurrency.py); max_workers chỉ là trần số thread
+    (mặc định CLONE_CONCURRENCY_MAX).
+    """
     results = []
+    max_workers = max_workers or config.CLONE_CONCURRENCY_MAX
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = {executor.submit(clone_or_pull, url): url for url in repo_list}
+        futures = {executor.submit(limited_clone_or_pull, url): url for url in repo_list}
         for future in as_completed(futures):
             result = future.result()
             results.append(result)
@@ -83,3 +98,4 @@ if __name__ == "__main__":
     print("\n📦 Summary:")
     for r in results:
         print(r)
+    print("🚦 Clone concurrency:", limiter("clone").snapshot())
@@ -1,5 +1,7 @@
+import argparse
 import os
 import json
+import uuid
 
 import config
 from core.drift_analyzer import run_drift_analyzer
@@ -26,10 +28,19 @@ def load_repos_from_file():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--run-id",
+        help="Chạy tiếp 1 run bị gián đoạn (bỏ qua repo/stage đã có checkpoint)",
+    )
+    args = parser.parse_args()
+
     repos = load_repos_from_file()
+    run_id = args.run_id or str(uuid.uuid4())
 
-    print(f"🚀 Starting IaC Drift Analyzer for {len(repos)} repo(s)...")
-    results = run_drift_analyzer(repos)
+    print(f"🚀 Starting IaC Drift Analyzer for {len(repos)} repo(s), run {run_id}...")
+    print(f"   Bị gián đoạn? Chạy lại: python test.py --run-id {run_id}")
+    results = run_drift_analyzer(repos, run_id=run_id)
     print(f"✅ Processed {len(results)} IaC chunks")
 
     # Đảm bảo thư mục output tồn tại
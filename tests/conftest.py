@@ -0,0 +1,8 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    """state/, repos/, output/ là đường dẫn tương đối: mỗi test 1 thư mục riêng."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
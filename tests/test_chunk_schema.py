@@ -0,0 +1,70 @@
+import pytest
+
+import config
+from core.drift_analyzer import normalize_chunk, repo_context
+
+REPO = "https://github.com/acme/infra"
+CHUNK = {
+    "file": "/work/run-1/infra/modules/vpc/main.tf",
+    "lines": "3-9",
+    "resource_address": "resource.aws_vpc.main",
+    "resource_type": "resource",
+    "module": "modules/vpc",
+    "region": "eu-west-1",
+    "content": 'resource "aws_vpc" "main" {}',
+}
+COMMON = {
+    "repo": REPO,
+    "commit": "abc1234",
+    "file": "repos/infra/modules/vpc/main.tf",
+    "lines": "3-9",
+    "resource_address": "resource.aws_vpc.main",
+    "resource_type": "resource",
+    "module": "modules/vpc",
+    "region": "eu-west-1",
+    "content": 'resource "aws_vpc" "main" {}',
+    "type": "iac_configuration",
+    "update_at": "2026-01-01T00:00:00Z",
+    "owner": "acme",
+}
+
+
+def normalize(schema, monkeypatch, chunk=CHUNK):
+    monkeypatch.setattr(config, "CHUNK_SCHEMA_VERSION", schema)
+    context = {
+        **repo_context(REPO, "abc1234", "2026-01-01T00:00:00Z"),
+        "repo_dir": "/work/run-1/infra",
+        "file_root": "repos/infra",
+    }
+    normalized = normalize_chunk(chunk, context)
+    assert normalized.pop("id")
+    return normalized
+
+
+def test_v2_layout_is_compact_with_schema_key(monkeypatch):
+    assert normalize(2, monkeypatch) == {**COMMON, "schema": 2}
+
+
+def test_v1_layout_repeats_metadata_without_schema_key(monkeypatch):
+    assert normalize(1, monkeypatch) == {
+        **COMMON,
+        "account": "acme",
+        "metadata": {
+            "repo": REPO,
+            "commit": "abc1234",
+            "owner": "acme",
+            "region": "eu-west-1",
+            "account": "acme",
+        },
+    }
+
+
+@pytest.mark.parametrize("schema", [1, 2])
+def test_budget_and_environment_fields_are_kept(schema, monkeypatch):
+    members = [{"resource_address": "resource.aws_vpc.main", "lines": "3-9"}]
+    chunk = {**CHUNK, "members": members, "part": 2, "environment": "prod"}
+
+    normalized = normalize(schema, monkeypatch, chunk)
+
+    assert normalized["members"] == members
+    assert normalized["part"] == 2 and normalized["environment"] == "prod"
@@ -0,0 +1,38 @@
+from core.chunk_store import load_repo_chunks, query_chunks, upsert_repo_chunks
+
+REPO = "https://github.com/acme/infra"
+
+
+def make_chunk(address, content, lines="16-18"):
+    return {
+        "repo": REPO,
+        "commit": "abc1234",
+        "file": "repos/infra/main.tf",
+        "resource_type": "locals",
+        "resource_address": address,
+        "lines": lines,
+        "content": content,
+    }
+
+
+def test_identical_keys_are_not_collapsed():
+    chunks = [make_chunk("locals", "a = 1"), make_chunk("locals", "b = 2")]
+
+    stats = upsert_repo_chunks(REPO, chunks, "run-1")
+
+    stored = load_repo_chunks(REPO, "abc1234")
+    assert stats["upserted"] == 2
+    assert [c["content"] for c in stored] == ["a = 1", "b = 2"]
+
+
+def test_rerun_keeps_seq_and_removes_stale():
+    upsert_repo_chunks(REPO, [make_chunk("locals", "a"), make_chunk("locals", "b")], "run-1")
+    first, _ = query_chunks({"repo": REPO})
+
+    stats = upsert_repo_chunks(REPO, [make_chunk("locals", "a2")], "run-2")
+
+    second, _ = query_chunks({"repo": REPO})
+    assert stats["deleted"] == 1
+    assert len(second) == 1
+    assert '"a2"' in second[0]
+    assert len(first) == 2
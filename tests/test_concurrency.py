@@ -0,0 +1,143 @@
+import pytest
+
+import config
+from core import concurrency
+from core.concurrency import AdaptiveLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(concurrency, "time", fake)
+    return fake
+
+
+def finish(lim, latency, key=None, saturated=False, **outcome):
+    """Giả lập 1 tác vụ xong với latency / kết quả cho trước."""
+    with lim._cond:
+        lim.inflight = int(lim.limit) if saturated else 1
+    lim._complete(latency, {"error": False, "throttled": False, **outcome}, key)
+    with lim._cond:
+        lim.inflight = 0
+
+
+def test_additive_increase_only_when_saturated(clock):
+    lim = AdaptiveLimiter("clone", 2, max_limit=3)
+
+    finish(lim, 1.0)
+    assert lim.limit == 2
+    finish(lim, 1.0, saturated=True)
+    assert lim.limit == 2.5
+    for _ in range(5):
+        finish(lim, 1.0, saturated=True)
+    assert lim.limit == 3  # trần max_limit
+
+
+def test_errors_and_throttles_back_off_once_per_cooldown(clock):
+    lim = AdaptiveLimiter("upload", 16, max_limit=16)
+
+    finish(lim, 1.0, error=True)
+    assert lim.limit == 8
+    finish(lim, 1.0, throttled=True)  # cùng đợt nghẽn
+    assert lim.limit == 8
+
+    clock.now += config.LIMITER_MIN_COOLDOWN_SECONDS
+    finish(lim, 1.0, throttled=True)
+    assert lim.limit == 4
+    assert lim.stats == {"completed": 3, "errors": 1, "throttled": 2, "decreases": 2}
+
+    for _ in range(5):
+        clock.now += config.LIMITER_MIN_COOLDOWN_SECONDS
+        finish(lim, 1.0, error=True)
+    assert lim.limit == 1  # không xuống dưới min_limit
+
+
+def test_slow_repo_is_compared_with_its_own_history(clock):
+    lim = AdaptiveLimiter("clone", 8, max_limit=8)
+    for i in range(20):
+        finish(lim, 1.0, key=f"small-{i}")
+
+    # Repo lớn: luôn clone lâu hơn nhiều so với median chung -> không phải nghẽn
+    for _ in range(5):
+        clock.now += config.LIMITER_MIN_COOLDOWN_SECONDS
+        finish(lim, 60.0, key="monorepo")
+    assert lim.limit == 8
+
+    # Cùng repo đó chậm gấp nhiều lần lịch sử của chính nó -> giảm
+    clock.now += 60
+    finish(lim, 600.0, key="monorepo")
+    assert lim.limit == 4
+
+
+def test_keyless_latency_uses_fleet_median(clock):
+    lim = AdaptiveLimiter("upload", 8, max_limit=8)
+    finish(lim, 100.0)  # chưa đủ mẫu: không đánh giá latency
+    assert lim.limit == 8
+    for _ in range(config.LIMITER_MIN_SAMPLES):
+        finish(lim, 1.0)
+
+    clock.now += config.LIMITER_MIN_COOLDOWN_SECONDS
+    finish(lim, 10.0)
+    assert lim.limit == 4
+
+
+def test_cpu_mode_steps_by_one(clock, monkeypatch):
+    samples = iter([(0, 100), (95, 200), (95, 200), (150, 300), (200, 400)])
+    monkeypatch.setattr(concurrency, "_read_cpu_times", lambda: next(samples))
+    lim = AdaptiveLimiter("parse", 4, max_limit=5, mode="cpu")
+
+    clock.now += config.LIMITER_CPU_INTERVAL_SECONDS
+    finish(lim, 1.0, saturated=True)  # busy 0.95
+    assert lim.limit == 3 and lim.cpu_busy == 0.95
+
+    finish(lim, 1.0, saturated=True)  # chưa hết interval: không đo lại
+    assert lim.limit == 3
+
+    clock.now += config.LIMITER_CPU_INTERVAL_SECONDS
+    finish(lim, 1.0, saturated=True)  # tổng jiffies không tăng: bỏ qua
+    assert lim.limit == 3
+
+    clock.now += config.LIMITER_CPU_INTERVAL_SECONDS
+    finish(lim, 1.0)  # busy 0.55 nhưng limit chưa dùng hết
+    assert lim.limit == 3
+
+    clock.now += config.LIMITER_CPU_INTERVAL_SECONDS
+    finish(lim, 1.0, saturated=True)  # busy 0.5
+    assert lim.limit == 4
+
+
+def test_slot_records_exceptions_and_snapshot(clock):
+    lim = AdaptiveLimiter("upload", 4, max_limit=8)
+
+    with lim.slot(key="repo") as outcome:
+        clock.now += 0.5
+    assert outcome == {"error": False, "throttled": False}
+    with pytest.raises(RuntimeError):
+        with lim.slot(key="repo"):
+            raise RuntimeError("SlowDown: reduce your request rate")
+
+    assert lim.snapshot() == {
+        "mode": "aimd",
+        "limit": 2,
+        "min": 1,
+        "max": 8,
+        "inflight": 0,
+        "waiting": 0,
+        "completed": 2,
+        "errors": 1,
+        "throttled": 1,
+        "decreases": 1,
+        "latency_ms": {"p50": 500.0, "p95": 500.0},
+    }
+    assert AdaptiveLimiter("clone", 2, adaptive=False).snapshot()["mode"] == "fixed"
@@ -0,0 +1,135 @@
+from contextlib import closing
+
+from core.dedup_index import _connect, content_hash, dedup_repo_chunks
+from core.drift_analyzer import run_drift_analyzer
+from core.terraform_parser import apply_token_budget
+
+REPO_A = "https://github.com/org-a/infra"
+REPO_B = "https://github.com/org-b/infra"
+SHARED = 'resource "aws_vpc" "this" {\n  cidr_block = var.cidr\n}'
+
+
+def module_chunk(content=SHARED, file="modules/vpc/main.tf", lines="1-3"):
+    return {
+        "file": file,
+        "module": "modules/vpc",
+        "resource_type": "resource",
+        "resource_address": "resource.aws_vpc.this",
+        "lines": lines,
+        "content": content,
+    }
+
+
+def owner_of(chunk):
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT owner_repo FROM contents WHERE content_hash = ?",
+            (content_hash(chunk),),
+        ).fetchone()
+    return row["owner_repo"] if row else None
+
+
+def test_duplicates_within_repo_are_dropped():
+    chunks, stats = dedup_repo_chunks(REPO_A, "a1", [module_chunk(), module_chunk()])
+
+    assert len(chunks) == 1
+    assert stats["duplicates_dropped"] == 1
+
+
+def test_shared_block_keeps_content_in_every_repo():
+    dedup_repo_chunks(REPO_A, "a1", [module_chunk()])
+
+    chunks, stats = dedup_repo_chunks(REPO_B, "b1", [module_chunk()])
+
+    assert stats["shared_refs"] == 1
+    assert chunks[0]["content"] == SHARED
+    assert chunks[0]["shared_from"] == REPO_A
+    assert chunks[0]["content_ref"] == content_hash(module_chunk())
+
+
+def test_owner_change_transfers_ownership_to_remaining_repo():
+    dedup_repo_chunks(REPO_A, "a1", [module_chunk()])
+    dedup_repo_chunks(REPO_B, "b1", [module_chunk()])
+
+    # A đổi module: nội dung cũ chỉ còn B tham chiếu
+    changed = module_chunk(content=SHARED.replace("var.cidr", '"10.0.0.0/16"'))
+    dedup_repo_chunks(REPO_A, "a2", [changed])
+
+    assert owner_of(module_chunk()) == REPO_B
+    assert owner_of(changed) == REPO_A
+    chunks, stats = dedup_repo_chunks(REPO_B, "b2", [module_chunk()])
+    assert stats["shared_refs"] == 0
+    assert "shared_from" not in chunks[0]
+    assert chunks[0]["content"] == SHARED
+
+
+def test_unreferenced_content_is_released():
+    dedup_repo_chunks(REPO_A, "a1", [module_chunk()])
+
+    dedup_repo_chunks(REPO_A, "a2", [])
+
+    assert owner_of(module_chunk()) is None
+
+
+def test_incremental_reset_only_releases_reset_files():
+    other = module_chunk(
+        content='resource "aws_subnet" "a" {}', file="modules/net/main.tf"
+    )
+    dedup_repo_chunks(REPO_A, "a1", [module_chunk(), other])
+    dedup_repo_chunks(REPO_B, "b1", [module_chunk()])
+
+    dedup_repo_chunks(REPO_A, "a2", [], reset_files={"modules/vpc/main.tf"})
+
+    assert owner_of(module_chunk()) == REPO_B
+    assert owner_of(other) == REPO_A
+
+
+MAIN_TF = """variable "a" {
+  default = "x"
+}
+
+variable "b" {
+  default = "y"
+}
+
+module "m" {
+  source = "./modules/m"
+}
+"""
+
+
+def test_repeated_blocks_are_not_merged_into_one_document():
+    chunks = [
+        {
+            "file": "main.tf",
+            "module": "none",
+            "resource_type": "variable",
+            "resource_address": name,
+            "lines": "1-3",
+            "content": f"variable {name}",
+        }
+        for name in ("a", "b", "a", "b")
+    ]
+
+    merged = apply_token_budget(chunks)
+
+    assert [c["content"] for c in merged] == ["variable a\n\nvariable b"] * 2
+
+
+def test_special_block_duplicates_are_dropped_by_dedup_stage(tmp_path):
+    repo = tmp_path / "infra"
+    repo.mkdir()
+    (repo / "main.tf").write_text(MAIN_TF)
+    summary = {}
+
+    chunks = run_drift_analyzer(
+        [str(repo)],
+        sink="memory",
+        parquet_path="",
+        on_event=lambda e: e["event"] == "summary" and summary.update(e),
+    )
+
+    documents = [(c["resource_address"], c["content"]) for c in chunks]
+    assert len(documents) == len(set(documents)) == 2
+    # Biến a+b (gộp) và module m do special handling sinh lại được tính vào dedup
+    assert summary["dedup"]["chunks_saved"] == 2
@@ -0,0 +1,84 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from core import terraform_parser
+from core.terraform_parser import chunk_source_envs, load_source, substitute_variables
+
+MAIN_TF = """
+resource "aws_s3_bucket" "data" {
+  bucket = "${var.env}-bucket"
+  tags   = var.tags
+}
+
+resource "aws_sqs_queue" "jobs" {
+  name = "jobs"
+}
+"""
+
+ENVIRONMENTS = {
+    "dev": {"env": "dev", "tags": {"tier": "dev"}},
+    "prod": {"env": "prod", "tags": {"tier": "prod"}},
+}
+
+
+@pytest.fixture(autouse=True)
+def no_merge(monkeypatch):
+    monkeypatch.setattr(terraform_parser, "TOKEN_BUDGET_ENABLED", False)
+
+
+def test_substitute_embedded_and_whole_references():
+    config = {
+        "bucket": "${var.env}-${var.region}-logs",
+        "tags": "${var.tags}",
+        "count": "${var.replicas}",
+        "unknown": "${var.missing}-x",
+        "static": {"name": "fixed"},
+    }
+    variables = {"env": "prod", "region": "eu-west-1", "tags": {"a": "b"}, "replicas": 3}
+
+    resolved = substitute_variables(config, variables)
+
+    assert resolved["bucket"] == "prod-eu-west-1-logs"
+    assert resolved["tags"] == {"a": "b"}
+    assert resolved["count"] == 3
+    assert resolved["unknown"] == "${var.missing}-x"
+    # Copy-on-write: nhánh không đổi là chính object cũ
+    assert resolved["static"] is config["static"]
+    assert substitute_variables(config["static"], variables) is config["static"]
+
+
+def test_two_tfvars_fan_out_to_distinct_content():
+    source = load_source("main.tf", MAIN_TF)
+
+    results = chunk_source_envs(source, ENVIRONMENTS)
+
+    by_env = {
+        env: {c["resource_address"]: c for c in chunks} for env, chunks in results.items()
+    }
+    dev = by_env["dev"]["resource.aws_s3_bucket.data"]
+    prod = by_env["prod"]["resource.aws_s3_bucket.data"]
+    assert '"dev-bucket"' in dev["content"] and "tier" in dev["content"]
+    assert '"prod-bucket"' in prod["content"]
+    assert dev["environment"] == "dev" and prod["environment"] == "prod"
+    assert dev["lines"] == prod["lines"]
+
+    # Block không dùng biến: cùng nội dung ở mọi môi trường
+    dev_queue = by_env["dev"]["resource.aws_sqs_queue.jobs"]
+    prod_queue = by_env["prod"]["resource.aws_sqs_queue.jobs"]
+    assert {k: v for k, v in dev_queue.items() if k != "environment"} == {
+        k: v for k, v in prod_queue.items() if k != "environment"
+    }
+
+
+@pytest.mark.parametrize("path", ["/etc/passwd", "../other/prod.tfvars", "envs/../../x"])
+def test_analyze_rejects_tfvars_outside_repo(path):
+    client = TestClient(api.app)
+
+    response = client.post(
+        "/analyze",
+        json={"repos": ["https://github.com/org/infra"], "environments": {"prod": path}},
+    )
+
+    assert response.status_code == 400
+    assert "environments" in response.json()["detail"]
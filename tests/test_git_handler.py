@@ -0,0 +1,58 @@
+import os
+
+import git
+import git.cmd
+
+from core.git_handler import clone_blobless, iter_terraform_blobs
+
+
+def make_remote(tmp_path):
+    src = tmp_path / "src"
+    files = {
+        "main.tf": 'resource "aws_s3_bucket" "a" {}\n',
+        "envs/prod.tfvars": 'region = "eu-west-1"\n',
+        "live/terragrunt.hcl": "inputs = {}\n",
+        "README.md": "# infra\n",
+        "lambda/handler.py": "def handler(event, context):\n    pass\n",
+    }
+    repo = git.Repo.init(src)
+    for path, text in files.items():
+        (src / path).parent.mkdir(parents=True, exist_ok=True)
+        (src / path).write_text(text)
+    repo.index.add(list(files))
+    repo.index.commit("init")
+    bare = tmp_path / "infra.git"
+    git.Repo.clone_from(str(src), bare, bare=True)
+    return f"file://{bare}", files
+
+
+def test_blobless_clone_streams_only_terraform_through_one_cat_file(tmp_path, monkeypatch):
+    url, files = make_remote(tmp_path)
+    commands = []
+    real_popen = git.cmd.safer_popen
+
+    def recording_popen(command, *args, **kwargs):
+        commands.append(command)
+        return real_popen(command, *args, **kwargs)
+
+    monkeypatch.setattr(git.cmd, "safer_popen", recording_popen)
+
+    local_path, commit_sha = clone_blobless(url, str(tmp_path / "clone"))
+    commands.clear()
+    blobs = dict(iter_terraform_blobs(local_path))
+
+    assert commit_sha and git.Repo(local_path).bare
+    # Không có working tree: không file nào của repo được ghi ra đĩa
+    written = {
+        os.path.relpath(os.path.join(d, f), local_path)
+        for d, _, names in os.walk(local_path)
+        for f in names
+    }
+    assert not written & set(files)
+
+    assert blobs == {
+        os.path.join(local_path, path): files[path]
+        for path in ("main.tf", "envs/prod.tfvars", "live/terragrunt.hcl")
+    }
+    cat_files = [c for c in commands if "cat-file" in c]
+    assert cat_files == [["git", "cat-file", "--batch"]]
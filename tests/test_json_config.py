@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from core import terraform_parser
+from core.terraform_parser import (
+    chunk_source,
+    detect_file_type,
+    load_source,
+    normalize_json_config,
+)
+
+CONFIG = {
+    "provider": {
+        "aws": [
+            {"region": "us-east-1"},
+            {"alias": "dr", "region": "us-west-2"},
+        ]
+    },
+    "resource": {
+        "aws_s3_bucket": {
+            "logs": {"bucket": "logs", "tags": {"team": "infra"}},
+            "tags": {"bucket": "tags"},
+        }
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def no_merge(monkeypatch):
+    """Tắt token budget để chunk nhỏ không bị gộp span."""
+    monkeypatch.setattr(terraform_parser, "TOKEN_BUDGET_ENABLED", False)
+
+
+def spans(text, name="main.tf.json"):
+    source = load_source(name, text)
+    return {
+        (c["resource_address"], c["content"].count("alias")): c["lines"]
+        for c in chunk_source(source)
+    }
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("main.tf.json", "terraform_json"),
+        ("prod.TFVARS.JSON", "tfvars_json"),
+        ("terragrunt.hcl", "terragrunt"),
+        ("notes.json", "unknown"),
+    ],
+)
+def test_detect_file_type_by_name(name, expected):
+    assert detect_file_type(name, "") == expected
+
+
+def test_provider_aliases_as_list_become_separate_blocks():
+    config = normalize_json_config(CONFIG)
+
+    assert config["provider"] == [
+        {"aws": {"region": "us-east-1"}},
+        {"aws": {"alias": "dr", "region": "us-west-2"}},
+    ]
+
+
+def test_spans_follow_json_structure():
+    text = json.dumps(CONFIG, indent=2) + "\n"
+    lines = text.splitlines()
+
+    result = spans(text)
+
+    # Resource tên "tags" đứng sau attribute "tags" của block trước: span riêng
+    logs = lines.index('      "logs": {') + 1
+    tags = lines.index('      "tags": {', logs) + 1
+    assert result[("resource.aws_s3_bucket.logs", 0)] == f"{logs}-{logs + 5}"
+    assert result[("resource.aws_s3_bucket.tags", 0)] == f"{tags}-{tags + 2}"
+    # Provider alias: mỗi phần tử của list có span riêng
+    assert result[("aws", 0)] == "4-6"
+    assert result[("aws", 1)] == "7-10"
+
+
+def test_minified_json_spans_single_line():
+    result = spans(json.dumps(CONFIG))
+
+    assert set(result.values()) == {"1-1"}
+    assert len(result) == 4
+
+
+def test_tfvars_json_has_no_block_chunks():
+    assert spans('{"region": "eu-west-1"}', "prod.tfvars.json") == {}
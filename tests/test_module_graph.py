@@ -0,0 +1,114 @@
+import os
+
+from core.drift_analyzer import run_drift_analyzer
+from core.module_graph import (
+    affected_dirs,
+    build_module_graph,
+    resolve_dir_context,
+    rewired_dirs,
+)
+
+ROOT_MAIN = """
+provider "aws" {
+  region = var.region
+}
+
+variable "region" {
+  default = "eu-west-1"
+}
+
+module "a" {
+  source = "./modules/a"
+}
+"""
+
+
+def source(path, config):
+    return {"file_path": os.path.join("/repo", path), "config": config}
+
+
+def graph_of(*sources):
+    return build_module_graph("/repo", list(sources))
+
+
+ROOT = source(
+    "main.tf",
+    {
+        "provider": [{"aws": {"region": "${var.region}"}}],
+        "variable": [{"region": {"default": "eu-west-1"}}],
+        "module": [{"a": {"source": "./modules/a"}}],
+    },
+)
+MODULE_A = source("modules/a/main.tf", {"module": [{"c": {"source": "../c"}}]})
+MODULE_C = source("modules/c/main.tf", {"resource": [{"aws_s3_bucket": {"b": {}}}]})
+
+
+def test_region_is_inherited_through_module_calls():
+    graph = graph_of(ROOT, MODULE_A, MODULE_C)
+
+    assert graph["dirs"]["."] == {"regions": ["eu-west-1"], "calls": {"a": "modules/a"}}
+    assert graph["dirs"]["modules/a"]["calls"] == {"c": "modules/c"}
+
+    context = resolve_dir_context(graph)
+    assert context["."] == {"region": "eu-west-1", "module": "none"}
+    assert context["modules/c"] == {"region": "eu-west-1", "module": "modules/c"}
+
+
+def test_own_provider_and_aliases():
+    provider = source(
+        "modules/c/provider.tf",
+        {"provider": [{"aws": [{"region": "us-east-1"}, {"alias": "dr", "region": "us-west-2"}]}]},
+    )
+    context = resolve_dir_context(graph_of(ROOT, MODULE_A, MODULE_C, provider))
+
+    assert context["modules/c"]["region"] == "us-east-1"
+    assert context["modules/a"]["region"] == "eu-west-1"
+
+
+def test_changed_module_reanalyzes_dependents_and_callees():
+    graph = graph_of(ROOT, MODULE_A, MODULE_C, source("other/main.tf", {}))
+
+    assert affected_dirs(graph, ["modules/a/main.tf"]) == {".", "modules/a", "modules/c"}
+    assert affected_dirs(graph, ["other/main.tf"]) == {"other"}
+
+
+def test_added_and_removed_module_calls_are_rewired():
+    module_b = source("modules/b/main.tf", {"resource": [{"aws_sqs_queue": {"q": {}}}]})
+    old = graph_of(ROOT, MODULE_A, MODULE_C, module_b)
+    with_b = dict(ROOT, config={**ROOT["config"], "module": [{"b": {"source": "./modules/b"}}]})
+    new = build_module_graph("/repo", [with_b], old, {".", "modules/a", "modules/c"})
+
+    # modules/b không nằm trong thư mục đã quét nhưng giờ kế thừa region từ root
+    assert rewired_dirs(old, new, {".", "modules/a", "modules/c"}) == {"modules/b"}
+    # Bỏ module call: modules/a mất region kế thừa
+    assert "modules/a" in rewired_dirs(old, new, {"."})
+
+
+def write(root, path, text):
+    full = root / path
+    full.parent.mkdir(parents=True, exist_ok=True)
+    full.write_text(text)
+
+
+def regions_by_dir(chunks):
+    return {c["file"].split("/repo/", 1)[1]: c["region"] for c in chunks}
+
+
+def test_incremental_run_inherits_region_for_newly_called_module(tmp_path):
+    repo = tmp_path / "repo"
+    write(repo, "main.tf", ROOT_MAIN)
+    write(repo, "modules/a/main.tf", 'resource "aws_s3_bucket" "a" {}\n')
+    write(repo, "modules/b/main.tf", 'resource "aws_sqs_queue" "b" {}\n')
+    url = str(repo)
+
+    first = run_drift_analyzer([url], sink="memory", parquet_path="")
+    assert regions_by_dir(first)["modules/b/main.tf"] == "unknown"
+
+    write(repo, "main.tf", ROOT_MAIN + 'module "b" {\n  source = "./modules/b"\n}\n')
+    second = run_drift_analyzer(
+        [url], sink="memory", parquet_path="", changed_files={url: ["main.tf"]}
+    )
+
+    regions = regions_by_dir(second)
+    assert regions["modules/b/main.tf"] == "eu-west-1"
+    assert regions["modules/a/main.tf"] == "eu-west-1"
@@ -0,0 +1,85 @@
+import os
+import threading
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from core.parquet_export import DICTIONARY_COLUMNS, ParquetExporter
+
+
+def chunk(repo, address, region="eu-west-1"):
+    return {
+        "repo": repo,
+        "commit": "abc1234",
+        "owner": "org",
+        "file": "main.tf",
+        "resource_type": "resource.aws_s3_bucket",
+        "resource_address": address,
+        "region": region,
+        "lines": "3-7",
+        "content": 'resource "aws_s3_bucket" "x" {}',
+        "id": address,
+        "schema": 2,
+    }
+
+
+def test_one_file_and_row_group_per_repo_with_dictionary_columns(tmp_path):
+    exporter = ParquetExporter(str(tmp_path / "chunks"))
+    exporter.write_repo("org/infra", [chunk("infra", f"a{i}") for i in range(3)])
+    exporter.write_repo("org/other", [chunk("other", "b", region="us-east-1")])
+    exporter.close()
+
+    infra = pq.ParquetFile(exporter.repo_path("org/infra"))
+    assert infra.metadata.num_row_groups == 1
+    assert infra.metadata.num_rows == 3
+    table = infra.read()
+    for name in DICTIONARY_COLUMNS:
+        assert pa.types.is_dictionary(table.schema.field(name).type)
+    assert table.column("line_start").to_pylist() == [3, 3, 3]
+    assert table.column("region").to_pylist() == ["eu-west-1"] * 3
+
+    fleet = pq.read_table(str(tmp_path / "chunks"))
+    assert fleet.num_rows == 4
+
+
+def test_rewriting_a_repo_keeps_other_repos(tmp_path):
+    exporter = ParquetExporter(str(tmp_path / "chunks"))
+    exporter.write_repo("org/infra", [chunk("infra", "a"), chunk("infra", "b")])
+    exporter.write_repo("org/other", [chunk("other", "c")])
+
+    # Run khác (vd. webhook của 1 repo) chỉ thay file của repo đó
+    ParquetExporter(str(tmp_path / "chunks")).write_repo("org/infra", [chunk("infra", "a")])
+
+    addresses = pq.read_table(str(tmp_path / "chunks")).column("resource_address").to_pylist()
+    assert sorted(addresses) == ["a", "c"]
+
+
+def test_concurrent_runs_do_not_share_temp_files(tmp_path):
+    path = str(tmp_path / "chunks")
+    errors = []
+
+    def run(n):
+        try:
+            exporter = ParquetExporter(path)
+            for _ in range(5):
+                exporter.write_repo("org/infra", [chunk("infra", f"r{n}-{i}") for i in range(50)])
+        except Exception as e:  # pragma: no cover - chỉ để báo lỗi
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert pq.read_table(os.path.join(path, "org", "infra.parquet")).num_rows == 50
+    assert not [f for f in os.listdir(os.path.join(path, "org")) if f.endswith(".tmp")]
+
+
+def test_repo_without_chunks_removes_its_file(tmp_path):
+    exporter = ParquetExporter(str(tmp_path / "chunks"))
+    exporter.write_repo("org/infra", [chunk("infra", "a")])
+    exporter.write_repo("org/infra", [])
+
+    assert not os.path.exists(exporter.repo_path("org/infra"))
@@ -0,0 +1,112 @@
+import sys
+import threading
+import types
+
+import pytest
+
+import config
+from core import parse_guard, terraform_parser
+from core.parse_guard import blob_hash, quarantine_reason
+
+SOURCE = 'resource "aws_s3_bucket" "logs" {\n  bucket = "logs"\n}\n'
+
+
+@pytest.fixture
+def isolation(monkeypatch):
+    """Worker pool mới cho mỗi test."""
+    monkeypatch.setattr(terraform_parser, "PARSE_ISOLATION", True)
+    monkeypatch.setattr(config, "PARSE_WORKERS", 1)
+    monkeypatch.setattr(parse_guard, "_pools", {})
+    monkeypatch.setattr(parse_guard, "_isolation", {"available": True})
+    yield
+    for pool in parse_guard._pools.values():
+        while not pool.empty():
+            worker = pool.get()
+            if worker is not None:
+                parse_guard._stop_worker(worker)
+
+
+def test_worker_crash_quarantines_file(isolation, monkeypatch, tmp_path):
+    start_worker = parse_guard._start_worker
+
+    def killed_worker():
+        # Worker bị OOM kill / segfault ngay khi nhận file
+        worker = start_worker()
+        worker["proc"].kill()
+        worker["proc"].wait()
+        return worker
+
+    monkeypatch.setattr(parse_guard, "_start_worker", killed_worker)
+    path = str(tmp_path / "main.tf")
+
+    source = terraform_parser.load_source(path, content=SOURCE)
+
+    assert source["config"] is None
+    assert source["quarantined"] == "crash"
+    assert quarantine_reason(blob_hash(SOURCE)) == "crash"
+
+    # Lần chạy sau bỏ qua parse, không spawn lại worker
+    monkeypatch.setattr(
+        parse_guard, "_start_worker", lambda: pytest.fail("worker respawned")
+    )
+    assert terraform_parser.load_source(path, content=SOURCE)["quarantined"] == "crash"
+
+
+def test_parse_error_is_not_quarantined(isolation, tmp_path):
+    source = terraform_parser.load_source(
+        str(tmp_path / "broken.tf"), content='resource "x" {\n'
+    )
+
+    assert source["quarantined"] is None
+
+
+def test_worker_ignores_unguarded_main_script(isolation, monkeypatch, tmp_path):
+    # Script không có `if __name__ == "__main__":` - nếu worker import lại nó
+    # thì marker được tạo và worker không bao giờ sẵn sàng
+    marker = tmp_path / "imported"
+    script = tmp_path / "script.py"
+    script.write_text(f"open({str(marker)!r}, 'w').close()\nimport time\ntime.sleep(60)\n")
+    main = types.ModuleType("__main__")
+    main.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, "__main__", main)
+    started = []
+    start_worker = parse_guard._start_worker
+    monkeypatch.setattr(
+        parse_guard, "_start_worker", lambda: started.append(1) or start_worker()
+    )
+
+    source = terraform_parser.load_source(str(tmp_path / "main.tf"), content=SOURCE)
+
+    assert source["config"]["resource"]
+    assert started and not marker.exists()
+
+
+def test_parse_timeout_kills_worker(isolation):
+    worker = parse_guard._start_worker()
+    parse_guard._pool().get()
+    parse_guard._pool().put(worker)
+
+    with pytest.raises(parse_guard.ParseTimeout):
+        # Không có handler nào chậm: timeout 0 luôn hết hạn trước khi có kết quả
+        parse_guard.run_guarded("hcl", "main.tf", SOURCE, timeout=0)
+
+    assert worker["proc"].poll() is not None
+
+
+def test_quarantine_lookups_reuse_thread_connection(monkeypatch):
+    opened = []
+    real_connect = parse_guard.connect
+    monkeypatch.setattr(
+        parse_guard, "connect", lambda name: opened.append(name) or real_connect(name)
+    )
+
+    parse_guard.add_quarantine("a" * 40, "big.tf", "size", 10)
+    assert quarantine_reason("a" * 40) == "size"
+    assert quarantine_reason("b" * 40) is None
+    assert len(opened) == 1
+
+    # Thread khác có connection riêng
+    thread = threading.Thread(target=quarantine_reason, args=("a" * 40,))
+    thread.start()
+    thread.join()
+    assert len(opened) == 2
@@ -0,0 +1,182 @@
+from contextlib import closing
+
+import git
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+import config
+from core import chunk_store, drift_analyzer
+from core.drift_analyzer import run_drift_analyzer
+from core.result_cache import get_cached_result, invalidate_repo, store_result
+from core.sinks import LocalSink
+
+
+class RecordingSink(LocalSink):
+    """Sink publish giả (như s3): ghi lại upload / sync."""
+
+    publishes = True
+
+    def __init__(self, output_dir):
+        super().__init__(output_dir)
+        self.uploads = []
+        self.syncs = []
+
+    def upload(self, repo_key, out_key=None):
+        self.uploads.append(repo_key)
+        return {"status": "success", "uploaded": [f"{repo_key}/part-0.jsonl"]}
+
+    def sync(self, repo_key):
+        self.syncs.append(repo_key)
+        return {"status": "STARTED", "ingestion_job_id": f"job-{len(self.syncs)}"}
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """Bare repo (file://) + working copy để push commit mới."""
+    work = git.Repo.init(tmp_path / "src")
+    tf = tmp_path / "src" / "main.tf"
+    tf.write_text('resource "aws_s3_bucket" "a" {}\n')
+    work.index.add(["main.tf"])
+    work.index.commit("init")
+    bare = tmp_path / "infra.git"
+    git.Repo.clone_from(str(tmp_path / "src"), bare, bare=True)
+    work.create_remote("bare", str(bare))
+
+    def push(text):
+        tf.write_text(text)
+        work.index.add(["main.tf"])
+        sha = work.index.commit("change").hexsha
+        work.git.push("bare", f"HEAD:{work.active_branch.name}")
+        return sha
+
+    return f"file://{bare}", push
+
+
+@pytest.fixture
+def clones(monkeypatch):
+    calls = []
+    real = drift_analyzer.clone_or_pull
+
+    def counting(repo_url, *args, **kwargs):
+        calls.append(repo_url)
+        return real(repo_url, *args, **kwargs)
+
+    monkeypatch.setattr(drift_analyzer, "clone_or_pull", counting)
+    return calls
+
+
+def analyze(url, sink, **kwargs):
+    summary = {}
+    run_drift_analyzer(
+        [url],
+        sink=sink,
+        parquet_path="",
+        on_event=lambda e: e["event"] == "summary" and summary.update(e),
+        **kwargs,
+    )
+    return summary
+
+
+def test_hit_skips_clone_upload_and_sync(remote, clones, tmp_path):
+    url, _ = remote
+    sink = RecordingSink(str(tmp_path / "out"))
+
+    analyze(url, sink, use_cache=True)
+    summary = analyze(url, sink, use_cache=True)
+
+    assert len(clones) == 1
+    assert len(sink.uploads) == len(sink.syncs) == 1
+    assert [c["repo"] for c in summary["cached"]] == [url]
+    assert summary["chunks"] == 1
+
+
+def test_new_commit_misses(remote, clones, tmp_path):
+    url, push = remote
+    sink = RecordingSink(str(tmp_path / "out"))
+
+    analyze(url, sink, use_cache=True)
+    head = push('resource "aws_s3_bucket" "b" {}\n')
+    summary = analyze(url, sink, use_cache=True)
+
+    assert len(clones) == 2
+    assert summary["cached"] == []
+    assert summary["commits"] == {url: head}
+
+
+def test_analyzer_version_bump_misses(remote, clones, tmp_path, monkeypatch):
+    url, _ = remote
+    sink = RecordingSink(str(tmp_path / "out"))
+
+    analyze(url, sink, use_cache=True)
+    monkeypatch.setattr(config, "ANALYZER_VERSION", "999")
+    analyze(url, sink, use_cache=True)
+
+    assert len(clones) == 2
+
+
+def test_use_cache_false_bypasses_cache(remote, clones, tmp_path):
+    url, _ = remote
+    sink = RecordingSink(str(tmp_path / "out"))
+
+    analyze(url, sink, use_cache=True)
+    analyze(url, sink, use_cache=False)
+
+    assert len(clones) == 2
+    assert len(sink.syncs) == 2
+
+
+def test_force_maps_to_use_cache_false(monkeypatch):
+    seen = []
+
+    def fake_run(repos, use_cache=None, **kwargs):
+        seen.append(use_cache)
+        return []
+
+    monkeypatch.setattr(api, "run_drift_analyzer", fake_run)
+    client = TestClient(api.app)
+    for force in (True, False):
+        client.post("/analyze", json={"repos": ["https://github.com/org/infra"], "force": force})
+
+    assert seen == [False, None]
+
+
+def test_chunk_store_count_mismatch_misses(remote, clones, tmp_path):
+    url, _ = remote
+    sink = RecordingSink(str(tmp_path / "out"))
+
+    analyze(url, sink, use_cache=True)
+    with closing(chunk_store._connect()) as conn, conn:
+        conn.execute("DELETE FROM chunks WHERE repo = ?", (url,))
+    analyze(url, sink, use_cache=True)
+
+    assert len(clones) == 2
+
+
+def test_known_commit_skips_ls_remote(remote, clones, tmp_path, monkeypatch):
+    url, _ = remote
+    sink = RecordingSink(str(tmp_path / "out"))
+    summary = analyze(url, sink, use_cache=True)
+    head = summary["commits"][url]
+
+    def no_ls_remote(*args, **kwargs):
+        raise AssertionError("ls-remote called although the commit is known")
+
+    monkeypatch.setattr(drift_analyzer, "resolve_remote_head", no_ls_remote)
+    summary = analyze(url, sink, use_cache=True, refs={url: {"commit": head}})
+
+    assert len(clones) == 1
+    assert summary["commits"] == {url: head}
+
+
+def test_store_get_and_invalidate():
+    store_result("repo-a", "sha1", {"commit": "sha1"[:7], "chunks": 3})
+    store_result("repo-b", "sha1", {"commit": "sha1"[:7], "chunks": 1})
+
+    assert get_cached_result("repo-a", "sha1")["chunks"] == 3
+    assert get_cached_result("repo-a", "sha1", analyzer_version="0") is None
+    assert get_cached_result("repo-a", "sha2") is None
+
+    invalidate_repo("repo-a")
+    assert get_cached_result("repo-a", "sha1") is None
+    assert get_cached_result("repo-b", "sha1") is not None
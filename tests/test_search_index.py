@@ -0,0 +1,122 @@
+import pytest
+
+import config
+from core import search_index
+from core.chunk_store import upsert_repo_chunks
+
+REPO = "https://github.com/acme/infra"
+OTHER = "https://github.com/acme/data"
+
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    for name in ("_docs", "_doc_len", "_postings", "_fields", "_repo_docs", "_repo_runs"):
+        monkeypatch.setattr(search_index, name, {})
+    monkeypatch.setattr(
+        search_index, "_state", {"next_id": 0, "total_len": 0, "refreshed_at": None}
+    )
+    monkeypatch.setattr(config, "SEARCH_REFRESH_SECONDS", 0)
+
+
+def chunk(repo, address, content, region="eu-west-1", module="none", **extra):
+    block_type, *labels = address.split(".")
+    return {
+        "repo": repo,
+        "commit": "abc1234",
+        "file": f"/repos/{repo.rsplit('/', 1)[1]}/main.tf",
+        "lines": "1-3",
+        "resource_address": address,
+        "resource_type": block_type,
+        "module": module,
+        "region": region,
+        "content": f'{block_type} "{labels[0]}" "{labels[-1]}" {{\n{content}\n}}',
+        **extra,
+    }
+
+
+def addresses(found):
+    return [r["resource_address"] for r in found["results"]]
+
+
+def test_field_filters_are_exact_and_combined():
+    upsert_repo_chunks(
+        REPO,
+        [
+            chunk(REPO, "resource.aws_s3_bucket.logs", '  bucket = "logs"'),
+            chunk(REPO, "resource.aws_s3_bucket.data", '  bucket = "data"', region="us-east-1"),
+            chunk(REPO, "resource.aws_sqs_queue.jobs", '  name = "jobs"', module="modules/q"),
+        ],
+        "run-1",
+    )
+    upsert_repo_chunks(
+        OTHER,
+        [chunk(OTHER, "resource.aws_s3_bucket.raw", '  bucket = "raw"', environment="prod")],
+        "run-1",
+    )
+
+    search = search_index.search
+    assert addresses(search(filters={"type": "aws_s3_bucket", "region": "eu-west-1"})) == [
+        "resource.aws_s3_bucket.raw",
+        "resource.aws_s3_bucket.logs",
+    ]
+    assert addresses(search(filters={"address": "aws_s3_bucket.data"})) == [
+        "resource.aws_s3_bucket.data"
+    ]
+    assert addresses(search(filters={"attr": "bucket=logs"})) == ["resource.aws_s3_bucket.logs"]
+    assert addresses(search(filters={"module": "modules/q"})) == ["resource.aws_sqs_queue.jobs"]
+    assert search(filters={"repo": OTHER.upper(), "env": "prod"})["total"] == 1
+    assert search(filters={"type": "aws_s3_bucket", "region": "ap-south-1"})["total"] == 0
+    with pytest.raises(ValueError):
+        search(filters={"owner": "x"})
+
+
+def test_bm25_ranks_denser_matches_first():
+    filler = "\n".join(f'  tag_{i} = "value {i}"' for i in range(30))
+    upsert_repo_chunks(
+        REPO,
+        [
+            chunk(REPO, "resource.aws_kms_key.main", '  description = "kms key for kms"'),
+            chunk(REPO, "resource.aws_s3_bucket.logs", f'  kms_key_id = "kms"\n{filler}'),
+            chunk(REPO, "resource.aws_sqs_queue.jobs", '  name = "jobs"'),
+        ],
+        "run-1",
+    )
+
+    found = search_index.search("kms")
+
+    assert addresses(found) == ["resource.aws_kms_key.main", "resource.aws_s3_bucket.logs"]
+    assert found["results"][0]["score"] > found["results"][1]["score"]
+    assert found["total"] == 2
+    assert addresses(search_index.search("kms", {"type": "aws_s3_bucket"})) == [
+        "resource.aws_s3_bucket.logs"
+    ]
+
+
+def test_refresh_picks_up_new_run():
+    upsert_repo_chunks(REPO, [chunk(REPO, "resource.aws_s3_bucket.logs", "")], "run-1")
+    assert addresses(search_index.search(filters={"repo": REPO})) == [
+        "resource.aws_s3_bucket.logs"
+    ]
+
+    upsert_repo_chunks(REPO, [chunk(REPO, "resource.aws_s3_bucket.archive", "")], "run-2")
+
+    assert addresses(search_index.search(filters={"repo": REPO})) == [
+        "resource.aws_s3_bucket.archive"
+    ]
+    assert search_index.stats()["documents"] == 1
+
+
+def test_total_counts_documents_matching_only_common_terms():
+    chunks = [
+        chunk(REPO, f"resource.aws_s3_bucket.b{i}", f'  bucket = "b{i}"') for i in range(100)
+    ]
+    chunks[0]["content"] += "\n# encrypted"
+    chunks[1]["content"] += "\n# encrypted"
+    upsert_repo_chunks(REPO, chunks, "run-1")
+
+    # "encrypted" hiếm được chấm điểm; "bucket" phổ biến bị bỏ qua khi đã đủ limit
+    found = search_index.search("encrypted bucket", limit=1)
+
+    assert found["total"] == 100
+    assert addresses(found)[0] in {"resource.aws_s3_bucket.b0", "resource.aws_s3_bucket.b1"}
+    assert search_index.search("encrypted bucket", {"region": "us-east-1"})["total"] == 0
@@ -0,0 +1,101 @@
+import re
+
+import git
+import pytest
+
+import config
+from core import bedrock_sync, s3_uploader
+from core.bedrock_sync import data_source_name, sync_data_source_by_repo
+from core.drift_analyzer import run_drift_analyzer
+
+# Ràng buộc tên Data Source của Bedrock
+DATA_SOURCE_NAME_RE = re.compile(r"^([0-9a-zA-Z][_-]?){1,100}$")
+
+
+@pytest.fixture
+def fake_s3(monkeypatch):
+    """Ghi lại các lệnh clear / upload / sync thay vì gọi AWS."""
+    calls = {"clear": [], "upload": [], "sync": []}
+
+    def upload(local_folder, bucket, prefix):
+        calls["upload"].append(prefix)
+        return {"status": "success", "uploaded": [f"{prefix}/part-0.jsonl"], "error": None}
+
+    def sync(s3_repo_path):
+        calls["sync"].append(s3_repo_path)
+        return {"status": "STARTED", "ingestion_job_id": "job"}
+
+    monkeypatch.setattr(
+        s3_uploader, "clear_repo_output_in_s3", lambda b, key: calls["clear"].append(key)
+    )
+    monkeypatch.setattr(s3_uploader, "upload_folder_to_s3", upload)
+    monkeypatch.setattr(bedrock_sync, "sync_data_source_by_repo", sync)
+    monkeypatch.setattr(config, "KNOWLEDGE_BASE_ID", "KB")
+    monkeypatch.setattr(config, "S3_ENDPOINT_URL", None)
+    return calls
+
+
+def test_same_repo_name_under_different_owners_does_not_collide(fake_s3, tmp_path):
+    urls = []
+    for owner in ("org-a", "org-b"):
+        src = git.Repo.init(tmp_path / owner / "src")
+        (tmp_path / owner / "src" / "main.tf").write_text(
+            f'resource "aws_s3_bucket" "{owner}" {{}}\n'
+        )
+        src.index.add(["main.tf"])
+        src.index.commit("init")
+        bare = tmp_path / owner / "infra.git"
+        git.Repo.clone_from(str(tmp_path / owner / "src"), bare, bare=True)
+        urls.append(f"file://{bare}")
+
+    run_drift_analyzer(urls, sink="s3", parquet_path="", use_cache=False)
+
+    keys = set(fake_s3["clear"])
+    assert len(keys) == 2
+    assert set(fake_s3["upload"]) == {f"iac_config/{key}" for key in keys}
+    assert set(fake_s3["sync"]) == {
+        f"s3://{config.OUTPUT_S3_BUCKET}/iac_config/{key}/" for key in keys
+    }
+
+
+def test_data_source_name_is_valid_and_unique_per_repo_key():
+    names = {
+        data_source_name(key)
+        for key in ("org-a/infra", "org-b/infra", "org/a-infra", "_/infra-1a2b3c4d")
+    }
+
+    assert len(names) == 4
+    assert all(DATA_SOURCE_NAME_RE.match(name) for name in names)
+    assert DATA_SOURCE_NAME_RE.match(data_source_name("x" * 300 + "/" + "y"))
+
+
+def test_sync_creates_data_source_per_repo_key(monkeypatch):
+    class FakeBedrock:
+        def __init__(self):
+            self.sources = []
+
+        def list_data_sources(self, knowledgeBaseId):
+            return {"dataSourceSummaries": list(self.sources)}
+
+        def create_data_source(self, name, dataSourceConfiguration, **kwargs):
+            prefix = dataSourceConfiguration["s3Configuration"]["inclusionPrefixes"][0]
+            source = {"name": name, "dataSourceId": f"ds{len(self.sources)}", "prefix": prefix}
+            self.sources.append(source)
+            return {"dataSource": source}
+
+        def start_ingestion_job(self, knowledgeBaseId, dataSourceId):
+            return {"ingestionJob": {"ingestionJobId": f"job-{dataSourceId}"}}
+
+    bedrock = FakeBedrock()
+    monkeypatch.setattr(bedrock_sync, "get_bedrock_agent_client", lambda: bedrock)
+
+    first = sync_data_source_by_repo("s3://bucket/iac_config/org-a/infra/")
+    second = sync_data_source_by_repo("s3://bucket/iac_config/org-b/infra/")
+    again = sync_data_source_by_repo("s3://bucket/iac_config/org-a/infra/")
+
+    assert first["data_source_id"] != second["data_source_id"]
+    assert again["data_source_id"] == first["data_source_id"]
+    assert [s["prefix"] for s in bedrock.sources] == [
+        "iac_config/org-a/infra/",
+        "iac_config/org-b/infra/",
+    ]
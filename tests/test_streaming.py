@@ -0,0 +1,96 @@
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+
+REPO = "https://github.com/org/infra"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api, "STREAM_HEARTBEAT_SECONDS", 0.05)
+    return TestClient(api.app)
+
+
+def stub_run(monkeypatch, fail=False):
+    """run_drift_analyzer giả: run -> stage -> (im lặng để có heartbeat) -> summary."""
+
+    def fake_run(repos, on_event=None, run_id=None, **kwargs):
+        on_event({"event": "run", "run_id": run_id, "repos": repos})
+        on_event({"event": "stage", "repo": repos[0], "stage": "clone", "status": "ok"})
+        time.sleep(0.3)
+        if fail:
+            raise RuntimeError("clone failed")
+        on_event({"event": "summary", "run_id": run_id, "chunks": 1, "cached": []})
+        return [{"repo": repos[0], "owner": "org", "resource_address": "aws_s3_bucket.a"}]
+
+    monkeypatch.setattr(api, "run_drift_analyzer", fake_run)
+
+
+def parse_ndjson(text):
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def parse_sse(text):
+    events = []
+    for frame in text.split("\n\n"):
+        if frame:
+            name, data = frame.split("\n")
+            assert name.startswith("event: ") and data.startswith("data: ")
+            event = json.loads(data[len("data: ") :])
+            assert event["event"] == name[len("event: ") :]
+            events.append(event)
+    return events
+
+
+def test_ndjson_stream_starts_with_run_and_ends_with_result(client, monkeypatch):
+    stub_run(monkeypatch)
+
+    response = client.post("/analyze?stream=ndjson", json={"repos": [REPO]})
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    run_id = response.headers["X-Run-Id"]
+    events = parse_ndjson(response.text)
+    assert events[0] == {"event": "run", "run_id": run_id, "repos": [REPO]}
+    assert events[1]["stage"] == "clone"
+    assert any(e["event"] == "heartbeat" for e in events[2:-2])
+    assert events[-2]["event"] == "summary"
+    assert events[-1]["event"] == "result"
+    assert events[-1]["owners_detected"] == ["org"]
+    assert events[-1]["run_id"] == run_id
+
+
+def test_sse_stream_reports_error_with_run_id(client, monkeypatch):
+    stub_run(monkeypatch, fail=True)
+
+    response = client.post(
+        "/analyze?stream=sse", json={"repos": [REPO], "run_id": "nightly-1"}
+    )
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [e["event"] for e in events[:2]] == ["run", "stage"]
+    assert {e["event"] for e in events[2:-1]} == {"heartbeat"}
+    assert events[-1] == {
+        "event": "error",
+        "detail": "Server error: clone failed",
+        "run_id": "nightly-1",
+    }
+
+
+def test_unknown_stream_format_is_rejected(client):
+    response = client.post("/analyze?stream=xml", json={"repos": [REPO]})
+
+    assert response.status_code == 400
+
+
+def test_format_stream_event_framing():
+    event = {"event": "stage", "repo": "r", "stage": "parse"}
+
+    assert api.format_stream_event(event, "ndjson") == json.dumps(event) + "\n"
+    assert api.format_stream_event(event, "sse") == (
+        f"event: stage\ndata: {json.dumps(event)}\n\n"
+    )
@@ -0,0 +1,118 @@
+from core import search_index
+from core.chunk_store import query_chunks, upsert_repo_chunks
+from core.terraform_parser import (
+    apply_token_budget,
+    chunk_source,
+    load_source,
+    parse_span,
+)
+
+SMALL_BLOCKS = """\
+resource "aws_s3_bucket" "logs" {
+  bucket = "logs"
+}
+
+resource "aws_s3_bucket" "data" {
+  bucket = "data"
+}
+
+resource "aws_iam_role" "app" {
+  name = "app"
+}
+"""
+
+
+def big_block(attrs=80, ingress=0):
+    body = "\n".join(f'  attr_{i:02d} = "{"x" * 60}"' for i in range(attrs))
+    for i in range(ingress):
+        body += f'\n  ingress {{\n    from_port = {i}\n    cidr_blocks = ["{"1" * 50}"]\n  }}'
+    return f'resource "aws_instance" "web" {{\n{body}\n}}\n'
+
+
+def chunks_for(tmp_path, text, name="main.tf"):
+    path = tmp_path / name
+    path.write_text(text)
+    return chunk_source(load_source(str(path)))
+
+
+def test_merge_groups_by_terraform_type_with_canonical_address(tmp_path):
+    chunks = chunks_for(tmp_path, SMALL_BLOCKS)
+
+    assert [c["resource_address"] for c in chunks] == [
+        "resource.aws_s3_bucket.logs",
+        "resource.aws_iam_role.app",
+    ]
+    merged = chunks[0]
+    assert [m["resource_address"] for m in merged["members"]] == [
+        "resource.aws_s3_bucket.logs",
+        "resource.aws_s3_bucket.data",
+    ]
+    assert [m["lines"] for m in merged["members"]] == ["1-3", "5-7"]
+    assert merged["lines"] == "1-7"
+    assert "members" not in chunks[1]
+
+
+def test_split_parts_get_their_own_line_spans(tmp_path):
+    text = big_block()
+    chunks = chunks_for(tmp_path, text)
+    lines = text.splitlines()
+
+    assert len(chunks) > 1
+    spans = [parse_span(c["lines"]) for c in chunks]
+    assert spans[0][0] == 1 and spans[-1][1] == len(lines)
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        assert start == end + 1
+    for chunk, (start, end) in zip(chunks, spans):
+        first_attr = chunk["content"].splitlines()[1].split("=")[0].strip()
+        assert first_attr in lines[start - 1] or first_attr in lines[start]
+        assert all(
+            line.split("=")[0].strip() in chunk["content"]
+            for line in lines[start:end - 1]
+        )
+
+
+def test_split_without_source_lines_keeps_block_span():
+    chunk = {
+        "file": "main.tf",
+        "module": "none",
+        "resource_type": "resource",
+        "resource_address": "resource.aws_instance.web",
+        "lines": "1-82",
+        "content": big_block(),
+    }
+
+    parts = apply_token_budget([chunk], target_tokens=200, limit_tokens=400)
+
+    assert len(parts) > 1
+    assert {p["lines"] for p in parts} == {"1-82"}
+
+
+def test_member_addresses_are_queryable(tmp_path):
+    repo = "https://github.com/acme/infra"
+    chunks = [
+        {**c, "repo": repo, "commit": "abc1234"}
+        for c in chunks_for(tmp_path, SMALL_BLOCKS)
+    ]
+    upsert_repo_chunks(repo, chunks, "run-1")
+
+    docs, _ = query_chunks({"resource_address": "resource.aws_s3_bucket.data"})
+    assert len(docs) == 1 and "aws_s3_bucket.logs" in docs[0]
+
+    search_index.index_repo(repo, chunks, "run-1")
+    hits = search_index.search(filters={"address": "aws_s3_bucket.data"})
+    assert hits["results"][0]["resource_address"] == "resource.aws_s3_bucket.logs"
+    assert [m["resource_address"] for m in hits["results"][0]["matches"]] == [
+        "resource.aws_s3_bucket.data"
+    ]
+
+
+def test_split_spans_follow_repeated_nested_blocks(tmp_path):
+    text = big_block(attrs=30, ingress=25)
+    chunks = chunks_for(tmp_path, text)
+    lines = text.splitlines()
+
+    assert len(chunks) > 2
+    for chunk in chunks:
+        start, end = parse_span(chunk["lines"])
+        in_source = sum("ingress {" in line for line in lines[start - 1 : end])
+        assert chunk["content"].count("ingress {") == in_source
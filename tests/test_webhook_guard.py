@@ -0,0 +1,169 @@
+import threading
+import time
+
+import git
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from core import webhook_guard
+from core.git_handler import clone_blobless, clone_or_pull, local_head
+from core.webhook_guard import is_commit_analyzed, schedule_analysis
+
+REPO = "https://github.com/acme/infra.git"
+SHA_A = "a" * 40
+SHA_B = "b" * 40
+
+
+def wait_idle(timeout=5):
+    deadline = time.time() + timeout
+    while webhook_guard._pending and time.time() < deadline:
+        time.sleep(0.01)
+    assert not webhook_guard._pending
+
+
+class FakeRun:
+    """Ghi lại các lần gọi; trả về commit được yêu cầu (hoặc `analyzed`)."""
+
+    def __init__(self, analyzed=None):
+        self.calls = []
+        self.analyzed = analyzed
+        self.lock = threading.Lock()
+
+    def __call__(self, repo_url, commit_sha, changed_files, branch):
+        with self.lock:
+            self.calls.append((repo_url, commit_sha, changed_files, branch))
+        return self.analyzed or commit_sha
+
+
+def test_debounce_runs_latest_commit_and_marks_only_it():
+    run = FakeRun()
+    assert schedule_analysis(REPO, SHA_A, run, window=0.1, changed_files=["a.tf"]) == "scheduled"
+    assert schedule_analysis(REPO, SHA_B, run, window=0.1, changed_files=["b.tf"]) == "coalesced"
+    wait_idle()
+
+    assert run.calls == [(REPO, SHA_B, ["a.tf", "b.tf"], None)]
+    assert is_commit_analyzed(REPO, SHA_B)
+    assert not is_commit_analyzed(REPO, SHA_A)
+
+
+def test_mismatched_checkout_is_not_recorded_for_pushed_commit():
+    run = FakeRun(analyzed=SHA_B)
+    schedule_analysis(REPO, SHA_A, run, window=0.01)
+    wait_idle()
+
+    assert is_commit_analyzed(REPO, SHA_B)
+    assert not is_commit_analyzed(REPO, SHA_A)
+
+
+def test_failed_run_is_not_marked_done():
+    run = FakeRun()
+    run.analyzed = None
+
+    def failing(*args):
+        run(*args)
+        raise RuntimeError("clone failed")
+
+    schedule_analysis(REPO, SHA_A, failing, window=0.01)
+    wait_idle()
+
+    assert len(run.calls) == 1
+    assert not is_commit_analyzed(REPO, SHA_A)
+
+
+def test_branches_are_debounced_separately():
+    run = FakeRun()
+    schedule_analysis(REPO, SHA_A, run, window=0.05, branch="main")
+    schedule_analysis(REPO, SHA_B, run, window=0.05, branch="release")
+    wait_idle()
+
+    assert sorted(c[3] for c in run.calls) == ["main", "release"]
+    assert is_commit_analyzed(REPO, SHA_A) and is_commit_analyzed(REPO, SHA_B)
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """Repo git 'remote' có 2 commit trên main và 1 commit trên nhánh release."""
+    work = git.Repo.init(tmp_path / "src", initial_branch="main")
+    tf = tmp_path / "src" / "main.tf"
+    shas = {}
+    for i in (1, 2):
+        tf.write_text(f'resource "aws_s3_bucket" "b{i}" {{}}\n')
+        work.index.add(["main.tf"])
+        shas[f"main{i}"] = work.index.commit(f"commit {i}").hexsha
+    work.git.checkout("-b", "release", shas["main1"])
+    tf.write_text('resource "aws_s3_bucket" "rel" {}\n')
+    work.index.add(["main.tf"])
+    shas["release"] = work.index.commit("release").hexsha
+    work.git.checkout("main")
+    return f"file://{tmp_path / 'src'}", shas
+
+
+@pytest.mark.parametrize("clone", [clone_or_pull, clone_blobless])
+def test_clone_pins_pushed_commit_after_head_moved(remote, tmp_path, clone):
+    url, shas = remote
+    path, short = clone(url, str(tmp_path / "ws"), commit=shas["main1"])
+
+    assert local_head(path) == shas["main1"]
+    assert short == shas["main1"][:7]
+
+
+@pytest.mark.parametrize("clone", [clone_or_pull, clone_blobless])
+def test_clone_non_default_branch(remote, tmp_path, clone):
+    url, shas = remote
+    path, _ = clone(url, str(tmp_path / "ws"), branch="release", commit=shas["release"])
+
+    assert local_head(path) == shas["release"]
+
+
+def push_payload(sha, ref="refs/heads/main"):
+    return {
+        "ref": ref,
+        "after": sha,
+        "repository": {"clone_url": REPO, "default_branch": "main"},
+    }
+
+
+def test_redelivery_of_failed_commit_is_reanalyzed(monkeypatch):
+    monkeypatch.setattr(api, "WEBHOOK_DEBOUNCE_SECONDS", 0)
+    results = iter([None, SHA_A])
+    calls = []
+
+    def fake_analysis(repo_url, commit_sha, changed_files=None, branch=None):
+        calls.append((commit_sha, branch))
+        return next(results)
+
+    monkeypatch.setattr(api, "run_webhook_analysis", fake_analysis)
+    client = TestClient(api.app)
+    headers = {"X-GitHub-Event": "push", "X-GitHub-Delivery": "d-1"}
+
+    first = client.post("/webhook/github", json=push_payload(SHA_A), headers=headers)
+    retry = client.post("/webhook/github", json=push_payload(SHA_A), headers=headers)
+    again = client.post("/webhook/github", json=push_payload(SHA_A), headers=headers)
+
+    assert first.status_code == 500
+    assert retry.status_code == 200 and retry.json()["analyzed_commit"] == SHA_A
+    assert again.json()["status"] == "duplicate"
+    assert calls == [(SHA_A, "main"), (SHA_A, "main")]
+
+
+def test_run_reports_pinned_commit(remote, tmp_path, monkeypatch):
+    from core.drift_analyzer import run_drift_analyzer
+
+    url, shas = remote
+    bare = tmp_path / "remote.git"
+    git.Repo.clone_from(url, bare, bare=True)
+    bare_url = f"file://{bare}"
+    summary = {}
+
+    chunks = run_drift_analyzer(
+        [bare_url],
+        on_event=lambda e: e["event"] == "summary" and summary.update(e),
+        sink="memory",
+        parquet_path="",
+        refs={bare_url: {"commit": shas["main1"]}},
+    )
+
+    assert summary["commits"] == {bare_url: shas["main1"]}
+    assert any("b1" in c["resource_address"] for c in chunks)
+    assert not any("b2" in c["resource_address"] for c in chunks)
@@ -0,0 +1,219 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+import config
+import worker
+from core import work_queue
+from core.work_queue import HTTPQueue, LeaseLost, SQLiteQueue
+
+REPO = "https://github.com/org/infra"
+LEASE = 0.2
+
+
+def expire():
+    time.sleep(LEASE + 0.05)
+
+
+def test_expired_lease_is_reclaimed_and_old_worker_cannot_complete():
+    queue = SQLiteQueue()
+    job = queue.enqueue(REPO)
+
+    assert queue.claim("w1", LEASE)["id"] == job["id"]
+    assert queue.claim("w2", LEASE) is None  # lease còn hạn
+
+    expire()
+    reclaimed = queue.claim("w2", LEASE)
+
+    assert reclaimed["id"] == job["id"] and reclaimed["attempts"] == 2
+    assert not queue.heartbeat(job["id"], "w1", LEASE)
+    assert not queue.complete(job["id"], "w1", {"chunks": 1})
+    assert queue.complete(job["id"], "w2", {"chunks": 2})
+    assert queue.get(job["id"])["result"] == {"chunks": 2}
+
+
+def test_heartbeat_keeps_job_from_being_reclaimed():
+    queue = SQLiteQueue()
+    job = queue.enqueue(REPO)
+    queue.claim("w1", LEASE)
+
+    for _ in range(3):
+        time.sleep(LEASE / 2)
+        assert queue.heartbeat(job["id"], "w1", LEASE)
+        assert queue.claim("w2", LEASE) is None
+
+
+def test_job_fails_after_max_attempts_of_expired_leases(monkeypatch):
+    monkeypatch.setattr(config, "WORK_QUEUE_MAX_ATTEMPTS", 2)
+    queue = SQLiteQueue()
+    job = queue.enqueue(REPO)
+
+    queue.claim("w1", LEASE)
+    expire()
+    queue.claim("w2", LEASE)
+    expire()
+
+    assert queue.claim("w3", LEASE) is None
+    failed = queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert failed["error"] == "lease expired 2 time(s)"
+
+
+def test_fail_requeues_until_max_attempts(monkeypatch):
+    monkeypatch.setattr(config, "WORK_QUEUE_MAX_ATTEMPTS", 2)
+    queue = SQLiteQueue()
+    job = queue.enqueue(REPO)
+
+    queue.claim("w1", LEASE)
+    assert queue.fail(job["id"], "w1", "boom")
+    assert queue.get(job["id"])["status"] == "queued"
+
+    queue.claim("w1", LEASE)
+    assert queue.fail(job["id"], "w1", "boom")
+    assert queue.get(job["id"])["status"] == "failed"
+
+
+def test_one_leased_job_per_repo():
+    queue = SQLiteQueue()
+    first = queue.enqueue(REPO, {"force": True})
+    queue.enqueue(REPO, {"force": False})
+    other = queue.enqueue("https://github.com/org/other")
+
+    assert queue.claim("w1", LEASE)["id"] == first["id"]
+    assert queue.claim("w2", LEASE)["id"] == other["id"]
+    assert queue.claim("w3", LEASE) is None
+
+
+def test_http_queue_maps_409_to_lost_lease(monkeypatch):
+    import requests
+
+    def fake_request(method, url, **kwargs):
+        status = 409 if url.endswith(("/heartbeat", "/complete", "/claim")) else 500
+
+        def raise_for_status():
+            raise requests.HTTPError(f"{status} error")
+
+        return SimpleNamespace(status_code=status, raise_for_status=raise_for_status)
+
+    monkeypatch.setattr(requests, "request", fake_request)
+    queue = HTTPQueue("http://api")
+
+    assert queue.claim("w1") is None
+    assert queue.heartbeat("job", "w1") is False
+    assert queue.complete("job", "w1") is False
+    with pytest.raises(requests.HTTPError):
+        queue.fail("job", "w1", "boom")
+
+
+def claimed_job(queue, worker_id="w1"):
+    queue.enqueue(REPO)
+    return queue.claim(worker_id, LEASE)
+
+
+def test_worker_stops_before_upload_when_lease_was_reclaimed(monkeypatch):
+    queue = SQLiteQueue()
+    job = claimed_job(queue)
+    stages = []
+
+    def fake_run(repos, before_stage, **kwargs):
+        # Lease hết hạn giữa chừng (vd. worker bị treo) và worker khác nhận lại job
+        with queue._transaction() as conn:
+            conn.execute("UPDATE jobs SET worker = 'w2', attempts = 2")
+        before_stage(REPO, "upload")
+        stages.append("upload")
+        return []
+
+    monkeypatch.setattr(worker, "run_drift_analyzer", fake_run)
+    worker.run_job(queue, job, "w1", LEASE)
+
+    assert stages == []
+    reclaimed = queue.get(job["id"])
+    assert reclaimed["status"] == "leased" and reclaimed["worker"] == "w2"
+
+
+def test_lease_check_renews_and_tolerates_transient_errors():
+    class FlakyQueue:
+        def __init__(self):
+            self.calls = 0
+
+        def heartbeat(self, job_id, worker_id, lease):
+            self.calls += 1
+            raise ConnectionError("api unreachable")
+
+    lease = worker.Lease(FlakyQueue(), {"id": "j", "repo": REPO}, "w1", LEASE)
+    lease.check(REPO, "write")  # lease còn hạn
+
+    expire()
+    with pytest.raises(LeaseLost):
+        lease.check(REPO, "sync")
+    assert lease.lost.is_set()
+
+
+def test_worker_thread_survives_queue_errors(monkeypatch):
+    class BrokenQueue(SQLiteQueue):
+        def complete(self, *args):
+            raise work_queue.json.JSONDecodeError("bad gateway", "", 0)
+
+        def fail(self, *args):
+            raise ConnectionError("api unreachable")
+
+    queue = BrokenQueue()
+    queue.enqueue(REPO)
+    queue.enqueue("https://github.com/org/other")
+    runs = []
+
+    def fake_run(repos, **kwargs):
+        runs.append(repos[0])
+        if len(runs) == 2:
+            raise RuntimeError("clone failed")
+        return []
+
+    monkeypatch.setattr(worker, "run_drift_analyzer", fake_run)
+    args = SimpleNamespace(lease=LEASE, drain=True, poll=0.01)
+    worker.worker_loop(queue, "w1", args, worker.threading.Event())
+
+    assert runs == [REPO, "https://github.com/org/other"]
+
+
+def test_http_enqueue_persists_fetch_mode_and_changed_files(monkeypatch):
+    import requests
+
+    client = TestClient(api.app)
+    monkeypatch.setattr(api, "work_queue", SQLiteQueue())
+    monkeypatch.setattr(
+        requests,
+        "request",
+        lambda method, url, json=None, **kwargs: client.request(
+            method, url.replace("http://api", ""), json=json
+        ),
+    )
+    options = {"fetch_mode": "blobs", "changed_files": ["modules/vpc/main.tf"]}
+
+    HTTPQueue("http://api").enqueue(REPO, options)
+    job = api.work_queue.claim("w1", LEASE)
+    seen = {}
+
+    def fake_run(repos, fetch_mode=None, changed_files=None, **kwargs):
+        seen.update(fetch_mode=fetch_mode, changed_files=changed_files)
+        return []
+
+    monkeypatch.setattr(worker, "run_drift_analyzer", fake_run)
+    worker.run_job(api.work_queue, job, "w1", LEASE)
+
+    assert job["options"]["fetch_mode"] == "blobs"
+    assert seen == {"fetch_mode": "blobs", "changed_files": {REPO: ["modules/vpc/main.tf"]}}
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"repos": [REPO], "fetch_mode": "svn"},
+        {"repos": [REPO, "https://github.com/org/other"], "changed_files": ["main.tf"]},
+        {"repos": [REPO], "changed_files": ["../secrets.tf"]},
+    ],
+)
+def test_jobs_rejects_invalid_fetch_options(body):
+    assert TestClient(api.app).post("/jobs", json=body).status_code == 400
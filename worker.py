@@ -0,0 +1,204 @@
+"""
+Worker của work queue: claim job, giữ lease bằng heartbeat, chạy pipeline cho
+repo của job rồi báo complete / fail. Chạy thêm worker (cùng máy hoặc node
+khác) để scale ngang.
+
+    python worker.py                                  # SQLite queue cục bộ
+    python worker.py --queue http://drift-api:8000    # qua API server
+    python worker.py --threads 4 --drain              # thoát khi queue rỗng
+
+SIGTERM / Ctrl+C: ngừng nhận job mới, chạy nốt job đang dở rồi thoát.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import threading
+import time
+
+import config
+from core.drift_analyzer import run_drift_analyzer
+from core.work_queue import LeaseLost, make_queue
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="IaC Drift Analyzer queue worker")
+    parser.add_argument(
+        "--queue",
+        default=config.WORK_QUEUE_URL,
+        help="Rỗng = SQLite cục bộ, http(s)://... = API server (mặc định WORK_QUEUE_URL)",
+    )
+    parser.add_argument(
+        "--threads", type=int, default=1, help="Số job chạy song song trong process"
+    )
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+    parser.add_argument("--lease", type=int, default=config.WORK_QUEUE_LEASE_SECONDS)
+    parser.add_argument("--poll", type=float, default=config.WORK_QUEUE_POLL_SECONDS)
+    parser.add_argument("--drain", action="store_true", help="Thoát khi hết job")
+    return parser.parse_args()
+
+
+class Lease:
+    """
+    Lease của 1 job đang chạy: heartbeat nền mỗi lease/3 giây (keep) và gia
+    hạn đồng bộ trước mỗi stage ghi ra ngoài (check) để worker đã mất lease
+    không ghi đè kết quả của worker vừa claim lại job.
+    """
+
+    def __init__(self, queue, job, worker_id, lease):
+        self.queue = queue
+        self.job = job
+        self.worker_id = worker_id
+        self.lease = lease
+        self.renewed_at = time.monotonic()  # claim vừa cấp lease
+        self.lost = threading.Event()
+        self.done = threading.Event()
+
+    def renew(self):
+        """Gia hạn lease. False nếu đã mất (job bị claim lại / hết hạn)."""
+        if self.lost.is_set():
+            return False
+        try:
+            ok = self.queue.heartbeat(self.job["id"], self.worker_id, self.lease)
+        except Exception as e:
+            # Lỗi mạng tạm thời: lease còn hạn thì coi như vẫn giữ, thử lại sau
+            print(f"⚠️ Heartbeat lỗi cho job {self.job['id']}: {e}")
+            if time.monotonic() - self.renewed_at < self.lease:
+                return True
+            ok = False
+        if ok:
+            self.renewed_at = time.monotonic()
+            return True
+        print(f"⚠️ Mất lease của job {self.job['id']} ({self.job['repo']})")
+        self.lost.set()
+        return False
+
+    def keep(self):
+        """Heartbeat tới khi job xong; trả về khi mất lease."""
+        while not self.done.wait(self.lease / 3):
+            if not self.renew():
+                return
+
+    def check(self, repo_url, stage):
+        """Hook before_stage của run_drift_analyzer."""
+        if not self.renew():
+            raise LeaseLost(
+                f"job {self.job['id']} lost its lease before stage '{stage}' of {repo_url}"
+            )
+
+
+def report(action, job, *args):
+    """queue.complete / queue.fail; lỗi (vd. HTTP 5xx) không làm chết worker thread."""
+    try:
+        return action(job["id"], *args)
+    except Exception as e:
+        # Lease hết hạn -> job được claim lại và resume từ checkpoint
+        print(f"⚠️ Không báo được kết quả job {job['id']}: {e}")
+        return None
+
+
+def run_job(queue, job, worker_id, lease):
+    options = job["options"]
+    repo_url = job["repo"]
+    print(f"🛠️ [{worker_id}] job {job['id']} (lần {job['attempts']}): {repo_url}")
+
+    job_lease = Lease(queue, job, worker_id, lease)
+    threading.Thread(target=job_lease.keep, daemon=True).start()
+    summary = {}
+    try:
+        changed = options.get("changed_files")
+        run_drift_analyzer(
+            [repo_url],
+            fetch_mode=options.get("fetch_mode"),
+            on_event=lambda e: e["event"] == "summary" and summary.update(e),
+            changed_files={repo_url: changed} if changed is not None else None,
+            use_cache=False if options.get("force") else None,
+            sink=options.get("sink"),
+            environments=options.get("environments"),
+            # Job được claim lại (worker trước chết giữa chừng) chạy tiếp từ
+            # checkpoint của lần trước thay vì làm lại từ đầu
+            run_id=job["id"],
+            before_stage=job_lease.check,
+            collect=False,
+        )
+    except LeaseLost as e:
+        print(f"⚠️ Dừng job {job['id']}: {e}")
+        return
+    except Exception as e:
+        print(f"❌ Job {job['id']} lỗi: {e}")
+        report(queue.fail, job, worker_id, e)
+        return
+    finally:
+        job_lease.done.set()
+
+    result = {
+        "chunks": summary.get("chunks", 0),
+        "cached": bool(summary.get("cached")),
+        "resumed": bool(summary.get("resumed")),
+        "quarantined": len(summary.get("quarantined") or []),
+        "elapsed_ms": summary.get("elapsed_ms"),
+    }
+    completed = report(queue.complete, job, worker_id, result)
+    if completed:
+        print(f"✅ Job {job['id']} xong: {result['chunks']} chunks")
+    elif completed is not None:
+        print(f"⚠️ Job {job['id']} xong nhưng lease đã bị worker khác nhận lại")
+
+
+def worker_loop(queue, worker_id, args, stopping):
+    while not stopping.is_set():
+        try:
+            job = queue.claim(worker_id, args.lease)
+        except Exception as e:
+            print(f"⚠️ Không claim được job: {e}")
+            job = None
+        if job is None:
+            if args.drain:
+                return
+            stopping.wait(args.poll)
+            continue
+        try:
+            run_job(queue, job, worker_id, args.lease)
+        except Exception as e:
+            # Không để 1 job làm chết thread: lease hết hạn, job được giao lại
+            print(f"⚠️ [{worker_id}] job {job['id']} dừng bất thường: {e}")
+
+
+def main():
+    args = parse_args()
+    queue = make_queue(args.queue)
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        if not stopping.is_set():
+            print("🛑 Đang dừng: chạy nốt job hiện tại, không nhận job mới...")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    removed = queue.prune()
+    if removed:
+        print(f"🧽 Đã xoá {removed} job cũ khỏi queue")
+    print(
+        f"👷 Worker {args.worker_id}: {args.threads} thread(s), queue '{queue.name}'"
+        f"{' ' + args.queue if args.queue else ''}"
+    )
+    threads = [
+        threading.Thread(
+            target=worker_loop,
+            args=(queue, f"{args.worker_id}/{i}", args, stopping),
+            daemon=True,
+        )
+        for i in range(args.threads)
+    ]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        time.sleep(0.5)
+    print("👋 Worker stopped")
+
+
+if __name__ == "__main__":
+    main()